@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+from typing import Dict, List, Optional, Set
+from .logger import logger
+from .config import global_config
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+MOVE = "move"
+
+# 投递失败时保留的待通知目录上限，超过后丢弃多出的部分（下游可退回全库扫描）
+_MAX_PENDING_DIRS = 10000
+
+
+class ChangeFeed:
+    """目标目录变更记录：每次新建/更新/删除/移动目标路径都追加一行 JSON 到变更日志（按大小轮转），
+    可选地按刷新窗口把受影响的上级目录批量 POST 给 webhook，供媒体服务器只刷新这些目录而不是整库扫描。
+
+    record 只把变更放进内存缓冲，由后台线程每 flush_interval 秒统一写文件、发 webhook，
+    同一窗口内同一目录只通知一次。
+    """
+
+    def __init__(self, path: str = "", max_bytes: int = 50 * 1024 * 1024, backups: int = 5,
+                 flush_interval: float = 5.0, webhook_url: str = "", webhook_timeout: float = 10.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = max(0.1, flush_interval)
+        self.webhook_url = webhook_url
+        self.webhook_timeout = webhook_timeout
+        self._buffer: List[Dict] = []
+        self._dirs: Set[str] = set()
+        self._changes = 0
+        self._lock = threading.Lock()
+        # 写文件与发 webhook 串行执行，stop 时的最后一次 flush 不会与后台线程交错
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="ystrm-feed", daemon=True)
+        self._worker.start()
+
+    def record(self, action: str, path: str, is_dir: bool = False, old_path: Optional[str] = None,
+               ts: Optional[float] = None):
+        entry = {"ts": round(ts or time.time(), 3), "action": action, "path": path, "is_dir": is_dir}
+        if old_path is not None:
+            entry["old_path"] = old_path
+        with self._lock:
+            if self.path:
+                self._buffer.append(entry)
+            if self.webhook_url:
+                self._changes += 1
+                # 通知所在目录（目录本身的新建/删除也是其上级目录的变化）
+                self._dirs.add(os.path.dirname(path.rstrip('/')))
+                if old_path is not None:
+                    self._dirs.add(os.path.dirname(old_path.rstrip('/')))
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+                dirs, self._dirs = self._dirs, set()
+                changes, self._changes = self._changes, 0
+            if entries:
+                self._append(entries)
+            if dirs:
+                self._notify(dirs, changes)
+
+    def stop(self):
+        self._stopped.set()
+        self._worker.join(timeout=self.webhook_timeout + 5)
+        self.flush()
+
+    # ---------- 变更日志 ----------
+    def _rotate(self):
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _append(self, entries: List[Dict]):
+        data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode("utf-8")
+        try:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                size = 0
+            if size and self.max_bytes and size + len(data) > self.max_bytes:
+                self._rotate()
+            else:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # 整批一次 write，O_APPEND 保证外部读取方看到的总是完整的行
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.error(f"写入变更日志失败，丢弃 {len(entries)} 条记录：{self.path} - {str(e)}")
+
+    # ---------- webhook ----------
+    def _notify(self, dirs: Set[str], changes: int):
+        payload = {"directories": sorted(dirs), "changes": changes, "ts": round(time.time(), 3)}
+        request = urllib.request.Request(self.webhook_url, data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.webhook_timeout) as response:
+                response.read()
+            logger.debug(f"变更通知已发送：{len(dirs)} 个目录")
+        except Exception as e:
+            logger.warning(f"变更通知发送失败，下个窗口重试：{self.webhook_url} - {str(e)}")
+            with self._lock:
+                self._dirs |= dirs
+                if len(self._dirs) > _MAX_PENDING_DIRS:
+                    self._dirs = set(sorted(self._dirs)[-_MAX_PENDING_DIRS:])
+
+
+class ChangeCollector:
+    """多进程全量任务子进程中代替 ChangeFeed：只在内存中记下变更，随分片结果交回主进程写入真正的变更记录。"""
+
+    def __init__(self):
+        self._records: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def record(self, action: str, path: str, is_dir: bool = False, old_path: Optional[str] = None,
+               ts: Optional[float] = None):
+        with self._lock:
+            self._records.append((action, path, is_dir, old_path, ts or time.time()))
+
+    def take(self) -> List[tuple]:
+        with self._lock:
+            records, self._records = self._records, []
+        return records
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_change_feed() -> Optional[ChangeFeed]:
+    """进程内共享的变更记录；变更日志和 webhook 都未配置时返回 None。"""
+    global _feed
+    if not global_config.change_feed_path and not global_config.change_webhook_url:
+        return None
+    with _feed_lock:
+        if _feed is None:
+            _feed = ChangeFeed(global_config.change_feed_path, int(global_config.change_feed_max_mb * 1024 * 1024),
+                               global_config.change_feed_backups, global_config.change_feed_flush_seconds,
+                               global_config.change_webhook_url, global_config.change_webhook_timeout)
+        return _feed
+
+
+def collect_changes():
+    """本进程之后的变更只收集不写出（多进程全量任务的子进程启动时调用），未配置变更记录时不做任何事。"""
+    global _feed
+    if not global_config.change_feed_path and not global_config.change_webhook_url:
+        return
+    with _feed_lock:
+        _feed = ChangeCollector()
+
+
+def close_change_feed():
+    """写出缓冲中的变更并停止后台线程（服务关闭时调用）。"""
+    global _feed
+    with _feed_lock:
+        feed, _feed = _feed, None
+    if feed is not None:
+        feed.stop()
@@ -0,0 +1,141 @@
+import errno
+import threading
+import time
+from typing import Dict, Optional
+from .logger import logger
+from .config import global_config
+from .mounts import mount_point
+from .fs_probe import get_probe
+from . import metrics
+
+# 表示整个挂载不可用（而不是单个文件有问题）的错误码
+MOUNT_ERRNOS = {errno.ENOTCONN, errno.ESTALE, errno.EHOSTDOWN, errno.ETIMEDOUT, errno.ECONNABORTED,
+                errno.ECONNRESET}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def is_mount_error(e: OSError) -> bool:
+    return e.errno in MOUNT_ERRNOS
+
+
+class CircuitBreaker:
+    """单个挂载点的熔断器。
+
+    连续 threshold 次挂载级错误后断开（open），所有访问该挂载的线程在 wait_until_available 中等待；
+    退避时间到后由一个线程用廉价的 stat 探测挂载，成功则半开（half_open）放行，下一次成功访问即恢复（closed），
+    探测或半开期间再失败则退避时间翻倍（上限 max_backoff）。其他挂载的熔断器互不影响。
+    """
+
+    def __init__(self, name: str, probe_path: str, threshold: int = 3, base_backoff: float = 5.0,
+                 max_backoff: float = 300.0):
+        self.name = name
+        self.probe_path = probe_path
+        self.threshold = max(1, threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max(base_backoff, max_backoff)
+        self.state = CLOSED
+        self._failures = 0
+        self._backoff = base_backoff
+        self._retry_at = 0.0
+        self._probing = False
+        self._cond = threading.Condition()
+
+    def record_success(self):
+        if self.state == CLOSED and not self._failures:
+            return
+        with self._cond:
+            if self.state != CLOSED:
+                logger.info(f"挂载已恢复，熔断器闭合：{self.name}")
+            self.state = CLOSED
+            self._failures = 0
+            self._backoff = self.base_backoff
+            self._cond.notify_all()
+
+    def record_failure(self, error: Optional[OSError] = None):
+        with self._cond:
+            self._failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.threshold):
+                self._open(error)
+
+    def _open(self, error: Optional[OSError]):
+        if self.state == HALF_OPEN:
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+        self.state = OPEN
+        self._retry_at = time.monotonic() + self._backoff
+        logger.warning(f"挂载连续出错，熔断器断开：{self.name}，{self._backoff:g} 秒后探测"
+                       + (f" - {str(error)}" if error else ""))
+
+    def _probe(self) -> bool:
+        try:
+            # 带超时的探测：卡死的挂载上 stat 不会返回，不能让探测线程连同所有等待的线程一起卡住
+            get_probe().stat(self.probe_path)
+            return True
+        except OSError as e:
+            logger.debug(f"挂载探测失败：{self.probe_path} - {str(e)}")
+            return False
+
+    def wait_until_available(self, stop: Optional[threading.Event] = None) -> bool:
+        """熔断器断开时阻塞直到挂载恢复（或 stop 被设置，返回 False）；闭合/半开时立即返回 True。"""
+        with self._cond:
+            while self.state == OPEN:
+                if stop is not None and stop.is_set():
+                    return False
+                wait = self._retry_at - time.monotonic()
+                if wait > 0 or self._probing:
+                    self._cond.wait(min(wait, 1.0) if wait > 0 else 1.0)
+                    continue
+                self._probing = True
+                self._cond.release()
+                try:
+                    ok = self._probe()
+                finally:
+                    self._cond.acquire()
+                    self._probing = False
+                if ok:
+                    logger.info(f"挂载探测成功，熔断器半开，恢复访问：{self.name}")
+                    self.state = HALF_OPEN
+                    self._failures = 0
+                else:
+                    self._backoff = min(self._backoff * 2, self.max_backoff)
+                    self._retry_at = time.monotonic() + self._backoff
+                    logger.warning(f"挂载仍不可用：{self.name}，{self._backoff:g} 秒后再次探测")
+                self._cond.notify_all()
+            return True
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(dir_path: str) -> CircuitBreaker:
+    """返回目录所在挂载点的熔断器，同一挂载上的所有源目录共用一个。"""
+    mount = mount_point(dir_path.rstrip('/') or "/")
+    breaker = _breakers.get(mount)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(mount)
+            if breaker is None:
+                breaker = _breakers[mount] = CircuitBreaker(
+                    mount, mount, global_config.breaker_threshold,
+                    global_config.breaker_base_backoff, global_config.breaker_max_backoff)
+    return breaker
+
+
+def configure_breakers():
+    """按当前配置更新已有熔断器的阈值与退避参数（配置热加载），之后创建的熔断器直接读取配置。"""
+    with _breakers_lock:
+        for breaker in _breakers.values():
+            with breaker._cond:
+                breaker.threshold = max(1, global_config.breaker_threshold)
+                breaker.base_backoff = global_config.breaker_base_backoff
+                breaker.max_backoff = max(breaker.base_backoff, global_config.breaker_max_backoff)
+                breaker._backoff = (breaker.base_backoff if breaker.state == CLOSED else
+                                    min(max(breaker._backoff, breaker.base_backoff), breaker.max_backoff))
+
+
+metrics.Gauge("ystrm_mount_breaker_state", "各挂载点熔断器状态（0=闭合，1=半开，2=断开）", ["mount"]).set_function(
+    lambda: {(name,): _STATE_VALUES[b.state] for name, b in list(_breakers.items())})
@@ -1,11 +1,12 @@
 import yaml
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from .logger import logger
 
 class Config:
-    def __init__(self, config_path: str = "/app/config.yaml"):
-        self.config_path = config_path
+    def __init__(self, config_path: str = ""):
+        # 允许通过环境变量指定配置文件（基准测试等场景），默认仍为容器内的 /app/config.yaml
+        self.config_path = config_path or os.environ.get("YSTRM_CONFIG", "/app/config.yaml")
         self._load_config()
         self._validate_config()
 
@@ -18,6 +19,19 @@ class Config:
             logger.error(f"配置文件加载失败：{str(e)}", exc_info=True)
             raise
 
+    def reload(self) -> Optional[Dict]:
+        """重新读取并校验配置文件，通过后整体替换当前配置并返回旧配置。
+        内容没有变化，或新配置无法解析/校验不通过时返回 None，后者继续使用当前配置。"""
+        try:
+            fresh = Config(self.config_path)
+        except Exception as e:
+            logger.error(f"配置重新加载失败，继续使用当前配置：{str(e)}")
+            return None
+        if fresh.config == self.config:
+            return None
+        old, self.config = self.config, fresh.config
+        return old
+
     def _validate_config(self):
         required = [
             ("run_full_task_on_startup", bool),
@@ -38,6 +52,9 @@ class Config:
             if not all(k in conf for k in ["source_dir", "dest_dir", "library_dir"]):
                 logger.error(f"监控配置[{idx}]缺失核心路径")
                 raise KeyError(f"monitor_confs[{idx}] 核心路径缺失")
+            if conf.get("observer", "inotify") not in ("inotify", "polling"):
+                logger.error(f"监控配置[{idx}] observer 只能为 inotify 或 polling")
+                raise ValueError(f"monitor_confs[{idx}].observer 取值错误")
 
     @property
     def run_full_task_on_startup(self) -> bool:
@@ -47,6 +64,14 @@ class Config:
     def real_time_monitor(self) -> bool:
         return self.config.get("real_time_monitor", False)
         
+    @property
+    def real_time_debounce_seconds(self) -> float:
+        try:
+            seconds = float(self.config.get("real_time_debounce_seconds", 5))
+            return seconds if seconds > 0 else 0.0
+        except (ValueError, TypeError):
+            return 5.0
+
     @property
     def health_check_interval(self) -> int:
         try:
@@ -55,6 +80,105 @@ class Config:
         except (ValueError, TypeError):
             return 300
             
+    @property
+    def config_reload_interval(self) -> float:
+        try:
+            seconds = float(self.config.get("config_reload_interval_seconds", 10))
+            return seconds if seconds > 0 else 0.0
+        except (ValueError, TypeError):
+            return 10.0
+
+    @property
+    def probe_timeout(self) -> float:
+        try:
+            seconds = float(self.config.get("probe_timeout_seconds", 10))
+            return seconds if seconds > 0 else 10.0
+        except (ValueError, TypeError):
+            return 10.0
+
+    @property
+    def probe_slow_threshold(self) -> float:
+        try:
+            seconds = float(self.config.get("probe_slow_seconds", 2))
+            return seconds if seconds > 0 else 0.0
+        except (ValueError, TypeError):
+            return 2.0
+
+    @property
+    def health_sentinel_file(self) -> str:
+        return self.config.get("health_sentinel_file", "") or ""
+
+    @property
+    def inotify_watch_budget(self) -> int:
+        try:
+            budget = int(self.config.get("inotify_watch_budget", 0))
+            return budget if budget > 0 else 0
+        except (ValueError, TypeError):
+            return 0
+
+    @property
+    def metrics_port(self) -> int:
+        try:
+            port = int(self.config.get("metrics_port", 0))
+            return port if 0 < port < 65536 else 0
+        except (ValueError, TypeError):
+            return 0
+
+    @property
+    def metrics_bind(self) -> str:
+        return self.config.get("metrics_bind", "127.0.0.1") or "127.0.0.1"
+
+    @property
+    def change_feed_path(self) -> str:
+        return self.config.get("change_feed_path", "") or ""
+
+    @property
+    def change_feed_max_mb(self) -> float:
+        try:
+            size = float(self.config.get("change_feed_max_mb", 50))
+            return size if size > 0 else 0.0
+        except (ValueError, TypeError):
+            return 50.0
+
+    @property
+    def change_feed_backups(self) -> int:
+        try:
+            return max(0, int(self.config.get("change_feed_backups", 5)))
+        except (ValueError, TypeError):
+            return 5
+
+    @property
+    def change_feed_flush_seconds(self) -> float:
+        try:
+            seconds = float(self.config.get("change_feed_flush_seconds", 5))
+            return seconds if seconds > 0 else 5.0
+        except (ValueError, TypeError):
+            return 5.0
+
+    @property
+    def change_webhook_url(self) -> str:
+        return self.config.get("change_webhook_url", "") or ""
+
+    @property
+    def change_webhook_timeout(self) -> float:
+        try:
+            seconds = float(self.config.get("change_webhook_timeout_seconds", 10))
+            return seconds if seconds > 0 else 10.0
+        except (ValueError, TypeError):
+            return 10.0
+
+    @property
+    def log_async(self) -> bool:
+        return self.config.get("log_async", False)
+
+    @property
+    def log_progress_interval(self) -> float:
+        try:
+            seconds = float(self.config.get("log_progress_interval_seconds", 0))
+            return seconds if seconds > 0 else 0.0
+        except (ValueError, TypeError):
+            return 0.0
+
     @property
     def cron_enable(self) -> bool:
         return self.config["cron_full_process"]["enable"]
@@ -64,13 +188,93 @@ class Config:
         return self.config["cron_full_process"]["cron_expression"]
 
     @property
-    def file_processing_interval(self) -> float:
+    def overlap_policy(self) -> str:
+        policy = str(self.config["cron_full_process"].get("overlap_policy", "queue")).lower()
+        return policy if policy in ("queue", "skip") else "queue"
+
+    def _rate(self, key: str) -> float:
         try:
-            rate = int(self.config["cron_full_process"].get("files_per_second_limit", 0))
-            return 1.0 / rate if rate > 0 else 0.0
+            rate = float(self.config["cron_full_process"].get(key, 0))
+            return rate if rate > 0 else 0.0
         except (ValueError, TypeError):
             return 0.0
 
+    @property
+    def files_per_second_limit(self) -> float:
+        return self._rate("files_per_second_limit")
+
+    @property
+    def source_reads_per_second(self) -> float:
+        return self._rate("source_reads_per_second")
+
+    @property
+    def dest_writes_per_second(self) -> float:
+        return self._rate("dest_writes_per_second")
+
+    @property
+    def rate_limit_burst(self) -> float:
+        return self._rate("rate_limit_burst")
+
+    @property
+    def breaker_threshold(self) -> int:
+        try:
+            threshold = int(self.config["cron_full_process"].get("breaker_threshold", 3))
+            return threshold if threshold > 0 else 1
+        except (ValueError, TypeError):
+            return 3
+
+    @property
+    def breaker_base_backoff(self) -> float:
+        try:
+            seconds = float(self.config["cron_full_process"].get("breaker_backoff_seconds", 5))
+            return seconds if seconds > 0 else 5.0
+        except (ValueError, TypeError):
+            return 5.0
+
+    @property
+    def breaker_max_backoff(self) -> float:
+        try:
+            seconds = float(self.config["cron_full_process"].get("breaker_max_backoff_seconds", 300))
+            return seconds if seconds > 0 else 300.0
+        except (ValueError, TypeError):
+            return 300.0
+
+    @property
+    def process_workers(self) -> int:
+        try:
+            workers = int(self.config["cron_full_process"].get("process_workers", 4))
+            return workers if workers > 0 else 1
+        except (ValueError, TypeError):
+            return 4
+
+    @property
+    def full_task_processes(self) -> int:
+        try:
+            processes = int(self.config["cron_full_process"].get("full_task_processes", 0))
+            return processes if processes > 1 else 0
+        except (ValueError, TypeError):
+            return 0
+
+    @property
+    def scan_workers(self) -> int:
+        try:
+            workers = int(self.config["cron_full_process"].get("scan_workers", 4))
+            return workers if workers > 0 else 1
+        except (ValueError, TypeError):
+            return 4
+
+    @property
+    def scan_stall_timeout(self) -> float:
+        try:
+            seconds = float(self.config["cron_full_process"].get("scan_stall_timeout_seconds", 300))
+            return seconds if seconds > 0 else 0.0
+        except (ValueError, TypeError):
+            return 300.0
+
+    @property
+    def unified_scan(self) -> bool:
+        return self.config["cron_full_process"].get("unified_scan", True)
+
     @property
     def full_generate(self) -> bool:
         return self.config["cron_full_process"].get("full_generate", True)
@@ -79,6 +283,10 @@ class Config:
     def overwrite_existing(self) -> bool:
         return self.config["cron_full_process"].get("overwrite_existing", False)
 
+    @property
+    def update_changed_strm(self) -> bool:
+        return self.config["cron_full_process"].get("update_changed_strm", False)
+
     @property
     def sync_source_dest(self) -> bool:
         return self.config["cron_full_process"].get("sync_source_dest", True)
@@ -91,6 +299,22 @@ class Config:
     def preserve_extra_metadata(self) -> bool:
         return self.config["cron_full_process"].get("preserve_extra_metadata", True)
 
+    @property
+    def content_fingerprint(self) -> bool:
+        return self.config["cron_full_process"].get("content_fingerprint", False)
+
+    @property
+    def dest_dir_cache_size(self) -> int:
+        try:
+            size = int(self.config["cron_full_process"].get("dest_dir_cache_size", 10000))
+            return size if size > 0 else 10000
+        except (ValueError, TypeError):
+            return 10000
+
+    @property
+    def dest_fsync(self) -> bool:
+        return self.config["cron_full_process"].get("dest_fsync", False)
+
     @property
     def sync_metadata_to_source(self) -> bool:
         return self.config["cron_full_process"].get("sync_metadata_to_source", False)
@@ -99,6 +323,22 @@ class Config:
     def stop_on_mount_loss(self) -> bool:
         return self.config["cron_full_process"].get("stop_on_mount_loss", True)
         
+    @property
+    def state_index(self) -> bool:
+        return self.config["cron_full_process"].get("state_index", False)
+
+    @property
+    def checkpoint_max_age(self) -> float:
+        try:
+            hours = float(self.config["cron_full_process"].get("checkpoint_max_age_hours", 24))
+            return hours * 3600 if hours > 0 else 0.0
+        except (ValueError, TypeError):
+            return 24 * 3600.0
+
+    @property
+    def state_index_path(self) -> str:
+        return self.config["cron_full_process"].get("state_index_path", "") or ""
+
     @property
     def monitor_confs(self) -> List[Dict]:
         return self.config["monitor_confs"]
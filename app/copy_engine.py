@@ -0,0 +1,127 @@
+import os
+import errno
+import hashlib
+import shutil
+import tempfile
+from typing import Optional
+from .logger import logger
+from . import metrics
+
+_CHUNK_SIZE = 1024 * 1024
+_SAMPLE_SIZE = 64 * 1024
+TEMP_SUFFIX = ".ystrm-tmp"
+
+# copy_file_range / sendfile 在部分文件系统（如某些 FUSE、跨设备）上不支持，遇到这些错误即退回普通分块复制
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+
+def _kernel_copy(copy_chunk, size: int) -> int:
+    copied = 0
+    try:
+        while copied < size:
+            n = copy_chunk(min(_CHUNK_SIZE * 8, size - copied))
+            if n == 0:
+                break
+            copied += n
+    except OSError as e:
+        if e.errno not in _FALLBACK_ERRNOS or copied:
+            raise
+    return copied
+
+
+def _copy_data(src_fd: int, dst_fd: int, size: int):
+    """内核态零拷贝：优先 copy_file_range，其次 sendfile，都不可用时用分块读写。"""
+    copied = 0
+    if size and hasattr(os, "copy_file_range"):
+        copied = _kernel_copy(lambda n: os.copy_file_range(src_fd, dst_fd, n), size)
+    if size and not copied and hasattr(os, "sendfile"):
+        copied = _kernel_copy(lambda n: os.sendfile(dst_fd, src_fd, None, n), size)
+    # 分块复制（内核复制不可用时，或补齐文件在复制过程中变长的部分）
+    os.lseek(src_fd, copied, os.SEEK_SET)
+    os.lseek(dst_fd, copied, os.SEEK_SET)
+    while True:
+        buf = os.read(src_fd, _CHUNK_SIZE)
+        if not buf:
+            break
+        view = memoryview(buf)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+
+def copy_file(src: str, dst: str):
+    """原子复制文件并保留时间戳（等价于 shutil.copy2）：先写入同目录的临时文件，完成后 os.replace 到目标路径，
+    中途中断也不会留下截断的目标文件。"""
+    dst_dir = os.path.dirname(dst) or "."
+    metrics.record_fs_op("read", src)
+    metrics.record_fs_op("write", dst)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(dst)}.", suffix=TEMP_SUFFIX, dir=dst_dir)
+    try:
+        with open(src, "rb") as fsrc:
+            _copy_data(fsrc.fileno(), fd, os.fstat(fsrc.fileno()).st_size)
+        os.close(fd)
+        fd = -1
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if fd >= 0:
+            os.close(fd)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_text_atomic(path: str, content: str, mtime: Optional[float] = None):
+    """原子写入文本文件（先写临时文件再 os.replace），可选设置修改时间。"""
+    metrics.record_fs_op("write", path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=TEMP_SUFFIX,
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        if mtime is not None:
+            os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def fingerprint(path: str, size: int) -> str:
+    """廉价内容指纹：文件大小 + 头/中/尾三段采样的哈希。小文件直接哈希全部内容。"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size <= _SAMPLE_SIZE * 3:
+            h.update(f.read())
+        else:
+            for offset in (0, size // 2 - _SAMPLE_SIZE // 2, size - _SAMPLE_SIZE):
+                f.seek(offset)
+                h.update(f.read(_SAMPLE_SIZE))
+    return f"{size}:{h.hexdigest()}"
+
+
+def cached_fingerprint(path: str, st: os.stat_result, index=None) -> str:
+    """优先使用状态索引中按 (路径, 大小, 修改时间) 缓存的指纹，未命中时计算并写回缓存。"""
+    if index is not None:
+        cached = index.get_fingerprint(path, st.st_size, st.st_mtime)
+        if cached:
+            return cached
+    value = fingerprint(path, st.st_size)
+    if index is not None:
+        index.put_fingerprint(path, st.st_size, st.st_mtime, value)
+    return value
+
+
+def same_content(src: str, src_st: os.stat_result, dst: str, dst_st: os.stat_result, index=None) -> bool:
+    if src_st.st_size != dst_st.st_size:
+        return False
+    try:
+        return cached_fingerprint(src, src_st, index) == cached_fingerprint(dst, dst_st, index)
+    except OSError as e:
+        logger.debug(f"计算内容指纹失败，按已变化处理：{src} / {dst} - {str(e)}")
+        return False
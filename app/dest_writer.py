@@ -0,0 +1,215 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+from .logger import logger
+from .config import global_config
+from .copy_engine import copy_file, write_text_atomic
+from .change_feed import get_change_feed, CREATE, UPDATE, DELETE, MOVE
+from . import metrics
+
+
+class DestWriter:
+    """目标目录的写入层，同一目标目录的 FileProcessor、RealTimeHandler 和 SyncCleaner 共用一个实例。
+
+    缓存已确认存在的目标目录（LRU），以及其中已列出过的文件名：同一目录下的文件只在第一次写入时 makedirs、
+    第一次判断存在性时 listdir 一次，之后都在内存中完成，目标端元数据操作的次数随目录数而不是文件数增长。
+    程序自己的删除/移动需通过 note_* 方法同步；目标目录可能被外部改动，每轮全量任务和每批实时操作开始时 reset 一次。
+    启用 fsync 时，写入的文件和所在目录记下来，在每批操作结束时由 sync 统一落盘（每个目录只 fsync 一次）。
+    配置了变更记录时，所有写入、删除和移动同时记入变更日志。
+    """
+
+    def __init__(self, dest_dir: str, cache_size: int = 10000, fsync: bool = False):
+        self.dest_root = os.path.abspath(dest_dir).rstrip('/') or '/'
+        self.cache_size = max(1, cache_size)
+        self.fsync = fsync
+        # 已确认存在的目录 -> 目录内的名字集合（None 表示尚未列出）
+        self._dirs: "OrderedDict[str, Optional[Set[str]]]" = OrderedDict()
+        # 正在 listdir 的目录 -> [并发列出数, 列出期间的名字改动 {名字: 是否存在}]，列完后合并进结果，
+        # 避免列出期间的写入/删除被旧的列表覆盖
+        self._listing: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._unsynced: Set[str] = set()
+        self.feed = get_change_feed()
+
+    def reset(self):
+        with self._lock:
+            self._dirs.clear()
+
+    def _remember(self, dir_path: str, names: Optional[Set[str]] = None):
+        current = self._dirs.pop(dir_path, None)
+        self._dirs[dir_path] = names if names is not None else current
+        while len(self._dirs) > self.cache_size:
+            self._dirs.popitem(last=False)
+
+    def _note_name(self, dir_path: str, name: str, present: bool):
+        """（持有锁时调用）目录内增删了一个名字：更新已列出的名字集合，目录正在列出时一并记下。"""
+        names = self._dirs.get(dir_path)
+        if names is not None:
+            if present:
+                names.add(name)
+            else:
+                names.discard(name)
+        listing = self._listing.get(dir_path)
+        if listing is not None:
+            listing[1][name] = present
+
+    def _within(self, path: str) -> bool:
+        return path == self.dest_root or path.startswith(self.dest_root + '/')
+
+    # ---------- 目录 ----------
+    def ensure_dir(self, dir_path: str):
+        dir_path = dir_path.rstrip('/') or '/'
+        with self._lock:
+            if dir_path in self._dirs:
+                self._dirs.move_to_end(dir_path)
+                return
+        metrics.record_fs_op("mkdir", dir_path)
+        os.makedirs(dir_path, exist_ok=True)
+        with self._lock:
+            # makedirs 成功说明各级上级目录也都存在；已列出过的上级目录补上新建的子目录名
+            path = dir_path
+            while self._within(path):
+                parent = os.path.dirname(path)
+                self._note_name(parent, os.path.basename(path), True)
+                if path in self._dirs:
+                    break
+                self._remember(path)
+                if path == self.dest_root:
+                    break
+                path = parent
+
+    def ensure_dirs(self, dir_paths: Iterable[str]):
+        """批量创建目录：去重后由深到浅创建，深层目录创建时上级目录已一并确认，不再重复 makedirs。"""
+        for dir_path in sorted({d.rstrip('/') or '/' for d in dir_paths}, key=lambda d: d.count('/'), reverse=True):
+            self.ensure_dir(dir_path)
+
+    def _names(self, dir_path: str) -> Optional[Set[str]]:
+        with self._lock:
+            names = self._dirs.get(dir_path)
+            if names is not None:
+                self._dirs.move_to_end(dir_path)
+                return names
+            listing = self._listing.setdefault(dir_path, [0, {}])
+            listing[0] += 1
+        metrics.record_fs_op("scandir", dir_path)
+        try:
+            listed = set(os.listdir(dir_path))
+        except (FileNotFoundError, NotADirectoryError):
+            listed = None
+        with self._lock:
+            listing[0] -= 1
+            if not listing[0]:
+                del self._listing[dir_path]
+            if listed is None:
+                return None
+            names = self._dirs.get(dir_path)
+            if names is None:
+                # 先列完的一方把列出期间的改动合并进去；之后的改动由 _note_name 直接作用在缓存上
+                for name, present in listing[1].items():
+                    if present:
+                        listed.add(name)
+                    else:
+                        listed.discard(name)
+                self._remember(dir_path, listed)
+                names = listed
+            return names
+
+    def exists(self, path: str) -> bool:
+        """目标路径是否存在，按目录列一次后在内存中判断。"""
+        names = self._names(os.path.dirname(path))
+        return names is not None and os.path.basename(path) in names
+
+    # ---------- 写入 ----------
+    def write_text(self, path: str, content: str, mtime: Optional[float] = None):
+        self.ensure_dir(os.path.dirname(path))
+        existed = self.feed is not None and self.exists(path)
+        write_text_atomic(path, content, mtime)
+        self.note_written(path, existed)
+
+    def copy(self, src: str, dst: str):
+        self.ensure_dir(os.path.dirname(dst))
+        existed = self.feed is not None and self.exists(dst)
+        copy_file(src, dst)
+        self.note_written(dst, existed)
+
+    def note_written(self, path: str, existed: bool = False):
+        if self.feed is not None:
+            self.feed.record(UPDATE if existed else CREATE, path)
+        with self._lock:
+            self._note_name(os.path.dirname(path), os.path.basename(path), True)
+            if self.fsync:
+                self._unsynced.add(path)
+
+    def note_removed(self, path: str, is_dir: bool = False):
+        if self.feed is not None:
+            self.feed.record(DELETE, path.rstrip('/'), is_dir)
+        self._forget(path, is_dir)
+
+    def _forget(self, path: str, is_dir: bool):
+        path = path.rstrip('/')
+        with self._lock:
+            self._note_name(os.path.dirname(path), os.path.basename(path), False)
+            if is_dir:
+                prefix = path + '/'
+                for d in [d for d in self._dirs if d == path or d.startswith(prefix)]:
+                    del self._dirs[d]
+            self._unsynced.discard(path)
+
+    def note_moved(self, old_path: str, new_path: str, is_dir: bool = False):
+        new_path = new_path.rstrip('/')
+        if self.feed is not None:
+            self.feed.record(MOVE, new_path, is_dir, old_path.rstrip('/'))
+        self._forget(old_path, is_dir)
+        with self._lock:
+            self._note_name(os.path.dirname(new_path), os.path.basename(new_path), True)
+            if is_dir:
+                self._remember(new_path)
+
+    # ---------- 落盘 ----------
+    def sync(self):
+        """对上次 sync 以来写入的文件统一 fsync，再对涉及的目录各 fsync 一次（让 rename 结果落盘）。"""
+        if not self.fsync:
+            return
+        with self._lock:
+            paths, self._unsynced = self._unsynced, set()
+        if not paths:
+            return
+        dirs = set()
+        for path in sorted(paths):
+            if self._fsync_path(path):
+                dirs.add(os.path.dirname(path))
+        for dir_path in sorted(dirs):
+            self._fsync_path(dir_path)
+        logger.debug(f"目标目录批量落盘：{len(paths)} 个文件，{len(dirs)} 个目录")
+
+    def _fsync_path(self, path: str) -> bool:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"落盘失败：{path} - {str(e)}")
+            return False
+        try:
+            os.fsync(fd)
+            return True
+        except OSError as e:
+            logger.warning(f"落盘失败：{path} - {str(e)}")
+            return False
+        finally:
+            os.close(fd)
+
+
+_writers: Dict[str, DestWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_dest_writer(dest_dir: str) -> DestWriter:
+    """按目标目录获取共享的写入层，同一目标目录的多个监控配置共用一份目录缓存。"""
+    key = os.path.abspath(dest_dir).rstrip('/') or '/'
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = DestWriter(key, global_config.dest_dir_cache_size, global_config.dest_fsync)
+        return writer
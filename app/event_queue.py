@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from .logger import logger
+
+UPSERT = "upsert"
+DELETE = "delete"
+MOVE = "move"
+
+
+class PathAction:
+    """某个路径在静默期内合并后的净操作。MOVE 的 path 为新路径，move_from 为最初的旧路径。"""
+    __slots__ = ("kind", "path", "is_dir", "move_from", "last_event")
+
+    def __init__(self, kind: str, path: str, is_dir: bool, move_from: Optional[str] = None):
+        self.kind = kind
+        self.path = path
+        self.is_dir = is_dir
+        self.move_from = move_from
+        self.last_event = time.monotonic()
+
+    def __repr__(self):
+        return f"PathAction({self.kind}, {self.path!r}, is_dir={self.is_dir}, move_from={self.move_from!r})"
+
+
+class DebouncedEventQueue:
+    """防抖合并的事件队列：按路径合并静默期内的 创建/修改/移动/删除 为一个净操作，由后台线程按批执行。
+
+    监听线程只负责入队，不会被慢速 I/O 阻塞；一个路径在最后一次事件后静默满 quiet_period 秒才会被执行，
+    所以大文件拷贝期间的上百次 modified 只会触发一次处理。批内按各路径最后一次事件的先后顺序执行。
+    """
+
+    def __init__(self, apply_batch: Callable[[List[PathAction]], None], quiet_period: float = 5.0,
+                 batch_size: int = 500, name: str = "ystrm-events"):
+        self.apply_batch = apply_batch
+        self.quiet_period = max(0.0, quiet_period)
+        self.batch_size = batch_size
+        self._pending: "OrderedDict[str, PathAction]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._paused = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def oldest_age(self) -> float:
+        """最早一个待执行操作距其最后一次事件已过去的秒数，队列为空时为 0。"""
+        with self._cond:
+            if not self._pending:
+                return 0.0
+            return time.monotonic() - min(a.last_event for a in self._pending.values())
+
+    def _set(self, action: PathAction):
+        self._pending.pop(action.path, None)
+        self._pending[action.path] = action
+        self._cond.notify()
+
+    def put_upsert(self, path: str, is_dir: bool = False):
+        with self._cond:
+            current = self._pending.get(path)
+            if current is not None and current.kind == MOVE:
+                # 移入后又被修改：保留移动，执行移动时会顺带处理新路径，只刷新静默计时
+                current.last_event = time.monotonic()
+                self._set(current)
+                return
+            self._set(PathAction(UPSERT, path, is_dir))
+
+    def put_delete(self, path: str, is_dir: bool = False):
+        with self._cond:
+            current = self._pending.get(path)
+            if current is not None and current.kind == MOVE:
+                # 移入后又被删除：净效果是旧路径被删除
+                self._set(PathAction(DELETE, current.move_from, current.is_dir))
+                self._pending.pop(path, None)
+            if is_dir:
+                # 目录删除会整体删除目标子树，子路径上待执行的删除操作都可以丢弃
+                prefix = path.rstrip('/') + '/'
+                for p in [p for p, a in self._pending.items() if a.kind == DELETE and p.startswith(prefix)]:
+                    del self._pending[p]
+            self._set(PathAction(DELETE, path, is_dir))
+
+    def put_move(self, src_path: str, dest_path: str, is_dir: bool = False):
+        with self._cond:
+            current = self._pending.pop(src_path, None)
+            if current is not None and current.kind == MOVE:
+                # A→B→C 合并为 A→C
+                self._set(PathAction(MOVE, dest_path, is_dir, current.move_from))
+            elif current is not None and current.kind == UPSERT:
+                # 尚未同步就被移走：删除旧路径对应的目标（若有），再按新路径处理
+                self._set(PathAction(DELETE, src_path, is_dir))
+                self._set(PathAction(UPSERT, dest_path, is_dir))
+            else:
+                self._set(PathAction(MOVE, dest_path, is_dir, src_path))
+            if is_dir:
+                self._rebase_children(src_path, dest_path)
+
+    def _rebase_children(self, src_path: str, dest_path: str):
+        """目录被移走时，旧路径下尚未执行的子路径操作改到新路径下，并排在目录移动之后执行
+        （目录移动只整体改名目标子树，不会扫描源端，否则其中新建的文件就漏掉了）。"""
+        old_prefix = src_path.rstrip('/') + '/'
+        new_prefix = dest_path.rstrip('/') + '/'
+
+        def rebase(path: Optional[str]) -> Optional[str]:
+            if path is not None and path.startswith(old_prefix):
+                return new_prefix + path[len(old_prefix):]
+            return path
+
+        now = time.monotonic()
+        for path in [p for p in self._pending if p.startswith(old_prefix)]:
+            action = self._pending.pop(path)
+            action.path = rebase(action.path)
+            action.move_from = rebase(action.move_from)
+            action.last_event = now
+            self._set(action)
+
+    def _take_ready(self) -> List[PathAction]:
+        now = time.monotonic()
+        ready = []
+        for path, action in list(self._pending.items()):
+            if now - action.last_event >= self.quiet_period:
+                ready.append(self._pending.pop(path))
+                if len(ready) >= self.batch_size:
+                    break
+        return ready
+
+    def _next_deadline(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        earliest = min(a.last_event for a in self._pending.values())
+        return max(0.0, earliest + self.quiet_period - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    batch = [] if self._paused else self._take_ready()
+                    if batch:
+                        break
+                    self._cond.wait(None if self._paused else self._next_deadline())
+            try:
+                self.apply_batch(batch)
+            except Exception as e:
+                logger.error(f"实时事件批处理失败：{str(e)}", exc_info=True)
+
+    def pause(self):
+        """暂停执行（事件照常入队合并），用于全量任务期间缓冲实时事件。已取出的批次不受影响。"""
+        with self._cond:
+            self._paused = True
+
+    def resume(self) -> int:
+        """恢复执行，返回缓冲中的待处理操作数。缓冲的操作按各路径最后一次事件的先后顺序执行，
+        晚于全量任务对该路径的处理，因此以事件反映的最新状态为准。"""
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+            return len(self._pending)
+
+    def flush(self):
+        """立即执行所有待处理操作（忽略静默期），在调用线程中执行。"""
+        with self._cond:
+            batch = list(self._pending.values())
+            self._pending.clear()
+        if batch:
+            self.apply_batch(batch)
+
+    def stop(self, drain: bool = False):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._worker.join(timeout=30)
+        if drain:
+            self.flush()
+        else:
+            with self._cond:
+                dropped = len(self._pending)
+                self._pending.clear()
+            if dropped:
+                logger.warning(f"实时事件队列已停止，丢弃 {dropped} 个待处理操作，将由下次全量任务补齐")
@@ -1,20 +1,45 @@
+import errno
 import os
-import shutil
+import threading
 import time
-from typing import List
-from .logger import logger
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+import logging
+from .logger import logger, log_file_action, flush_progress
 from .config import global_config
-import errno 
+from .state_index import get_state_index
+from .scan_engine import ScanEngine
+from .rate_limiter import get_limiter
+from .copy_engine import same_content
+from .dest_writer import get_dest_writer
+from .circuit_breaker import get_breaker, is_mount_error
+from .mounts import mount_point
+from .fs_probe import get_probe
+from .path_filter import PathFilter, VIDEO, METADATA
+from . import metrics
+
+# 单个文件遇到挂载级错误时最多尝试的次数，超过后跳过，留给下一轮全量任务
+_MAX_FILE_ATTEMPTS = 10
 
 class FileProcessor:
     def __init__(self, monitor_conf: dict):
+        self.monitor_conf = monitor_conf
         self.source_dirs = self._normalize_dirs(monitor_conf["source_dir"])
         self.dest_dir = self._normalize_dir(monitor_conf["dest_dir"])
         self.library_dir = self._normalize_dir(monitor_conf["library_dir"])
-        self.video_exts = monitor_conf["video_extensions"]
-        self.metadata_exts = monitor_conf["metadata_extensions"]
+        self.path_filter = PathFilter(monitor_conf, self.library_dir)
+        self.video_exts = self.path_filter.video_exts
+        self.metadata_exts = self.path_filter.metadata_exts
         self.create_strm = monitor_conf.get("create_strm", True)
         self.enable_copy_metadata = monitor_conf.get("copy_metadata", True)
+        self.index = get_state_index(self.dest_dir)
+        self.writer = get_dest_writer(self.dest_dir)
+        self.file_limiter = get_limiter("files")
+        self.read_limiter = get_limiter("source_reads")
+        self.write_limiter = get_limiter("dest_writes")
+        self.stats: Counter = Counter()
+        self._stats_lock = threading.Lock()
 
     def _normalize_dir(self, dir_path: str) -> str:
         return os.path.abspath(dir_path).rstrip('/') + '/'
@@ -22,125 +47,471 @@ class FileProcessor:
     def _normalize_dirs(self, dirs: List[str]) -> List[str]:
         return [self._normalize_dir(d) for d in dirs]
 
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+        metrics.FILE_RESULTS.inc(n, result=key)
+
+    def _log_stats(self):
+        with self._stats_lock:
+            s = dict(self.stats)
+        logger.info(f"处理统计 - STRM：新建 {s.get('strm_created', 0)}，更新 {s.get('strm_updated', 0)}，"
+                    f"未变化 {s.get('strm_unchanged', 0)}，已存在跳过 {s.get('strm_skipped', 0)}；"
+                    f"元数据：复制 {s.get('metadata_copied', 0)}，跳过 {s.get('metadata_skipped', 0)}；"
+                    f"索引未变化跳过 {s.get('index_unchanged', 0)}；小于最小体积跳过 {s.get('filtered', 0)}；"
+                    f"失败 {s.get('errors', 0)}")
+
     def _get_relative_path(self, file_path: str, base_dir: str) -> str:
         return os.path.relpath(file_path, base_dir)
 
     def _should_process_metadata(self, source_file: str, dest_file: str) -> bool:
-        if not os.path.exists(dest_file):
+        # 目录列表缓存中没有的直接视为不存在，省去逐个文件的 stat
+        if not self.writer.exists(dest_file):
+            return True
+        metrics.record_fs_op("stat", dest_file)
+        try:
+            dest_st = os.stat(dest_file)
+        except FileNotFoundError:
             return True
         if global_config.overwrite_existing:
             return True
         # 对元数据文件，同时比较修改时间和文件大小
-        return (os.path.getmtime(source_file) > os.path.getmtime(dest_file) or
-                os.path.getsize(source_file) != os.path.getsize(dest_file))
+        metrics.record_fs_op("stat", source_file)
+        source_st = os.stat(source_file)
+        if source_st.st_mtime <= dest_st.st_mtime and source_st.st_size == dest_st.st_size:
+            return False
+        # 大小相同仅修改时间漂移（跨文件系统常见）时，用内容指纹确认；内容相同则只对齐修改时间，不再重新复制
+        if global_config.content_fingerprint and same_content(source_file, source_st, dest_file, dest_st, self.index):
+            os.utime(dest_file, (source_st.st_atime, source_st.st_mtime))
+            log_file_action("元数据仅同步修改时间", "元数据内容未变化（指纹一致），仅同步修改时间：%s", dest_file,
+                            level=logging.DEBUG)
+            return False
+        return True
 
-    def generate_strm(self, source_video: str, base_dir: str):
+    def _get_dest_strm_path(self, source_video: str, base_dir: str) -> str:
         rel_path = self._get_relative_path(source_video, base_dir)
-        dest_strm = os.path.splitext(os.path.join(self.dest_dir, rel_path))[0] + ".strm"
-        
+        return os.path.splitext(os.path.join(self.dest_dir, rel_path))[0] + ".strm"
+
+    def _read_strm(self, dest_strm: str) -> Optional[str]:
+        if not self.writer.exists(dest_strm):
+            return None
+        try:
+            with open(dest_strm, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except (UnicodeDecodeError, IsADirectoryError):
+            return ""
+
+    def generate_strm(self, source_video: str, base_dir: str) -> bool:
+        """生成STRM，返回目标STRM是否已就位（新建、更新或原本已存在）。"""
+        dest_strm = self._get_dest_strm_path(source_video, base_dir)
+        strm_content = source_video
+
+        if global_config.update_changed_strm:
+            # 按内容比对：只有指向变化（例如库路径调整）时才重写，内容相同的不动，避免媒体服务器重新扫描
+            existing = self._read_strm(dest_strm)
+            if existing == strm_content:
+                log_file_action("STRM未变化", "STRM内容未变化，跳过：%s", dest_strm, level=logging.DEBUG)
+                self._count("strm_unchanged")
+                return True
+            action = "strm_created" if existing is None else "strm_updated"
         # 对 .strm 文件，逻辑简化为：不存在或需要强制覆盖时才创建
-        if os.path.exists(dest_strm) and not global_config.overwrite_existing:
-            logger.debug(f"STRM已存在，跳过创建：{dest_strm}")
-            return
+        elif self.writer.exists(dest_strm):
+            if not global_config.overwrite_existing:
+                log_file_action("STRM已存在", "STRM已存在，跳过创建：%s", dest_strm, level=logging.DEBUG)
+                self._count("strm_skipped")
+                return True
+            action = "strm_updated"
+        else:
+            action = "strm_created"
             
-        dest_strm_dir = os.path.dirname(dest_strm)
-        os.makedirs(dest_strm_dir, exist_ok=True)
+        self.writer.ensure_dir(os.path.dirname(dest_strm))
         
         try:
             source_mtime = os.path.getmtime(source_video)
-            strm_content = source_video
+            self.write_limiter.acquire()
             
-            with open(dest_strm, "w", encoding="utf-8") as f:
-                f.write(strm_content)
-            os.utime(dest_strm, (source_mtime, source_mtime))
-            logger.info(f"STRM生成成功：{dest_strm} → 指向：{strm_content}")
+            self.writer.write_text(dest_strm, strm_content, source_mtime)
+            if self.index is not None:
+                self.index.record_dest(dest_strm, "strm", len(strm_content.encode("utf-8")), source_mtime, source_video)
+            self._count(action)
+            if action == "strm_updated":
+                log_file_action("STRM更新", "STRM更新成功：%s → 指向：%s", dest_strm, strm_content)
+            else:
+                log_file_action("STRM生成", "STRM生成成功：%s → 指向：%s", dest_strm, strm_content)
+            return True
         except Exception as e:
+            self._count("errors")
             logger.error(f"STRM生成失败：{dest_strm} - {str(e)}", exc_info=True)
+            return False
 
-    def copy_metadata(self, source_metadata: str, base_dir: str):
+    def copy_metadata(self, source_metadata: str, base_dir: str) -> bool:
+        """复制元数据，返回目标文件是否已就位（复制成功或无需更新）。"""
         rel_path = self._get_relative_path(source_metadata, base_dir)
         dest_metadata = os.path.join(self.dest_dir, rel_path)
         
         # 使用专门为元数据设计的比对方法
         if not self._should_process_metadata(source_metadata, dest_metadata):
-            logger.debug(f"元数据已存在且未更新，跳过：{dest_metadata}")
-            return
+            log_file_action("元数据未更新", "元数据已存在且未更新，跳过：%s", dest_metadata, level=logging.DEBUG)
+            self._count("metadata_skipped")
+            return True
             
-        dest_metadata_dir = os.path.dirname(dest_metadata)
-        os.makedirs(dest_metadata_dir, exist_ok=True)
+        self.writer.ensure_dir(os.path.dirname(dest_metadata))
         
         try:
-            shutil.copy2(source_metadata, dest_metadata)
-            logger.info(f"元数据复制/更新成功：{dest_metadata}")
+            self.read_limiter.acquire()
+            self.writer.copy(source_metadata, dest_metadata)
+            if self.index is not None:
+                st = os.stat(source_metadata)
+                self.index.record_dest(dest_metadata, "metadata", st.st_size, st.st_mtime, source_metadata)
+            self._count("metadata_copied")
+            log_file_action("元数据复制", "元数据复制/更新成功：%s", dest_metadata)
+            return True
         except Exception as e:
+            self._count("errors")
             logger.error(f"元数据复制失败：{dest_metadata} - {str(e)}", exc_info=True)
+            return False
 
-    def process_single_dir(self, source_dir: str):
-        if not os.path.exists(source_dir):
-            logger.warning(f"源目录不存在，跳过：{source_dir}")
-            return
+    def _wanted_kind(self, source_file: str) -> Optional[str]:
+        """按后缀和 include/exclude 规则判断文件是否需要处理，返回 VIDEO/METADATA 或 None。"""
+        kind = self.path_filter.kind(source_file)
+        if kind == VIDEO and not self.create_strm or kind == METADATA and not self.enable_copy_metadata:
+            return None
+        if kind is None or not self.path_filter.accept_file(source_file):
+            return None
+        return kind
+
+    def process_file(self, source_file: str, scan_id: int = 0, entry: Optional[os.DirEntry] = None) -> bool:
+        """处理单个源文件（按后缀生成STRM/复制元数据），启用状态索引时跳过自上次处理后未变化的文件。
+        返回 False 表示生成/复制失败。"""
+        kind = self._wanted_kind(source_file)
+        if kind is None:
+            return True
+        is_video, is_metadata = kind == VIDEO, kind == METADATA
+        st = None
+        if is_video and self.path_filter.min_video_size:
+            metrics.record_fs_op("stat", source_file)
+            st = entry.stat() if entry is not None else os.stat(source_file)
+            if not self.path_filter.accept_file(source_file, kind, st.st_size):
+                self._count("filtered")
+                # 只是不再生成，已生成的 STRM 保留（与不启用状态索引时的清理结果一致）
+                if self.index is not None and scan_id:
+                    self.index.touch_source(source_file, scan_id)
+                return True
+
+        if self.index is None:
+            ok = True
+            if is_video:
+                ok = self.generate_strm(source_file, self.library_dir) and ok
+            if is_metadata:
+                ok = self.copy_metadata(source_file, self.library_dir) and ok
+            return ok
+
+        # 遍历时拿到的 DirEntry 会缓存 stat 结果，避免重复的 stat 调用
+        if st is None:
+            metrics.record_fs_op("stat", source_file)
+            st = entry.stat() if entry is not None else os.stat(source_file)
+        recorded = None if global_config.overwrite_existing else \
+            self.index.unchanged_dest(source_file, st.st_size, st.st_mtime)
+        # 目标文件被手动删除时不能相信索引，照常重新生成
+        if recorded is not None and self.writer.exists(recorded):
+            log_file_action("索引未变化", "源文件未变化（状态索引），跳过：%s", source_file, level=logging.DEBUG)
+            self._count("index_unchanged")
+            if scan_id:
+                self.index.touch_source(source_file, scan_id)
+            return True
+
+        dest_path = None
+        if is_video and self.generate_strm(source_file, self.library_dir):
+            dest_path = self._get_dest_strm_path(source_file, self.library_dir)
+        if is_metadata and self.copy_metadata(source_file, self.library_dir):
+            dest_path = dest_path or os.path.join(self.dest_dir, self._get_relative_path(source_file, self.library_dir))
+        self.index.record_source(source_file, "video" if is_video else "metadata",
+                                 st.st_size, st.st_mtime, dest_path, scan_id)
+        return dest_path is not None
+
+    def _index_dir(self, source_dir_path: str, scan_id: int):
+        source_dir_path = source_dir_path.rstrip('/')
+        dest_path = os.path.join(self.dest_dir, self._get_relative_path(source_dir_path, self.library_dir))
+        self.index.record_source(source_dir_path, "dir", 0, 0.0, dest_path.rstrip('/'), scan_id)
+
+    def _process_entry(self, entry: os.DirEntry, scan_id: int) -> bool:
+        """处理遍历到的一个文件，返回是否处理成功（失败或被跳过的文件所在目录不会记入检查点）。"""
+        source_file = entry.path
+        breaker = get_breaker(os.path.dirname(source_file))
+        self.file_limiter.acquire()
+
+        # “暂停与重试”循环：挂载级错误交给该挂载的熔断器，断开期间只阻塞访问这个挂载的线程
+        attempts = 0
+        while True:
+            breaker.wait_until_available()
+            try:
+                # 核心处理逻辑
+                ok = self.process_file(source_file, scan_id, entry)
+                breaker.record_success()
+
+                # 如果成功处理，就跳出重试循环，继续下一个文件
+                return ok
+
+            except OSError as e:
+                # 只处理 "Transport endpoint is not connected" 等挂载级错误
+                if is_mount_error(e):
+                    attempts += 1
+                    breaker.record_failure(e)
+                    if attempts >= _MAX_FILE_ATTEMPTS:
+                        self._count("errors")
+                        logger.error(f"挂载持续不可用，已跳过，留待下次全量任务: {source_file} - {str(e)}")
+                        return False
+                    logger.warning(f"检测到挂载连接丢失，等待挂载恢复后重试。出错文件: {source_file} - {str(e)}")
+                    # DirEntry 的 stat 结果有缓存，重试时改为重新 stat
+                    entry = None
+                else:
+                    # 如果是其他操作系统错误，记录下来并放弃这个文件
+                    logger.error(f"处理文件时发生未知的操作系统错误，已跳过: {source_file} - {str(e)}")
+                    return False
+            except Exception as e:
+                # 如果是其他未知异常，记录下来并放弃这个文件
+                logger.error(f"处理文件时发生未知错误，已跳过: {source_file} - {str(e)}", exc_info=True)
+                return False
+
+    def process_subtree(self, source_dir_path: str) -> int:
+        """只扫描并处理一棵源子树（实时移入的目录等），不触发全量任务，返回处理的文件数。"""
+        source_dir_path = source_dir_path.rstrip('/')
+        if self.path_filter.excluded_path(source_dir_path, True):
+            return 0
+        count = 0
+        tree = ScanEngine(retain=False).tree(source_dir_path, self.path_filter)
+        with ThreadPoolExecutor(max_workers=global_config.process_workers, thread_name_prefix="ystrm-subtree") as pool:
+            for root, entries in tree.walk_entries():
+                if self.index is not None:
+                    self._index_dir(root, 0)
+                entries = [e for e in entries if self._wanted_kind(e.path) is not None]
+                # 与全量任务相同，失败按挂载熔断器重试；逐目录等待处理完，在途任务数不超过单个目录的文件数
+                list(pool.map(lambda e: self._process_entry(e, 0), entries))
+                count += len(entries)
+        return count
+
+    def retarget_strms(self, dest_path: str, old_source: str, new_source: str) -> int:
+        """目标子树随源子树整体改名后，把其中仍指向旧源路径的 STRM 改写为新路径（只读写目标端，不访问源端），
+        保留原修改时间。返回改写的 STRM 数。"""
+        old_prefix = old_source.rstrip('/') + '/'
+        new_prefix = new_source.rstrip('/') + '/'
+        if os.path.isdir(dest_path):
+            paths = (os.path.join(root, name) for root, _, files in os.walk(dest_path)
+                     for name in files if name.endswith(".strm"))
+        else:
+            paths = [dest_path] if dest_path.endswith(".strm") else []
+        count = 0
+        for path in paths:
+            content = self._read_strm(path)
+            if content == old_source.rstrip('/'):
+                new_content = new_source.rstrip('/')
+            elif content and content.startswith(old_prefix):
+                new_content = new_prefix + content[len(old_prefix):]
+            else:
+                continue
+            mtime = os.stat(path).st_mtime
+            self.write_limiter.acquire()
+            self.writer.write_text(path, new_content, mtime)
+            if self.index is not None:
+                self.index.record_dest(path, "strm", len(new_content.encode("utf-8")), mtime, new_content)
+            count += 1
+        return count
+
+    def process_batches(self, source_dir: str, batches: Iterable[Tuple[str, List]], scan_id: int = 0,
+                        done_dirs: AbstractSet[str] = frozenset(), checkpoint_age: float = 0):
+        """处理按目录产出的 (目录路径, 文件条目列表)，全量任务与多进程分片共用。扫描中的 OSError 原样抛出。"""
+        workers = global_config.process_workers
+        # 流式并行遍历：边发现边处理，不再先把整个 os.walk 结果载入内存
+        # 文件交给有界线程池并发处理，信号量限制在途任务数量，扫描速度不会让待处理队列无限增长
+        slots = threading.BoundedSemaphore(workers * 2)
+        # 在途的文件任务 -> (源文件, 提交时间)；卡死的 stat/复制会占满信号量，等待时据此判断挂载是否卡死
+        stall_timeout = global_config.scan_stall_timeout
+        inflight: Dict[Future, Tuple[str, float]] = {}
+        inflight_lock = threading.Lock()
+        # 检查点：{目录: [未完成文件数, 是否全部成功]}，目录内文件全部成功处理后记入检查点
+        remaining: Dict[str, list] = {}
+        remaining_lock = threading.Lock()
+
+        def check_stall():
+            if not stall_timeout:
+                return
+            with inflight_lock:
+                oldest = min(inflight.values(), key=lambda item: item[1], default=None)
+            if oldest is not None and time.monotonic() - oldest[1] >= stall_timeout:
+                error = OSError(errno.ETIMEDOUT, f"处理文件超过 {stall_timeout:g} 秒未完成，挂载疑似卡死", oldest[0])
+                get_breaker(os.path.dirname(oldest[0])).record_failure(error)
+                raise error
+
+        def release(future):
+            with inflight_lock:
+                inflight.pop(future, None)
+            slots.release()
+
+        def file_done(root: str, future):
+            release(future)
+            ok = not future.cancelled() and future.exception() is None and future.result()
+            with remaining_lock:
+                state = remaining[root]
+                state[0] -= 1
+                state[1] = state[1] and ok
+                finished = state[0] == 0 and state[1]
+                if state[0] == 0:
+                    del remaining[root]
+            if finished:
+                self.index.checkpoint_dir(source_dir, root)
+
+        def submit(pool: ThreadPoolExecutor, root: str, entry: os.DirEntry):
+            while not slots.acquire(timeout=1.0):
+                check_stall()
+            try:
+                with inflight_lock:
+                    future = pool.submit(self._process_entry, entry, scan_id)
+                    inflight[future] = (entry.path, time.monotonic())
+            except Exception:
+                slots.release()
+                raise
+            if checkpoint_age:
+                future.add_done_callback(lambda f: file_done(root, f))
+            else:
+                future.add_done_callback(release)
+
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ystrm-proc")
+        try:
+            for root, entries in batches:
+                metrics.FILES_SCANNED.inc(len(entries), source=source_dir)
+                if root in done_dirs:
+                    continue
+                if self.index is not None:
+                    self._index_dir(root, scan_id)
+                # 后缀和规则不匹配的文件不进入线程池
+                entries = [e for e in entries if self._wanted_kind(e.path) is not None]
+                if checkpoint_age:
+                    if not entries:
+                        self.index.checkpoint_dir(source_dir, root)
+                        continue
+                    with remaining_lock:
+                        remaining[root] = [len(entries), True]
+                for entry in entries:
+                    submit(pool, root, entry)
+            while True:
+                with inflight_lock:
+                    waiting = list(inflight)
+                if not waiting:
+                    break
+                wait(waiting, timeout=1.0)
+                check_stall()
+        except BaseException:
+            # 扫描中止（挂载丢失/卡死）时不等待可能卡在系统调用里的处理线程
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+
+    def process_single_dir(self, source_dir: str, engine: Optional[ScanEngine] = None) -> bool:
+        """处理一个源根目录，返回是否完整处理完（目录存在且扫描未被中止）。"""
+        problem = get_probe().check_dir(source_dir)
+        if problem:
+            logger.warning(f"源目录不可用，跳过：{source_dir}（{problem}）")
+            return False
         
         logger.info(f"开始处理源目录：{source_dir}")
-        interval = global_config.file_processing_interval
         
-        # 将 os.walk 转换为列表，以便在出错时可以从断点继续
+        checkpoint_age = global_config.checkpoint_max_age if self.index is not None else 0
+        scan_id, done_dirs = self.index.begin_scan(source_dir, checkpoint_age) if self.index is not None else (0, set())
+        if done_dirs:
+            logger.info(f"从检查点继续上次中断的扫描：{source_dir}（跳过 {len(done_dirs)} 个已处理完的目录）")
+        # 共享扫描引擎时，同一源根目录在本轮任务内只列一次，快照留给后续的清理阶段复用
+        # 排除规则命中的子目录在扫描时整棵跳过，不会被列出
+        tree = (engine or ScanEngine(retain=False)).tree(source_dir, self.path_filter)
+
         try:
-            dir_walk_list = list(os.walk(source_dir))
+            self.process_batches(source_dir, tree.walk_entries(), scan_id, done_dirs, checkpoint_age)
         except OSError as e:
-            if e.errno == errno.ENOTCONN: # 错误码 107
-                logger.critical(f"开始扫描目录时即发现挂载丢失: {source_dir}。中止对此目录的处理。")
-                return
+            if is_mount_error(e): # 挂载断开（错误码 107）或列目录卡死超时
+                logger.critical(f"扫描目录时发现挂载丢失或卡死: {source_dir}。中止对此目录的处理。 - {str(e)}")
+                return False
             else:
                 # 对于其他未知的OS错误，记录并抛出
                 logger.error(f"扫描目录时发生未知操作系统错误: {source_dir} - {str(e)}", exc_info=True)
                 raise
 
-        # 遍历目录和文件
-        for root, _, files in dir_walk_list:
-            for file in files:
-                source_file = os.path.join(root, file)
-                
-                # “暂停与重试”循环，专门处理单个文件的访问错误
-                while True:
-                    try:
-                        # 核心处理逻辑
-                        file_ext = os.path.splitext(file)[1].lower()
-                        
-                        if self.create_strm and file_ext in self.video_exts:
-                            self.generate_strm(source_file, self.library_dir)
-                        if self.enable_copy_metadata and file_ext in self.metadata_exts:
-                            self.copy_metadata(source_file, self.library_dir)
-                            
-                        # 如果设置了间隔，则等待
-                        if interval > 0:
-                            time.sleep(interval)
-
-                        # 如果成功处理，就跳出重试循环，继续下一个文件
-                        break 
-                        
-                    except OSError as e:
-                        # 只处理 "Transport endpoint is not connected" 这个特定错误
-                        if e.errno == errno.ENOTCONN:
-                            logger.warning(f"检测到挂载连接丢失，正在暂停处理... 将在30秒后重试。出错文件: {source_file}")
-                            time.sleep(30)
-                            # 不做任何事，让 while True 循环自动进行下一次尝试
-                        else:
-                            # 如果是其他操作系统错误，记录下来并放弃这个文件
-                            logger.error(f"处理文件时发生未知的操作系统错误，已跳过: {source_file} - {str(e)}")
-                            break 
-                    except Exception as e:
-                        # 如果是其他未知异常，记录下来并放弃这个文件
-                        logger.error(f"处理文件时发生未知错误，已跳过: {source_file} - {str(e)}", exc_info=True)
-                        break
-            
+        self.writer.sync()
+        if tree.errors:
+            # 有子目录没能列出（EIO/EACCES 等）：不记为完整扫描，否则其中的条目都会被当作已删除，
+            # 清理阶段随之退回目录遍历同步，并在源目录快照不完整时安全中止
+            logger.warning(f"源目录有 {len(tree.errors)} 个子目录无法列出，本轮不记为完整扫描：{source_dir}"
+                           f"（例如：{tree.errors[0][0]} - {str(tree.errors[0][1])}）")
+            return False
+        if self.index is not None:
+            self.index.complete_scan(source_dir, scan_id)
         logger.info(f"源目录处理完成：{source_dir}")
+        return True
 
-    def process_all_source_dirs(self):
+    def start_full_run(self) -> bool:
+        """全量文件处理的准备工作，返回 False 表示本轮跳过文件处理。"""
         if not global_config.full_generate:
             logger.info("未启用全量生成，跳过文件处理")
-            return
+            return False
         
+        if self.index is not None and global_config.checkpoint_max_age and \
+                self.index.cleanup_progress(self.dest_dir, global_config.checkpoint_max_age) is not None:
+            logger.info(f"上次任务的文件处理已全部完成、清理阶段被中断，本次直接从清理阶段继续：{self.dest_dir}")
+            return False
+
         logger.info("="*50 + "\n开始全量文件处理（生成STRM+复制元数据）")
-        for source_dir in self.source_dirs:
+        # 目标目录可能被外部改动过，每轮全量任务重新确认目录缓存
+        self.writer.reset()
+        with self._stats_lock:
+            self.stats.clear()
+        return True
+
+    def finish_full_run(self, completed: bool):
+        if completed and self.index is not None and global_config.checkpoint_max_age:
+            # 所有源目录都已处理完：记下清理阶段的检查点，之后若被中断，下次直接从清理阶段继续
+            self.index.begin_cleanup(self.dest_dir)
+        flush_progress()
+        self._log_stats()
+        logger.info("全量文件处理完成\n" + "="*50)
+
+    def take_stats(self) -> Dict[str, int]:
+        """取出并清零处理统计（多进程全量任务的子进程每处理完一个分片调用一次）。"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            self.stats.clear()
+        return stats
+
+    def merge_stats(self, stats: Dict[str, int]):
+        """并入多进程全量任务中子进程的处理统计。"""
+        for key, n in stats.items():
+            self._count(key, n)
+
+    def process_added_dirs(self, source_dirs: List[str]):
+        """配置热加载后只处理新增的源目录，不进入清理阶段，本配置的其余源目录留给下次全量任务。"""
+        if not global_config.full_generate:
+            return
+        logger.info(f"开始处理热加载新增的 {len(source_dirs)} 个源目录")
+        with self._stats_lock:
+            self.stats.clear()
+        for source_dir in source_dirs:
             self.process_single_dir(source_dir)
-        logger.info("全量文件处理完成\n" + "="*50)
\ No newline at end of file
+        flush_progress()
+        self._log_stats()
+
+    def process_all_source_dirs(self, engine: Optional[ScanEngine] = None):
+        if not self.start_full_run():
+            return
+        # 按挂载点分组：同一挂载上的源目录依次处理，不同挂载并行，某个挂载熔断时其他挂载不受影响
+        groups: Dict[str, List[str]] = {}
+        for source_dir in self.source_dirs:
+            groups.setdefault(mount_point(source_dir.rstrip('/') or '/'), []).append(source_dir)
+
+        def process_group(source_dirs: List[str]) -> bool:
+            return all([self.process_single_dir(source_dir, engine) for source_dir in source_dirs])
+
+        if len(groups) == 1:
+            completed = process_group(self.source_dirs)
+        else:
+            with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="ystrm-mount") as pool:
+                completed = all([f.result() for f in [pool.submit(process_group, dirs) for dirs in groups.values()]])
+        self.finish_full_run(completed)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import errno
+import os
+import threading
+import time
+from stat import S_ISDIR
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+from .logger import logger
+from .config import global_config
+from .mounts import mount_point
+from . import metrics
+
+T = TypeVar("T")
+
+STAT = "stat"
+LISTDIR = "listdir"
+SENTINEL = "sentinel"
+
+
+class FsProbe:
+    """带超时的文件系统探测：每次调用在独立的守护线程中执行，主调线程最多等待 timeout 秒。
+
+    卡死（而不是断开）的 FUSE 挂载上 stat/listdir 会永远阻塞，且阻塞在系统调用中的线程无法被中止；
+    超时后放弃该线程并按挂载级错误（ETIMEDOUT）抛出，交给现有的挂载丢失保护逻辑处理。
+    某个挂载上还有未返回的探测线程时，对该挂载的新探测直接判定超时，不再堆积新的阻塞线程。
+    每次探测的延迟都会记录下来，超过 slow_threshold 时输出警告，挂载性能下降在彻底卡死之前就能被发现。
+    """
+
+    def __init__(self, timeout: float = 10.0, slow_threshold: float = 2.0):
+        self.timeout = timeout
+        self.slow_threshold = slow_threshold
+        # 挂载点 -> (仍未返回的探测线程, 开始时间)
+        self._stuck: Dict[str, Tuple[threading.Thread, float]] = {}
+        self._latency: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def call(self, op: str, path: str, fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+        """在探测线程中执行 fn()，返回其结果；fn 抛出的异常原样抛出，超时抛出 ETIMEDOUT。"""
+        timeout = self.timeout if timeout is None else timeout
+        mount = mount_point(path.rstrip('/') or "/")
+        with self._lock:
+            stuck = self._stuck.get(mount)
+            if stuck is not None:
+                if stuck[0].is_alive():
+                    metrics.PROBE_TIMEOUTS.inc(mount=mount)
+                    raise OSError(errno.ETIMEDOUT, f"该挂载上一次探测已卡住 {time.monotonic() - stuck[1]:.0f} 秒仍未返回",
+                                  path)
+                del self._stuck[mount]
+        outcome: list = []
+
+        def run():
+            try:
+                outcome.append((True, fn()))
+            except BaseException as e:
+                outcome.append((False, e))
+
+        start = time.monotonic()
+        worker = threading.Thread(target=run, name="ystrm-probe", daemon=True)
+        worker.start()
+        worker.join(timeout if timeout > 0 else None)
+        elapsed = time.monotonic() - start
+        if worker.is_alive():
+            with self._lock:
+                self._stuck[mount] = (worker, start)
+                self._latency[mount] = elapsed
+            metrics.PROBE_TIMEOUTS.inc(mount=mount)
+            logger.warning(f"文件系统探测超时（{op}，{timeout:g} 秒），挂载疑似卡死：{path}")
+            raise OSError(errno.ETIMEDOUT, f"{op} 超过 {timeout:g} 秒未返回，挂载疑似卡死", path)
+        metrics.PROBE_SECONDS.observe(elapsed, op=op)
+        with self._lock:
+            self._latency[mount] = elapsed
+        if self.slow_threshold > 0 and elapsed >= self.slow_threshold:
+            logger.warning(f"文件系统探测延迟偏高（{op} 耗时 {elapsed:.2f} 秒），挂载可能正在变慢：{path}")
+        ok, value = outcome[0]
+        if not ok:
+            raise value
+        return value
+
+    def stat(self, path: str, timeout: Optional[float] = None) -> os.stat_result:
+        return self.call(STAT, path, lambda: os.stat(path), timeout)
+
+    def check_dir(self, path: str, sentinel: str = "") -> Optional[str]:
+        """检查源目录是否可用，返回 None 表示正常，否则返回原因。
+
+        依次：stat 确认是目录；读出第一个目录项（卡死的挂载往往 stat 正常、readdir 卡住）；
+        配置了哨兵文件时确认它存在（挂载丢失后挂载点常常是一个可以正常访问的空目录）。
+        """
+        try:
+            st = self.stat(path)
+            if not S_ISDIR(st.st_mode):
+                return "不是目录"
+            self.call(LISTDIR, path, lambda: _first_entry(path))
+            if sentinel:
+                sentinel_path = os.path.join(path, sentinel)
+                self.call(SENTINEL, sentinel_path, lambda: os.stat(sentinel_path))
+        except FileNotFoundError as e:
+            return f"不存在：{e.filename}"
+        except OSError as e:
+            return str(e)
+        return None
+
+    def latencies(self) -> Dict[Tuple[str], float]:
+        with self._lock:
+            return {(mount,): latency for mount, latency in self._latency.items()}
+
+
+def _first_entry(path: str):
+    with os.scandir(path) as it:
+        return next(it, None)
+
+
+_probe: Optional[FsProbe] = None
+_probe_lock = threading.Lock()
+
+
+def get_probe() -> FsProbe:
+    """进程内共享的文件系统探测器（健康检查、熔断器探测共用）。"""
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            _probe = FsProbe(global_config.probe_timeout, global_config.probe_slow_threshold)
+            metrics.PROBE_LATENCY.set_function(_probe.latencies)
+        return _probe
@@ -1,9 +1,14 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 def init_logger():
-    log_dir = "/app/logs"
+    log_dir = os.environ.get("YSTRM_LOG_DIR", "/app/logs")
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, "ystrm.log")
     logger = logging.getLogger("YSTRM")
@@ -20,4 +25,103 @@ def init_logger():
     logger.addHandler(file_handler)
     return logger
 
-logger = init_logger()
\ No newline at end of file
+logger = init_logger()
+
+_listener = None
+
+
+def enable_async_logging():
+    """把现有的控制台/文件 handler 挪到后台线程：处理线程只把日志记录放入队列，格式化和写盘由 QueueListener 完成。
+    重复调用无副作用；进程正常退出时会先把队列中剩余的日志写完。"""
+    global _listener
+    if _listener is not None:
+        return
+    handlers = list(logger.handlers)
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    _listener.start()
+    atexit.register(disable_async_logging)
+
+
+def disable_async_logging():
+    """停止后台日志线程（写完队列中剩余的记录），恢复同步写日志。"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+
+
+class _ProgressAggregator:
+    """聚合模式下逐文件的日志降为 DEBUG，这里只计数，每隔 interval 秒输出一行进度汇总。"""
+
+    def __init__(self):
+        self.interval = 0.0
+        self._counts: Counter = Counter()
+        self._since = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, action: str):
+        now = time.monotonic()
+        with self._lock:
+            if not self._counts:
+                # 空闲之后的第一个文件重新开始计时，避免把空闲时间算进速率
+                self._since = now
+            self._counts[action] += 1
+            if now - self._since < self.interval:
+                return
+            counts, elapsed = self._take(now)
+        self._emit(counts, elapsed)
+
+    def flush(self):
+        with self._lock:
+            counts, elapsed = self._take(time.monotonic())
+        self._emit(counts, elapsed)
+
+    def _take(self, now: float):
+        counts, self._counts = self._counts, Counter()
+        elapsed, self._since = now - self._since, now
+        return counts, elapsed
+
+    @staticmethod
+    def _emit(counts: Counter, elapsed: float):
+        if not counts:
+            return
+        total = sum(counts.values())
+        detail = "，".join(f"{action} {n}" for action, n in counts.most_common())
+        logger.info("处理进度：%.1f 秒内 %d 个文件（%.1f 个/秒）- %s", elapsed, total, total / max(elapsed, 1e-6), detail)
+
+
+_progress = _ProgressAggregator()
+
+
+def set_progress_interval(seconds: float):
+    """设置进度汇总间隔；大于 0 时启用聚合模式，0 表示逐文件输出日志（默认）。"""
+    _progress.flush()
+    _progress.interval = max(0.0, seconds)
+
+
+def log_file_action(action: str, msg: str, *args, level: int = logging.INFO):
+    """记录单个文件的处理结果（热路径）。
+
+    msg 使用 % 占位符，只有日志级别启用时才格式化。聚合模式下逐文件明细降为 DEBUG，
+    按 action 计数并定期输出进度汇总。
+    """
+    if _progress.interval > 0:
+        _progress.add(action)
+        level = logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, *args, stacklevel=2)
+
+
+def flush_progress():
+    """立即输出尚未汇总的计数（一个阶段结束时调用）。"""
+    _progress.flush()
@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from .logger import logger
+from .mounts import mount_point
+
+_registry: List["_Metric"] = []
+_enabled = False
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """可直接 set，也可以注册回调在抓取时取值（回调返回 {标签值元组: 数值}）。"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]]):
+        self._callback = callback
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            try:
+                values.update(self._callback())
+            except Exception as e:
+                logger.debug(f"指标回调取值失败：{self.name} - {str(e)}")
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600)):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [各桶计数..., 总和, 总数]
+            data = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, data in items:
+            for bound, count in zip(self.buckets, data):
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(data[-2])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {data[-1]}"
+
+
+FILES_SCANNED = Counter("ystrm_files_scanned_total", "全量任务遍历到的源文件数", ["source"])
+FILE_RESULTS = Counter("ystrm_file_results_total",
+                       "文件处理结果计数（strm_created/strm_updated/strm_skipped/metadata_copied 等）", ["result"])
+ORPHANS_DELETED = Counter("ystrm_orphans_deleted_total", "源端已删除而从目标目录清理掉的文件/目录数", ["kind"])
+PHASE_SECONDS = Histogram("ystrm_phase_duration_seconds", "全量任务各阶段耗时（秒）", ["phase"])
+FS_OPS = Counter("ystrm_fs_operations_total", "按挂载点统计的文件系统操作次数", ["mount", "op"])
+REALTIME_ACTIONS = Counter("ystrm_realtime_actions_total", "实时事件队列已执行的合并操作数", ["kind"])
+EVENT_QUEUE_DEPTH = Gauge("ystrm_event_queue_depth", "实时事件队列中待执行的操作数", ["monitor"])
+EVENT_QUEUE_LAG = Gauge("ystrm_event_queue_lag_seconds", "实时事件队列中最早一个待执行操作已等待的秒数", ["monitor"])
+OBSERVER_WATCHES = Gauge("ystrm_observer_watches",
+                         "实时监控占用情况：inotify_dirs 为估算的 inotify 目录监控数，inotify_budget 为预算，"
+                         "polling_subtrees 为轮询中的子树数", ["kind"])
+PROBE_SECONDS = Histogram("ystrm_probe_duration_seconds", "文件系统探测（健康检查、熔断器探测）耗时（秒）", ["op"],
+                          buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30))
+PROBE_LATENCY = Gauge("ystrm_probe_latency_seconds", "各挂载点最近一次文件系统探测的耗时（秒）", ["mount"])
+PROBE_TIMEOUTS = Counter("ystrm_probe_timeouts_total", "文件系统探测超时次数（挂载疑似卡死）", ["mount"])
+SOURCE_HEALTHY = Gauge("ystrm_source_healthy", "源目录健康状态（1=可访问，0=疑似挂载丢失）", ["path"])
+LAST_FULL_TASK = Gauge("ystrm_full_task_last_success_timestamp_seconds", "最近一次全量任务成功完成的时间戳")
+
+
+def record_fs_op(op: str, path: str, count: int = 1):
+    """记录一次文件系统操作（按所在挂载点归类）。未启用指标时不做任何事。"""
+    if _enabled:
+        FS_OPS.inc(count, mount=mount_point(os.path.dirname(path.rstrip('/')) or "/"), op=op)
+
+
+@contextmanager
+def timed(phase: str):
+    """统计一个阶段的耗时，写入阶段耗时直方图并记录日志。"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - start
+        PHASE_SECONDS.observe(elapsed, phase=phase)
+        logger.info(f"阶段耗时：{phase} - {elapsed:.2f} 秒")
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(bind: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """在后台线程启动 Prometheus 文本格式的 /metrics 接口，并开始统计各挂载点的文件系统操作。"""
+    global _enabled
+    try:
+        server = ThreadingHTTPServer((bind, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"指标接口启动失败：{bind}:{port} - {str(e)}", exc_info=True)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ystrm-metrics", daemon=True).start()
+    _enabled = True
+    logger.info(f"指标接口已启动：http://{bind}:{port}/metrics")
+    return server
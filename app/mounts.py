@@ -0,0 +1,28 @@
+import re
+from functools import lru_cache
+from typing import Tuple
+
+
+@lru_cache(maxsize=1)
+def _mount_points() -> Tuple[str, ...]:
+    mounts = []
+    try:
+        with open("/proc/self/mounts", "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 1:
+                    # /proc/mounts 中空格等字符以八进制转义
+                    mounts.append(re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1]))
+    except OSError:
+        pass
+    # 由长到短排列，第一个前缀匹配的就是最内层挂载点
+    return tuple(sorted(set(mounts) | {"/"}, key=len, reverse=True))
+
+
+@lru_cache(maxsize=4096)
+def mount_point(dir_path: str) -> str:
+    """返回目录所在的挂载点（按 /proc/self/mounts 最长前缀匹配，挂载表只在首次调用时读取）。"""
+    for mount in _mount_points():
+        if mount == "/" or dir_path == mount or dir_path.startswith(mount + "/"):
+            return mount
+    return "/"
@@ -0,0 +1,380 @@
+import errno
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from watchdog.events import (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED, DirCreatedEvent,
+                             DirDeletedEvent, FileCreatedEvent, FileDeletedEvent, FileSystemEventHandler)
+from watchdog.observers import Observer
+from .logger import logger
+from .scanner import scan_tree
+from .polling_observer import MtimePollingObserver
+from . import metrics
+
+INOTIFY = "inotify"
+POLLING = "polling"
+
+_MAX_USER_WATCHES = "/proc/sys/fs/inotify/max_user_watches"
+# 自动预算只占用系统上限的这一比例，给其他进程和监控期间新建的目录留余量
+_AUTO_BUDGET_RATIO = 0.8
+
+# 轮询参数：(轮询周期秒数, 热目录秒数, 冷目录轮转周期数)
+PollParams = Tuple[float, float, int]
+
+
+def inotify_watch_limit() -> int:
+    """读取 fs.inotify.max_user_watches，读不到（非 Linux）时返回 0。"""
+    try:
+        with open(_MAX_USER_WATCHES, "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def _contains(root: str, path: str) -> bool:
+    return path == root or path.startswith(root + '/')
+
+
+class _Relay(FileSystemEventHandler):
+    """挂在每个物理监控上的转发器：事件统一交给 ObserverManager 按路径分发。"""
+
+    def __init__(self, manager: "ObserverManager", mode: str):
+        self.manager = manager
+        self.mode = mode
+
+    def dispatch(self, event):
+        self.manager.on_event(self.mode, event)
+
+
+class _ChildWatch:
+    """一个物理监控（inotify 或轮询）：监控根目录，或 inotify 预算不足时被拆分的根目录下的一个一级子目录。"""
+    __slots__ = ("path", "kind", "handle", "dirs", "last_active", "params")
+
+    def __init__(self, path: str, kind: str, handle, dirs: int, last_active: float,
+                 params: Optional[PollParams] = None):
+        self.path = path
+        self.kind = kind
+        self.handle = handle
+        self.dirs = dirs
+        self.last_active = last_active
+        # 轮询监控所在的轮询观察者参数
+        self.params = params
+
+
+class ObserverManager:
+    """所有监控配置共用的观察者管理器，接口与 watchdog Observer 的 start/stop/join/is_alive 一致。
+
+    不同监控配置的同一目录（或被另一个监控目录包含的目录）只建立一个物理监控，事件按路径分发给所有包含它的
+    处理器。inotify 每个目录占用一个 watch，管理器按预算（默认 fs.inotify.max_user_watches 的 80%）分配：
+    整棵树放得下时递归监控根目录；放不下时根目录本身只做非递归监控，一级子目录按最近修改时间从热到冷依次
+    分配递归 inotify，预算用完后剩下的冷子目录改用 mtime 轮询。监控期间新增的子目录同样按预算分配，
+    预算被目录增长耗尽时把最冷的 inotify 子目录转为轮询。
+    运行期间可以 add/remove 处理器（配置热加载），再调用 refresh 只增删受影响的物理监控。
+    """
+
+    def __init__(self, budget: int = 0, max_workers: int = 4, default_poll: PollParams = (5.0, 300.0, 12)):
+        if budget <= 0:
+            limit = inotify_watch_limit()
+            budget = int(limit * _AUTO_BUDGET_RATIO) if limit else 0
+        # 0 表示不限（读不到系统上限时不做预算，也不为统计目录数额外遍历一次）
+        self.budget = budget
+        self.used = 0
+        self.max_workers = max_workers
+        self.default_poll = default_poll
+        self._registrations: Dict[str, List[Tuple[FileSystemEventHandler, List[str]]]] = {INOTIFY: [], POLLING: []}
+        self._poll_params: Dict[str, PollParams] = {}
+        self._inotify = Observer()
+        self._pollers: Dict[PollParams, MtimePollingObserver] = {}
+        # (模式, 监控根目录) -> 根目录的物理监控；被拆分的根目录 -> {一级子目录: 子目录监控}
+        self._roots: Dict[Tuple[str, str], _ChildWatch] = {}
+        self._split: Dict[str, Dict[str, _ChildWatch]] = {}
+        self._lock = threading.RLock()
+        self._started = False
+
+    # ---------- 注册 ----------
+    def add(self, handler: FileSystemEventHandler, path: str, mode: str = INOTIFY,
+            poll_params: Optional[PollParams] = None):
+        """登记一个处理器要监控的目录；mode 为 polling 时该目录始终轮询，poll_params 同时用作预算不足时的轮询参数。"""
+        path = os.path.abspath(path).rstrip('/') or '/'
+        with self._lock:
+            for registered, roots in self._registrations[mode]:
+                if registered is handler:
+                    roots.append(path)
+                    break
+            else:
+                self._registrations[mode].append((handler, [path]))
+            if poll_params is not None:
+                self._poll_params.setdefault(path, poll_params)
+
+    def remove(self, handler: FileSystemEventHandler):
+        """撤销一个处理器登记的全部目录。运行中调用时需再调用 refresh 使物理监控生效。"""
+        with self._lock:
+            for mode in self._registrations:
+                self._registrations[mode] = [(h, roots) for h, roots in self._registrations[mode] if h is not handler]
+            live = {p for registrations in self._registrations.values() for _, paths in registrations for p in paths}
+            for path in [p for p in self._poll_params if p not in live]:
+                del self._poll_params[path]
+
+    def refresh(self):
+        """运行中增删处理器之后调用：停止不再需要的物理监控，为新出现的根目录建立监控，其余监控保持不动。"""
+        with self._lock:
+            if not self._started:
+                return
+            for mode in (POLLING, INOTIFY):
+                wanted = self._watch_roots(mode)
+                for (m, root), watch in list(self._roots.items()):
+                    # 轮询参数变化的根目录需要换到对应的轮询观察者上
+                    if m == mode and (root not in wanted or
+                                      watch.kind == POLLING and watch.params != self._params_for(root)):
+                        self._unwatch_root(mode, root)
+                        logger.info(f"  - 停止监控：{root}")
+                for root in wanted:
+                    if (mode, root) not in self._roots:
+                        self._watch_root(mode, root)
+            self._update_metrics()
+
+    def _watch_roots(self, mode: str) -> List[str]:
+        """去重后的物理监控根目录：相同目录只保留一个，被其他根目录包含的目录不再单独监控。"""
+        roots: List[str] = []
+        for path in sorted({p for _, paths in self._registrations[mode] for p in paths}, key=len):
+            if not any(_contains(root, path) for root in roots):
+                roots.append(path)
+        return roots
+
+    def _params_for(self, path: str) -> PollParams:
+        for root, params in self._poll_params.items():
+            if _contains(root, path):
+                return params
+        return self.default_poll
+
+    @property
+    def watch_count(self) -> int:
+        with self._lock:
+            return len(self._roots) + sum(len(children) for children in self._split.values())
+
+    # ---------- 启动与停止 ----------
+    def start(self):
+        # 先启动 inotify 观察者：之后每次 schedule 会立即添加 watch，超出系统上限时能当场捕获并改为轮询
+        self._inotify.start()
+        self._started = True
+        with self._lock:
+            for mode in (POLLING, INOTIFY):
+                for root in self._watch_roots(mode):
+                    self._watch_root(mode, root)
+            self._update_metrics()
+        if self.budget:
+            logger.info(f"inotify 监控预算：已用约 {self.used} / {self.budget}")
+
+    def is_alive(self) -> bool:
+        return self._started and (self._inotify.is_alive() or any(p.is_alive() for p in self._pollers.values()))
+
+    def stop(self):
+        self._inotify.stop()
+        for poller in self._pollers.values():
+            poller.stop()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._inotify.is_alive():
+            self._inotify.join(timeout)
+        for poller in self._pollers.values():
+            if poller.is_alive():
+                poller.join(timeout)
+
+    # ---------- 预算分配 ----------
+    def _survey(self, root: str) -> Tuple[int, Dict[str, List[float]]]:
+        """统计 root 子树的目录数（即递归 inotify 需要的 watch 数），以及各一级子目录的 [目录数, 最近修改时间]。"""
+        total = 1
+        children: Dict[str, List[float]] = {}
+        prefix = root.rstrip('/') + '/'
+        for _, dir_entries, _ in scan_tree(root, self.max_workers):
+            for entry in dir_entries:
+                if entry.is_symlink():
+                    continue
+                # 每个非根目录恰好作为其上级目录的一个子目录条目出现一次
+                total += 1
+                state = children.setdefault(prefix + entry.path[len(prefix):].split('/', 1)[0], [0, 0.0])
+                state[0] += 1
+                try:
+                    state[1] = max(state[1], entry.stat(follow_symlinks=False).st_mtime)
+                except OSError:
+                    continue
+        return total, children
+
+    def _schedule_inotify(self, path: str, recursive: bool, mode: str):
+        """添加 inotify 监控，超出系统 watch 上限时返回 None。"""
+        try:
+            return self._inotify.schedule(_Relay(self, mode), path, recursive=recursive)
+        except OSError as e:
+            if e.errno not in (errno.ENOSPC, errno.EMFILE):
+                raise
+            logger.warning(f"inotify watch 已达系统上限，改为轮询：{path} - {str(e)}")
+            # 实际上限比预算估计的更紧，之后的目录都不再尝试 inotify
+            self.budget = self.used = max(self.used, 1)
+            return None
+
+    def _schedule_polling(self, path: str, mode: str) -> Tuple[object, PollParams]:
+        params = self._params_for(path)
+        poller = self._pollers.get(params)
+        if poller is None:
+            poller = self._pollers[params] = MtimePollingObserver(*params, max_workers=self.max_workers)
+            poller.start()
+        return poller.schedule(_Relay(self, mode), path, recursive=True), params
+
+    def _polling_watch(self, path: str, mode: str, dirs: int = 0, last_active: float = 0.0) -> _ChildWatch:
+        handle, params = self._schedule_polling(path, mode)
+        return _ChildWatch(path, POLLING, handle, dirs, last_active, params)
+
+    def _unschedule(self, watch: _ChildWatch):
+        if watch.kind == INOTIFY:
+            try:
+                self._inotify.unschedule(watch.handle)
+            except KeyError:
+                pass
+            self.used = max(0, self.used - watch.dirs)
+        else:
+            self._pollers[watch.params].unschedule(watch.handle)
+
+    def _watch_root(self, mode: str, root: str):
+        if mode == POLLING:
+            self._roots[(mode, root)] = self._polling_watch(root, POLLING)
+            logger.info(f"  - 轮询监控：{root}")
+        else:
+            self._watch_inotify_root(root)
+
+    def _unwatch_root(self, mode: str, root: str):
+        for child in list(self._split.get(root, {}) if mode == INOTIFY else ()):
+            self._release(root, child)
+        if mode == INOTIFY:
+            self._split.pop(root, None)
+        self._unschedule(self._roots.pop((mode, root)))
+
+    def _fits(self, dirs: int) -> bool:
+        return not self.budget or self.used + dirs <= self.budget
+
+    def _watch_inotify_root(self, root: str):
+        key = (INOTIFY, root)
+        if not self.budget:
+            handle = self._schedule_inotify(root, True, INOTIFY)
+            if handle is not None:
+                self._roots[key] = _ChildWatch(root, INOTIFY, handle, 0, 0.0)
+                logger.info(f"  - inotify 监控：{root}")
+                return
+        total, children = self._survey(root)
+        handle = self._schedule_inotify(root, True, INOTIFY) if self._fits(total) else None
+        if handle is not None:
+            self.used += total
+            self._roots[key] = _ChildWatch(root, INOTIFY, handle, total, 0.0)
+            logger.info(f"  - inotify 监控：{root}（{total} 个目录）")
+            return
+        # 预算不足：根目录只监控自身（新增/删除一级子目录），一级子目录从热到冷分配
+        handle = self._schedule_inotify(root, False, INOTIFY)
+        if handle is None:
+            self._roots[key] = self._polling_watch(root, INOTIFY)
+            return
+        self.used += 1
+        self._roots[key] = _ChildWatch(root, INOTIFY, handle, 1, 0.0)
+        self._split[root] = {}
+        polled = 0
+        for child, (dirs, mtime) in sorted(children.items(), key=lambda c: c[1][1], reverse=True):
+            if self._adopt(root, child, int(dirs), mtime) == POLLING:
+                polled += 1
+        logger.warning(f"  - inotify 预算不足：{root} 共 {total} 个目录，{len(children) - polled} 个一级子目录使用 inotify，"
+                       f"最冷的 {polled} 个改为轮询")
+
+    def _adopt(self, root: str, child: str, dirs: int, mtime: float) -> str:
+        handle = None
+        if self._fits(dirs):
+            handle = self._schedule_inotify(child, True, INOTIFY)
+        if handle is not None:
+            self.used += dirs
+            self._split[root][child] = _ChildWatch(child, INOTIFY, handle, dirs, mtime)
+            return INOTIFY
+        self._split[root][child] = self._polling_watch(child, INOTIFY, dirs, mtime)
+        return POLLING
+
+    def _release(self, root: str, child: str):
+        watch = self._split[root].pop(child, None)
+        if watch is not None:
+            self._unschedule(watch)
+
+    def _demote_coldest(self):
+        """监控期间目录增长耗尽了预算：把最冷的 inotify 子目录转为轮询。"""
+        candidates = [(w.last_active, root, w) for root, children in self._split.items()
+                      for w in children.values() if w.kind == INOTIFY]
+        if not candidates:
+            logger.warning(f"inotify 监控目录数已超出预算（约 {self.used} / {self.budget}），且没有可转为轮询的子目录")
+            return
+        _, root, watch = min(candidates, key=lambda c: c[0])
+        self._release(root, watch.path)
+        self._split[root][watch.path] = self._polling_watch(watch.path, INOTIFY, watch.dirs, watch.last_active)
+        logger.warning(f"inotify 预算不足，最冷的子目录改为轮询：{watch.path}（{watch.dirs} 个目录）")
+
+    def _track(self, event):
+        """根据目录事件维护预算：拆分根目录下一级子目录的增删改名，以及递归 inotify 子树中的目录增减。"""
+        paths = [event.src_path] + ([event.dest_path] if event.event_type == EVENT_TYPE_MOVED else [])
+        now = time.time()
+        for root, children in self._split.items():
+            for path in paths:
+                watch = children.get(path) or next((w for p, w in children.items() if _contains(p, path)), None)
+                if watch is not None:
+                    watch.last_active = now
+        if not event.is_directory:
+            return
+        for root, children in self._split.items():
+            if event.event_type in (EVENT_TYPE_DELETED, EVENT_TYPE_MOVED) and os.path.dirname(event.src_path) == root:
+                self._release(root, event.src_path)
+            new_path = event.dest_path if event.event_type == EVENT_TYPE_MOVED else event.src_path
+            if event.event_type in (EVENT_TYPE_CREATED, EVENT_TYPE_MOVED) and os.path.dirname(new_path) == root \
+                    and new_path not in children and os.path.isdir(new_path):
+                dirs = self._survey(new_path)[0] if self.budget else 0
+                self._adopt(root, new_path, dirs, now)
+                return
+        if not self.budget:
+            return
+        # 递归 inotify 子树中新增/删除的目录会由 watchdog 自动增删 watch，这里只做估算
+        watch = next((w for (mode, root), w in self._roots.items() if mode == INOTIFY and w.kind == INOTIFY
+                      and root not in self._split and _contains(root, event.src_path)), None) or next(
+            (w for children in self._split.values() for p, w in children.items()
+             if w.kind == INOTIFY and _contains(p, event.src_path)), None)
+        if watch is not None:
+            if event.event_type == EVENT_TYPE_CREATED:
+                self.used += 1
+                watch.dirs += 1
+            elif event.event_type == EVENT_TYPE_DELETED:
+                self.used = max(0, self.used - 1)
+                watch.dirs = max(0, watch.dirs - 1)
+        if self.used > self.budget:
+            self._demote_coldest()
+
+    # ---------- 事件分发 ----------
+    def on_event(self, mode: str, event):
+        with self._lock:
+            if mode == INOTIFY:
+                try:
+                    self._track(event)
+                    self._update_metrics()
+                except Exception as e:
+                    logger.error(f"监控预算维护失败：{event} - {str(e)}", exc_info=True)
+        for handler, roots in self._registrations[mode]:
+            delivered = event
+            if event.event_type == EVENT_TYPE_MOVED:
+                src_in = any(_contains(r, event.src_path) for r in roots)
+                dest_in = any(_contains(r, event.dest_path) for r in roots)
+                # 只有一端在该处理器的监控范围内：对它而言相当于删除或新建
+                if src_in and not dest_in:
+                    delivered = (DirDeletedEvent if event.is_directory else FileDeletedEvent)(event.src_path)
+                elif dest_in and not src_in:
+                    delivered = (DirCreatedEvent if event.is_directory else FileCreatedEvent)(event.dest_path)
+                elif not src_in:
+                    continue
+            elif not any(_contains(r, event.src_path) for r in roots):
+                continue
+            try:
+                handler.dispatch(delivered)
+            except Exception as e:
+                logger.error(f"监控事件分发失败：{delivered} - {str(e)}", exc_info=True)
+
+    def _update_metrics(self):
+        metrics.OBSERVER_WATCHES.set(self.used, kind="inotify_dirs")
+        metrics.OBSERVER_WATCHES.set(self.budget, kind="inotify_budget")
+        metrics.OBSERVER_WATCHES.set(sum(len(p.emitters) for p in self._pollers.values()), kind="polling_subtrees")
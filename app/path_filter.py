@@ -0,0 +1,124 @@
+import fnmatch
+import os
+import re
+from typing import List, Optional, Pattern, Tuple
+from .logger import logger
+
+VIDEO = "video"
+METADATA = "metadata"
+
+
+def _compile_rules(patterns: List[str]) -> Tuple[List[Pattern], List[Pattern]]:
+    """把规则列表编译为 (按名称匹配的正则列表, 按相对路径匹配的正则列表)。
+
+    "re:" 开头的是正则表达式，其余是通配符；包含 "/" 的规则匹配相对 library_dir 的路径，否则只匹配文件/目录名。
+    同一类的通配符合并成一个正则；正则规则可能带 (?i) 等全局标志，无法合并，各自单独编译。
+    """
+    name_globs, path_globs, name_res, path_res = [], [], [], []
+    for pattern in patterns or []:
+        pattern = str(pattern)
+        if pattern.startswith("re:"):
+            regex = pattern[3:]
+            try:
+                compiled = re.compile(regex)
+            except re.error as e:
+                raise ValueError(f"过滤规则正则错误：{pattern} - {str(e)}")
+            (path_res if "/" in regex else name_res).append(compiled)
+        else:
+            pattern = pattern.strip("/")
+            (path_globs if "/" in pattern else name_globs).append(fnmatch.translate(pattern))
+    if name_globs:
+        name_res.insert(0, re.compile("^(?:" + "|".join(name_globs) + ")"))
+    if path_globs:
+        path_res.insert(0, re.compile("^(?:" + "|".join(path_globs) + ")"))
+    return name_res, path_res
+
+
+def _matches(patterns: List[Pattern], text: str) -> bool:
+    # 通配符转换结果以 ^ 开头、\Z 结尾，即整体匹配；正则规则按 search 语义（需要时自行写 ^/$）
+    return any(pattern.search(text) for pattern in patterns)
+
+
+def file_ext(name: str) -> str:
+    """与 os.path.splitext(name)[1].lower() 结果相同，但只做一次 rfind。"""
+    i = name.rfind(".")
+    if i <= 0:
+        return ""
+    # splitext 不把开头连续的点视为后缀（例如 "..nfo"）
+    if not name[:i].strip("."):
+        return ""
+    return name[i:].lower()
+
+
+class PathFilter:
+    """单个监控配置的文件过滤规则：后缀分类、include/exclude 规则和视频最小体积，启动时编译一次，
+    全量扫描、同步清理和实时监控共用。
+
+    exclude 同时作用于目录和文件，命中的目录在扫描时整棵子树跳过（不会被列出）；include 只作用于文件，
+    非空时只处理命中的文件。被排除的源文件视为不存在，目标目录中对应的旧文件会在同步清理时删除。
+    """
+
+    def __init__(self, monitor_conf: dict, library_dir: str):
+        self.library_dir = os.path.abspath(library_dir).rstrip('/') + '/'
+        self.video_exts = frozenset(ext.lower() for ext in monitor_conf.get("video_extensions", []))
+        self.metadata_exts = frozenset(ext.lower() for ext in monitor_conf.get("metadata_extensions", []))
+        self._exclude_name, self._exclude_path = _compile_rules(monitor_conf.get("exclude", []))
+        self._include_name, self._include_path = _compile_rules(monitor_conf.get("include", []))
+        self._has_include = bool(monitor_conf.get("include"))
+        try:
+            self.min_video_size = int(float(monitor_conf.get("min_video_size_mb", 0)) * 1024 * 1024)
+        except (ValueError, TypeError):
+            self.min_video_size = 0
+        # 规则完全相同的监控配置可以共享同一棵源目录快照
+        self.key = (self.library_dir, tuple(monitor_conf.get("exclude", []) or []))
+        self.prunes = bool(self._exclude_name or self._exclude_path)
+
+    def _rel(self, path: str) -> str:
+        return path[len(self.library_dir):] if path.startswith(self.library_dir) else os.path.relpath(path, self.library_dir)
+
+    def _excluded(self, path: str, name: str) -> bool:
+        if _matches(self._exclude_name, name):
+            return True
+        return bool(self._exclude_path) and _matches(self._exclude_path, self._rel(path))
+
+    def kind(self, path: str) -> Optional[str]:
+        """按后缀分类：VIDEO、METADATA 或 None（不处理）。"""
+        ext = file_ext(os.path.basename(path))
+        if ext in self.video_exts:
+            return VIDEO
+        if ext in self.metadata_exts:
+            return METADATA
+        return None
+
+    def prune_dir(self, dir_path: str) -> bool:
+        """目录是否被排除（整棵子树都不进入）。"""
+        dir_path = dir_path.rstrip('/')
+        return self._excluded(dir_path, os.path.basename(dir_path))
+
+    def accept_file(self, path: str, kind: Optional[str] = None, size: Optional[int] = None) -> bool:
+        """文件名是否通过 include/exclude 规则；传入 size 时同时检查视频最小体积。"""
+        name = os.path.basename(path)
+        if self._excluded(path, name):
+            return False
+        if self._has_include:
+            if not (_matches(self._include_name, name) or
+                    (self._include_path and _matches(self._include_path, self._rel(path)))):
+                return False
+        if size is not None and kind == VIDEO and size < self.min_video_size:
+            logger.debug(f"视频小于最小体积，跳过：{path}（{size} 字节）")
+            return False
+        return True
+
+    def excluded_path(self, path: str, is_dir: bool = False) -> bool:
+        """实时事件用：路径本身或它的任一上级目录被排除（逐级检查 library_dir 以下的部分）。"""
+        path = path.rstrip('/')
+        rel = self._rel(path)
+        parts = rel.split('/')
+        current = self.library_dir.rstrip('/')
+        for part in parts[:-1]:
+            current = f"{current}/{part}"
+            if self._excluded(current, part):
+                return True
+        if is_dir:
+            return self._excluded(path, parts[-1])
+        return not self.accept_file(path)
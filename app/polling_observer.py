@@ -0,0 +1,230 @@
+import os
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from watchdog.events import (DirCreatedEvent, DirDeletedEvent, DirMovedEvent, FileCreatedEvent,
+                             FileDeletedEvent, FileModifiedEvent, FileSystemEventHandler)
+from .logger import logger
+from .scanner import scan_tree
+from . import metrics
+
+
+class _DirState:
+    __slots__ = ("mtime_ns", "ino", "files", "subdirs", "file_stats", "hot_until")
+
+    def __init__(self, st: os.stat_result, files: Set[str], subdirs: Set[str]):
+        self.mtime_ns = st.st_mtime_ns
+        self.ino = st.st_ino
+        self.files = files
+        self.subdirs = subdirs
+        # 只为热目录保存文件的 (size, mtime_ns)，用于发现原地修改；冷目录不保存以节省内存
+        self.file_stats: Optional[Dict[str, Tuple[int, int]]] = None
+        self.hot_until = 0.0
+
+
+class _PollingWatch:
+    """单个被监控根目录的增量快照。"""
+
+    def __init__(self, handler: FileSystemEventHandler, path: str, hot_seconds: float):
+        self.handler = handler
+        self.path = os.path.abspath(path).rstrip('/') or '/'
+        self.hot_seconds = hot_seconds
+        self.dirs: Dict[str, _DirState] = {}
+        self._cold_queue: Deque[str] = deque()
+        self.ready = False
+
+    def _list(self, dir_path: str) -> Tuple[os.stat_result, Set[str], Dict[str, os.stat_result]]:
+        metrics.record_fs_op("scandir", dir_path)
+        st = os.stat(dir_path)
+        files, subdirs = set(), {}
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs[entry.name] = entry.stat(follow_symlinks=False)
+                    else:
+                        files.add(entry.name)
+                except OSError:
+                    continue
+        return st, files, subdirs
+
+    def _add_subtree(self, root: str, max_workers: int, hot: bool):
+        """建立 root 子树的基线快照（不产生事件：新出现的目录只发一个目录创建事件，由处理器扫描整棵子树）。"""
+        now = time.monotonic()
+        for dir_path, dir_entries, file_entries in scan_tree(root, max_workers):
+            dir_path = dir_path.rstrip('/') or '/'
+            try:
+                st = os.stat(dir_path)
+            except OSError:
+                continue
+            state = _DirState(st, {f.name for f in file_entries},
+                              {d.name for d in dir_entries if not d.is_symlink()})
+            if hot:
+                state.hot_until = now + self.hot_seconds
+            self.dirs[dir_path] = state
+
+    def _drop_subtree(self, dir_path: str):
+        state = self.dirs.pop(dir_path, None)
+        if state is not None:
+            for name in state.subdirs:
+                self._drop_subtree(os.path.join(dir_path, name))
+
+    def _rekey_subtree(self, old_path: str, new_path: str):
+        state = self.dirs.pop(old_path, None)
+        if state is None:
+            return
+        self.dirs[new_path] = state
+        for name in state.subdirs:
+            self._rekey_subtree(os.path.join(old_path, name), os.path.join(new_path, name))
+
+    def baseline(self, max_workers: int):
+        self.dirs.clear()
+        self._add_subtree(self.path, max_workers, hot=False)
+        self.ready = True
+        logger.info(f"轮询监控基线已建立：{self.path}（{len(self.dirs)} 个目录）")
+
+    def poll(self, cold_cycles: int, max_workers: int):
+        hot_seconds = self.hot_seconds
+        now = time.monotonic()
+        hot = [d for d, s in self.dirs.items() if s.hot_until > now]
+        # 冷目录按轮转分摊到 cold_cycles 个周期内检查，每个周期只 stat 其中一部分
+        if not self._cold_queue:
+            self._cold_queue.extend(d for d, s in self.dirs.items() if s.hot_until <= now)
+        batch = math.ceil(len(self.dirs) / max(1, cold_cycles))
+        to_check = set(hot)
+        while self._cold_queue and batch > 0:
+            to_check.add(self._cold_queue.popleft())
+            batch -= 1
+
+        created, deleted, modified = [], [], []
+        removed_dirs: Dict[int, str] = {}
+        added_dirs: Dict[str, os.stat_result] = {}
+        for dir_path in sorted(to_check, key=lambda d: d.count('/')):
+            state = self.dirs.get(dir_path)
+            if state is None:
+                continue
+            is_hot = state.hot_until > now
+            metrics.record_fs_op("stat", dir_path)
+            try:
+                st = os.stat(dir_path)
+            except OSError:
+                # 目录本身消失由上级目录的比对负责
+                continue
+            if st.st_mtime_ns == state.mtime_ns and not is_hot:
+                continue
+            try:
+                st, files, subdirs = self._list(dir_path)
+            except OSError as e:
+                logger.debug(f"轮询列目录失败，下个周期重试：{dir_path} - {str(e)}")
+                continue
+            if st.st_mtime_ns != state.mtime_ns:
+                state.hot_until = now + hot_seconds
+            for name in files - state.files:
+                created.append(FileCreatedEvent(os.path.join(dir_path, name)))
+            for name in state.files - files:
+                deleted.append(FileDeletedEvent(os.path.join(dir_path, name)))
+            for name in state.subdirs - subdirs.keys():
+                sub_path = os.path.join(dir_path, name)
+                sub_state = self.dirs.get(sub_path)
+                removed_dirs[sub_state.ino if sub_state else -len(removed_dirs) - 1] = sub_path
+            for name in subdirs.keys() - state.subdirs:
+                added_dirs[os.path.join(dir_path, name)] = subdirs[name]
+            if state.hot_until > now:
+                # 热目录逐个比对文件 (size, mtime)，发现原地写入（例如大文件拷贝过程中）
+                stats = {}
+                for name in files:
+                    try:
+                        fst = os.stat(os.path.join(dir_path, name))
+                    except OSError:
+                        continue
+                    stats[name] = (fst.st_size, fst.st_mtime_ns)
+                    old = state.file_stats.get(name) if state.file_stats is not None else None
+                    if old is not None and old != stats[name]:
+                        modified.append(FileModifiedEvent(os.path.join(dir_path, name)))
+                state.file_stats = stats
+            else:
+                state.file_stats = None
+            state.mtime_ns, state.files, state.subdirs = st.st_mtime_ns, files, set(subdirs)
+
+        events = deleted
+        # 同一周期内 inode 相同的"删除+新增"目录即为移动/重命名，整体改键，交给处理器做一次性重命名
+        for new_path, sub_st in added_dirs.items():
+            old_path = removed_dirs.pop(sub_st.st_ino, None)
+            if old_path is not None:
+                self._rekey_subtree(old_path, new_path)
+                events.append(DirMovedEvent(old_path, new_path))
+            else:
+                # 处理器收到目录创建事件会扫描整棵子树，子树中的文件不再逐个发事件，避免重复处理
+                self._add_subtree(new_path, max_workers, hot=True)
+                events.append(DirCreatedEvent(new_path))
+        for old_path in removed_dirs.values():
+            self._drop_subtree(old_path)
+            events.append(DirDeletedEvent(old_path))
+        events.extend(created)
+        events.extend(modified)
+        for event in events:
+            try:
+                self.handler.dispatch(event)
+            except Exception as e:
+                logger.error(f"轮询事件分发失败：{event} - {str(e)}", exc_info=True)
+
+
+class MtimePollingObserver(threading.Thread):
+    """面向 FUSE/rclone 等收不到 inotify 事件的挂载的轮询观察者，接口与 watchdog Observer 的常用部分一致。
+
+    依靠目录 mtime 判断子目录是否有增删改名，未变化的目录不会重新列出；最近发生变化的"热"目录每个周期都检查
+    （并比对文件大小/修改时间以发现原地写入），其余"冷"目录分摊在 cold_cycles 个周期内轮转检查一遍。
+    """
+
+    def __init__(self, interval: float = 5.0, hot_seconds: float = 300.0, cold_cycles: int = 12,
+                 max_workers: int = 4):
+        super().__init__(name="ystrm-poll", daemon=True)
+        self.interval = max(0.5, interval)
+        self.hot_seconds = hot_seconds
+        self.cold_cycles = max(1, cold_cycles)
+        self.max_workers = max_workers
+        self._watches: List[_PollingWatch] = []
+        # 运行中也可以增删监控（由 ObserverManager 按 inotify 预算动态转入/移出轮询）
+        self._watches_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def emitters(self) -> List[_PollingWatch]:
+        return self._watches
+
+    def schedule(self, event_handler: FileSystemEventHandler, path: str, recursive: bool = True) -> _PollingWatch:
+        watch = _PollingWatch(event_handler, path, self.hot_seconds)
+        with self._watches_lock:
+            self._watches.append(watch)
+        return watch
+
+    def unschedule(self, watch: _PollingWatch):
+        with self._watches_lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while True:
+            with self._watches_lock:
+                watches = list(self._watches)
+            for watch in watches:
+                if self._stopped.is_set():
+                    return
+                if not watch.ready:
+                    # 新加入的监控先建立基线，下个周期开始比对；失败时下个周期重试
+                    try:
+                        watch.baseline(self.max_workers)
+                    except OSError as e:
+                        logger.error(f"轮询监控基线建立失败：{watch.path} - {str(e)}", exc_info=True)
+                    continue
+                try:
+                    watch.poll(self.cold_cycles, self.max_workers)
+                except Exception as e:
+                    logger.error(f"轮询监控失败：{watch.path} - {str(e)}", exc_info=True)
+            if self._stopped.wait(self.interval):
+                return
@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Dict, Optional
+from .config import global_config
+
+
+class TokenBucket:
+    """线程安全的令牌桶：以 rate 个/秒的速度补充令牌，最多积攒 capacity 个，允许短时突发。rate<=0 表示不限速。"""
+
+    def __init__(self, rate: float = 0.0, burst: float = 0.0):
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+
+    def configure(self, rate: float, burst: float = 0.0):
+        with self._lock:
+            self.rate = max(0.0, float(rate))
+            # 未指定突发容量时默认允许一秒的量（至少1个）
+            self.capacity = float(burst) if burst and burst > 0 else max(1.0, self.rate)
+            self._tokens = self.capacity
+            self._last = time.monotonic()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# 所有处理器共享的速率预算：files 为总文件处理速率，source_reads 限制读源（元数据复制），dest_writes 限制写目标（STRM生成）
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+# 本进程分到的速率比例：多进程全量任务中每个子进程只拿总速率的 1/进程数
+_share = 1.0
+
+
+def _configured_rates() -> Dict[str, float]:
+    return {
+        "files": global_config.files_per_second_limit * _share,
+        "source_reads": global_config.source_reads_per_second * _share,
+        "dest_writes": global_config.dest_writes_per_second * _share,
+    }
+
+
+def get_limiter(name: str) -> TokenBucket:
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = TokenBucket(_configured_rates()[name], global_config.rate_limit_burst * _share)
+        return limiter
+
+
+def configure_limiters(share: Optional[float] = None):
+    """按当前配置就地更新所有已创建的令牌桶（配置变更后调用）。share 为本进程分到的速率比例，不传时保持不变。"""
+    global _share
+    if share is not None:
+        _share = share
+    rates = _configured_rates()
+    with _limiters_lock:
+        for name, limiter in _limiters.items():
+            limiter.configure(rates[name], global_config.rate_limit_burst * _share)
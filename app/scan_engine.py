@@ -0,0 +1,183 @@
+import os
+import threading
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+from .logger import logger
+from .config import global_config
+from .scanner import scan_tree
+
+
+class SnapshotEntry:
+    """快照回放时代替 os.DirEntry 的轻量对象，stat 延迟到真正需要时才调用并缓存。"""
+    __slots__ = ("name", "path", "_stat")
+
+    def __init__(self, dir_path: str, name: str):
+        self.name = name
+        self.path = os.path.join(dir_path, name)
+        self._stat = None
+
+    def stat(self) -> os.stat_result:
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+class TreeSnapshot:
+    """单个根目录在本轮任务中的内存目录树：{目录路径: (子目录名列表, 文件名列表)}。
+
+    第一次遍历时边扫描边交给调用方并记录下来，之后的遍历直接在内存中回放，同一物理目录每轮只列一次。
+    各阶段对目录树的增删需通过 note_* 方法同步，保证后续阶段看到的是最新状态。
+    retain=False 时不记录，每次遍历都重新扫描（内存占用不随媒体库规模增长）。
+    prune 为排除规则，被排除的子目录不会被列出，也不出现在快照中。
+    """
+
+    def __init__(self, root: str, retain: bool = True, max_workers: int = 4,
+                 prune: Optional[Callable[[str], bool]] = None):
+        self.root = root.rstrip('/') or '/'
+        self.retain = retain
+        self.max_workers = max_workers
+        self.prune = prune
+        self.dirs: Dict[str, Tuple[List[str], List[str]]] = {}
+        # 扫描中被跳过的子目录，非空说明快照不完整，不能用来判断孤儿
+        self.errors: List[Tuple[str, OSError]] = []
+        self.complete = False
+        # 多个监控配置并行处理同一源根目录时，只有第一个遍历者扫描，其余的等它扫完后回放快照
+        self._scan_lock = threading.Lock()
+
+    def walk_entries(self) -> Iterator[Tuple[str, List]]:
+        """按目录产出 (目录路径, 文件条目列表)，首次遍历为流式扫描。"""
+        if self.retain and not self.complete:
+            with self._scan_lock:
+                if not self.complete:
+                    # 第一次遍历中断（快照不完整）时，等待者在这里重新扫描
+                    yield from self._scan_entries()
+                    return
+        if self.complete:
+            for dir_path, (_, files) in list(self.dirs.items()):
+                yield dir_path, [SnapshotEntry(dir_path, name) for name in files]
+            return
+        yield from self._scan_entries()
+
+    def _scan_entries(self) -> Iterator[Tuple[str, List]]:
+        self.dirs.clear()
+        self.errors = []
+        finished = False
+        try:
+            for root, dir_entries, file_entries in scan_tree(self.root, self.max_workers, errors=self.errors,
+                                                            prune=self.prune):
+                root = root.rstrip('/') or '/'
+                if self.retain:
+                    self.dirs[root] = ([d.name for d in dir_entries if not d.is_symlink()],
+                                       [f.name for f in file_entries])
+                yield root, file_entries
+            finished = True
+        finally:
+            # 中途中断（挂载丢失、调用方提前结束）的快照不完整，不能被后续阶段使用
+            self.complete = finished and self.retain
+            if not self.complete:
+                self.dirs.clear()
+
+    def walk(self, topdown: bool = True) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """与 os.walk 相同形式的遍历：(目录路径, 子目录名列表, 文件名列表)。bottom-up 时子目录先于父目录。"""
+        if not self.retain:
+            if topdown:
+                self.errors = []
+                for root, dir_entries, file_entries in scan_tree(self.root, self.max_workers, errors=self.errors,
+                                                                prune=self.prune):
+                    yield (root.rstrip('/') or '/', [d.name for d in dir_entries if not d.is_symlink()],
+                           [f.name for f in file_entries])
+            else:
+                self.errors = []
+                for root, dirs, files in os.walk(self.root, topdown=False,
+                                                 onerror=lambda e: self.errors.append((e.filename, e))):
+                    if self.prune is not None and root != self.root and self._pruned(root):
+                        continue
+                    yield root, [d for d in dirs if self.prune is None or not self.prune(os.path.join(root, d))], files
+            return
+        if not self.complete:
+            for _ in self.walk_entries():
+                pass
+        for dir_path in sorted(self.dirs, key=lambda d: d.count('/'), reverse=not topdown):
+            children = self.dirs.get(dir_path)
+            if children is not None:
+                yield dir_path, children[0], children[1]
+
+    def subtree(self, root: str) -> "TreeSnapshot":
+        """从已完成的快照中截取子树视图（共享同一份目录列表），用于重叠的源目录。"""
+        sub = TreeSnapshot(root, self.retain, self.max_workers, self.prune)
+        prefix = sub.root + '/'
+        sub.dirs = {d: c for d, c in self.dirs.items() if d == sub.root or d.startswith(prefix)}
+        sub.errors = [(d, e) for d, e in self.errors if d.startswith(prefix)]
+        sub.complete = True
+        return sub
+
+    def _pruned(self, path: str) -> bool:
+        # os.walk 自底向上无法提前剪枝，逐级检查根目录以下的各级目录
+        while path != self.root and path.startswith(self.root):
+            if self.prune(path):
+                return True
+            path = os.path.dirname(path)
+        return False
+
+    def contains(self, path: str) -> bool:
+        return path == self.root or path.startswith(self.root.rstrip('/') + '/')
+
+    def note_file_added(self, path: str):
+        children = self.dirs.get(os.path.dirname(path))
+        if children is not None and os.path.basename(path) not in children[1]:
+            children[1].append(os.path.basename(path))
+
+    def note_removed(self, path: str, is_dir: bool = False):
+        path = path.rstrip('/')
+        parent = self.dirs.get(os.path.dirname(path))
+        name = os.path.basename(path)
+        if parent is not None:
+            names = parent[0] if is_dir else parent[1]
+            if name in names:
+                names.remove(name)
+        if is_dir:
+            prefix = path + '/'
+            for d in [d for d in self.dirs if d == path or d.startswith(prefix)]:
+                del self.dirs[d]
+
+
+class ScanEngine:
+    """一轮全量任务共用的扫描引擎：每个不同的源根目录和目标根目录只列一次，快照在各处理器与清理器之间共享。"""
+
+    def __init__(self, retain: Optional[bool] = None, max_workers: Optional[int] = None):
+        self.retain = global_config.unified_scan if retain is None else retain
+        self.max_workers = global_config.scan_workers if max_workers is None else max_workers
+        self._snapshots: Dict[Tuple[str, Hashable], TreeSnapshot] = {}
+        # 不同挂载的源目录在各自线程中并行处理，快照表需要加锁
+        self._lock = threading.Lock()
+
+    def tree(self, root: str, path_filter=None) -> TreeSnapshot:
+        """返回根目录的快照。传入 PathFilter 时按其排除规则剪枝，规则相同的调用方共享同一份快照。"""
+        root = os.path.abspath(root).rstrip('/') or '/'
+        prunes = path_filter is not None and path_filter.prunes
+        key = (root, path_filter.key if prunes else None)
+        with self._lock:
+            return self._tree(key, path_filter.prune_dir if prunes else None)
+
+    def _tree(self, key: Tuple[str, Hashable], prune: Optional[Callable[[str], bool]]) -> TreeSnapshot:
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None:
+            return snapshot
+        root, rules = key
+        if self.retain:
+            for (other_root, other_rules), other in self._snapshots.items():
+                if other_rules == rules and other.complete and other.contains(root) and root in other.dirs:
+                    logger.debug(f"复用上级目录快照：{root} ⊂ {other_root}")
+                    snapshot = self._snapshots[key] = other.subtree(root)
+                    return snapshot
+        snapshot = self._snapshots[key] = TreeSnapshot(root, self.retain, self.max_workers, prune)
+        return snapshot
+
+    def note_file_added(self, path: str):
+        for snapshot in self._snapshots.values():
+            if snapshot.complete and snapshot.contains(path):
+                snapshot.note_file_added(path)
+
+    def note_removed(self, path: str, is_dir: bool = False):
+        for snapshot in self._snapshots.values():
+            if snapshot.complete and snapshot.contains(path):
+                snapshot.note_removed(path, is_dir)
@@ -0,0 +1,144 @@
+import os
+import errno
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from .logger import logger
+from .config import global_config
+from .circuit_breaker import get_breaker, is_mount_error
+from . import metrics
+
+_DONE = object()
+
+
+class _ScanError:
+    def __init__(self, error: OSError):
+        self.error = error
+
+
+def _list_dir(dir_path: str, stop: threading.Event, active: Optional[Dict[str, float]] = None
+              ) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """列出单个目录，返回 (子目录, 文件)。挂载级错误计入该挂载的熔断器，等挂载恢复后重试，与逐文件处理的策略一致。
+    传入 active 时，列目录期间在其中登记 {目录: 开始时间}，供调用方发现卡住不返回的列目录。"""
+    breaker = get_breaker(dir_path)
+    while True:
+        if not breaker.wait_until_available(stop):
+            raise OSError(errno.ENOTCONN, "扫描已中止，挂载不可用", dir_path)
+        if active is not None:
+            active[dir_path] = time.monotonic()
+        try:
+            dirs, files = [], []
+            metrics.record_fs_op("scandir", dir_path)
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    (dirs if is_dir else files).append(entry)
+            breaker.record_success()
+            return dirs, files
+        except OSError as e:
+            if not is_mount_error(e) or stop.is_set():
+                raise
+            logger.warning(f"列目录时检测到挂载连接丢失，等待挂载恢复后重试。出错目录: {dir_path} - {str(e)}")
+            breaker.record_failure(e)
+        finally:
+            if active is not None:
+                active.pop(dir_path, None)
+
+
+def scan_tree(root: str, max_workers: int = 4, queue_size: int = 256,
+              errors: Optional[List[Tuple[str, OSError]]] = None,
+              prune: Optional[Callable[[str], bool]] = None, stall_timeout: Optional[float] = None
+              ) -> Iterator[Tuple[str, List[os.DirEntry], List[os.DirEntry]]]:
+    """流式并行遍历目录树，按目录逐个产出 (目录路径, 子目录DirEntry列表, 文件DirEntry列表)。
+
+    兄弟目录由有界线程池并发列出（高延迟的 FUSE/网络挂载上效果明显），结果经有界队列边发现边交给调用方，
+    内存占用只与待处理的目录前沿有关，而与媒体库规模无关。根目录本身无法列出时直接抛出 OSError；
+    子目录列出失败只记录日志并跳过该子树（与 os.walk 的默认行为一致），传入 errors 时会追加 (目录, 异常)，
+    便于调用方判断结果是否完整。不进入指向目录的符号链接。
+    传入 prune 时，prune(子目录路径) 为真的子目录既不列出也不出现在产出的子目录列表中（整棵子树跳过）。
+    某个目录列了 stall_timeout 秒（默认取 scan_stall_timeout_seconds）仍未返回时，视为挂载卡死，抛出 ETIMEDOUT
+    并记入该挂载的熔断器；卡住的线程无法中止，只是不再等待它。
+    """
+    if stall_timeout is None:
+        stall_timeout = global_config.scan_stall_timeout
+    active: Dict[str, float] = {}
+    results: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    pending = [0]
+    pending_lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="ystrm-scan")
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def submit(dir_path: str):
+        with pending_lock:
+            pending[0] += 1
+        executor.submit(worker, dir_path)
+
+    def worker(dir_path: str):
+        try:
+            if stop.is_set():
+                return
+            try:
+                dirs, files = _list_dir(dir_path, stop, active)
+            except OSError as e:
+                if dir_path == root:
+                    put(_ScanError(e))
+                else:
+                    logger.error(f"列目录失败，已跳过该子目录：{dir_path} - {str(e)}")
+                    if errors is not None:
+                        errors.append((dir_path, e))
+                return
+            if stop.is_set():
+                # 卡住的列目录在扫描结束后才返回
+                return
+            if prune is not None:
+                dirs = [d for d in dirs if not prune(d.path)]
+            for d in dirs:
+                if not d.is_symlink():
+                    submit(d.path)
+            put((dir_path, dirs, files))
+        except Exception as e:
+            logger.error(f"扫描线程发生未知错误：{dir_path} - {str(e)}", exc_info=True)
+        finally:
+            with pending_lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                put(_DONE)
+
+    def check_stall():
+        now = time.monotonic()
+        for dir_path, started in list(active.items()):
+            if now - started >= stall_timeout:
+                error = OSError(errno.ETIMEDOUT, f"列目录超过 {stall_timeout:g} 秒未返回，挂载疑似卡死", dir_path)
+                get_breaker(dir_path).record_failure(error)
+                raise error
+
+    submit(root)
+    try:
+        while True:
+            try:
+                item = results.get(timeout=1.0 if stall_timeout else None)
+            except queue.Empty:
+                check_stall()
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _ScanError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
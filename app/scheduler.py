@@ -0,0 +1,164 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Set
+from .logger import logger
+
+_ALIASES = {
+    "@yearly": "0 0 1 1 *", "@annually": "0 0 1 1 *", "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0", "@daily": "0 0 * * *", "@midnight": "0 0 * * *", "@hourly": "0 * * * *",
+}
+_MONTH_NAMES = {n: i + 1 for i, n in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])}
+_DOW_NAMES = {n: i for i, n in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+
+
+def _parse_value(text: str, names: dict) -> int:
+    text = text.lower()
+    if text in names:
+        return names[text]
+    return int(text)
+
+
+def _parse_field(field: str, low: int, high: int, names: dict) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"步长必须为正数：{field}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = _parse_value(start_text, names), _parse_value(end_text, names)
+        else:
+            start = _parse_value(part, names)
+            # "5/15" 表示从 5 开始每 15 个单位
+            end = high if step > 1 else start
+        if not (low <= start <= high and low <= end <= high and start <= end):
+            raise ValueError(f"取值超出范围 {low}-{high}：{field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """标准五段式 Cron 表达式（分 时 日 月 周），支持 * , - / 、月份/星期英文缩写以及 @daily 等别名。
+
+    与 cron 一致：日 和 周 同时被限定时，两者满足其一即触发。能解析但永远不会触发的表达式（例如 2 月 31 日）
+    在创建时即抛出 ValueError。
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = _ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron 表达式需为 5 段（分 时 日 月 周）：{expression}")
+        self.minutes = _parse_field(fields[0], 0, 59, {})
+        self.hours = _parse_field(fields[1], 0, 23, {})
+        self.days = _parse_field(fields[2], 1, 31, {})
+        self.months = _parse_field(fields[3], 1, 12, _MONTH_NAMES)
+        # 0 和 7 都表示周日
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7, _DOW_NAMES)}
+        self._day_restricted = not fields[2].startswith("*")
+        self._weekday_restricted = not fields[4].startswith("*")
+        self.next_after(datetime.now())
+
+    def _day_matches(self, t: datetime) -> bool:
+        day_ok = t.day in self.days
+        weekday_ok = (t.isoweekday() % 7) in self.weekdays
+        if self._day_restricted and self._weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """返回严格晚于 after 的下一个触发时间（精确到分钟）。"""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after.year + 5
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron 表达式永远不会触发：{self.expression}")
+
+
+class TaskScheduler(threading.Thread):
+    """进程内定时器：按 Cron 表达式或手动触发（信号）调用 run_task(reason)，任务在本线程内依次执行。"""
+
+    def __init__(self, run_task: Callable[[str], None], schedule: Optional[CronSchedule] = None):
+        super().__init__(name="ystrm-scheduler", daemon=True)
+        self.run_task = run_task
+        self.schedule = schedule
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._rescheduled = False
+        self._triggers: List[str] = []
+
+    def trigger(self, reason: str = "manual"):
+        """请求立即执行一次任务。只设置标志位，可在信号处理函数中调用。"""
+        self._triggers.append(reason)
+        self._wakeup.set()
+
+    def reschedule(self, schedule: Optional[CronSchedule]):
+        """更换 Cron 表达式（配置热加载），None 表示停用定时执行，手动触发不受影响。"""
+        self.schedule = schedule
+        self._rescheduled = True
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def _next_run(self) -> Optional[datetime]:
+        """下一个定时触发时间。算不出时停用定时执行，本线程继续响应手动触发。"""
+        if self.schedule is None:
+            return None
+        try:
+            return self.schedule.next_after(datetime.now())
+        except ValueError as e:
+            logger.error(f"定时执行已停用，仅响应手动触发：{str(e)}")
+            return None
+
+    def run(self):
+        next_run = self._next_run()
+        if next_run:
+            logger.info(f"定时任务已启动（进程内调度）：{self.schedule.expression}，下次执行：{next_run:%Y-%m-%d %H:%M}")
+        while not self._stopped:
+            # 最多等待 60 秒就重新对时，系统时间调整后也能按时触发
+            timeout = 60.0 if next_run is None else min(60.0, max(0.0, (next_run - datetime.now()).total_seconds()))
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            if self._rescheduled:
+                self._rescheduled = False
+                next_run = self._next_run()
+                logger.info(f"定时任务已更新：{self.schedule.expression}，下次执行：{next_run:%Y-%m-%d %H:%M}"
+                            if next_run else "定时执行已停用")
+            reasons = []
+            while self._triggers:
+                reasons.append(self._triggers.pop(0))
+            if next_run is not None and datetime.now() >= next_run:
+                reasons.append("cron")
+                next_run = self._next_run()
+            if not reasons:
+                continue
+            try:
+                # 等待期间的多次触发合并为一次执行
+                self.run_task("+".join(dict.fromkeys(reasons)))
+            except Exception as e:
+                logger.error(f"定时任务执行失败：{str(e)}", exc_info=True)
+            if next_run is not None:
+                # 与 cron 一致：任务执行期间错过的触发点不补跑
+                if next_run <= datetime.now():
+                    next_run = self._next_run()
+                if next_run is not None:
+                    logger.info(f"下次定时执行：{next_run:%Y-%m-%d %H:%M}")
@@ -0,0 +1,264 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Set, Tuple
+from .logger import logger, set_progress_interval
+from .config import global_config
+from .file_processor import FileProcessor
+from .sync_cleaner import SyncCleaner, DestOrphans
+from .scan_engine import ScanEngine
+from .scanner import _list_dir
+from .state_index import defer_writes, DeferredWriteIndex
+from .change_feed import collect_changes, get_change_feed, ChangeCollector
+from .rate_limiter import configure_limiters
+from .circuit_breaker import is_mount_error
+from .fs_probe import get_probe
+
+# 多进程全量任务：文件处理按 监控配置/源目录/一级子目录 切成分片，由子进程并行处理，绕开单进程 GIL 的限制。
+# 分片有两种：源目录下的每个一级子目录各为一个“子树分片”；源目录本身的直接文件为一个“文件分片”，
+# 它同时检查目标目录中没有对应源子目录的部分。子进程以只读方式打开状态索引，写操作和变更记录都随分片结果
+# 交回主进程执行；子进程顺带检查分片对应的目标子树，只返回统计、孤儿文件和会变空的目录，
+# 清理阶段仍由主进程统一执行（删除前再确认一次源文件）。子进程内的 Prometheus 指标不会汇总到主进程。
+
+# 子进程内按监控配置缓存的处理器与清理器
+_workers: Dict[int, Tuple[FileProcessor, SyncCleaner]] = {}
+
+
+def _init_worker(processes: int, log_queue):
+    # 日志经队列交给主进程写出，多个进程不会同时轮转同一个日志文件
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.addHandler(QueueHandler(log_queue))
+    set_progress_interval(global_config.log_progress_interval)
+    defer_writes()
+    collect_changes()
+    # 各进程平分配置的速率，总速率不变
+    configure_limiters(1.0 / processes)
+
+
+def _worker_for(conf_index: int, conf: dict) -> Tuple[FileProcessor, SyncCleaner]:
+    # 监控配置随分片一起传入，不从子进程自己读到的配置文件中按下标取（配置文件可能已被热加载修改）
+    worker = _workers.get(conf_index)
+    if worker is None:
+        processor = FileProcessor(conf)
+        worker = _workers[conf_index] = (processor, SyncCleaner(conf, processor.path_filter))
+    return worker
+
+
+def _run_shard(conf_index: int, conf: dict, source_dir: str, top: Optional[str], scan_id: int,
+               known: bool, find_empty: bool, done_dirs: Set[str], checkpoint_age: float) -> dict:
+    """子进程中处理一个分片。top 为 None 时是源目录的文件分片，否则是 top 这棵一级子树。
+    done_dirs 为上次中断的扫描中分片内已处理完的目录；检查点写入随其他索引写操作一起交回主进程。"""
+    processor, cleaner = _worker_for(conf_index, conf)
+    stems: Set[Tuple[str, str]] = set()
+    subdirs: Set[str] = set()
+
+    def collect(batches):
+        # 边处理边记下源端的文件和目录，用于判断分片对应目标子树中的孤儿
+        for root, entries in batches:
+            if known:
+                rel_root = os.path.relpath(root, processor.library_dir)
+                subdirs.add(rel_root)
+                for entry in entries:
+                    if processor.path_filter.kind(entry.path) is not None and \
+                            processor.path_filter.accept_file(entry.path):
+                        stem, ext = os.path.splitext(os.path.join(rel_root, entry.name))
+                        stems.add((stem, ext.lower()))
+            yield root, entries
+
+    result = {"ok": True, "complete": True, "orphan_files": [], "empty_dirs": []}
+    try:
+        if top is None:
+            root = source_dir.rstrip('/')
+            dir_entries, file_entries = _list_dir(root, threading.Event())
+            for d in dir_entries:
+                if not d.is_symlink() and not (processor.path_filter.prunes and processor.path_filter.prune_dir(d.path)):
+                    subdirs.add(os.path.relpath(d.path, processor.library_dir))
+            tree = None
+            batches = [(root, file_entries)]
+        else:
+            root = top
+            tree = ScanEngine(retain=False).tree(top, processor.path_filter)
+            batches = tree.walk_entries()
+        processor.process_batches(source_dir, collect(batches), scan_id, done_dirs, checkpoint_age)
+        processor.writer.sync()
+        if tree is not None and tree.errors:
+            result["complete"] = False
+        dest_root = os.path.join(processor.dest_dir, os.path.relpath(root, processor.library_dir))
+        if (known or find_empty) and result["complete"] and os.path.isdir(dest_root):
+            result["orphan_files"], result["empty_dirs"] = cleaner.find_orphans(
+                dest_root, stems, subdirs, known, skip_subdirs=top is None)
+    except OSError as e:
+        if not is_mount_error(e):
+            raise
+        logger.critical(f"扫描目录时发现挂载丢失或卡死: {top or source_dir}。中止对此分片的处理。 - {str(e)}")
+        result["ok"] = False
+    finally:
+        result["stats"] = processor.take_stats()
+        index = processor.index
+        result["writes"] = index.take_writes() if isinstance(index, DeferredWriteIndex) else []
+        feed = get_change_feed()
+        result["changes"] = feed.take() if isinstance(feed, ChangeCollector) else []
+    return result
+
+
+class _ConfRun:
+    """主进程中一个监控配置在本轮多进程全量任务中的状态。"""
+
+    def __init__(self, conf_index: int, processor: FileProcessor, cleaner: SyncCleaner):
+        self.conf_index = conf_index
+        self.processor = processor
+        self.cleaner = cleaner
+        self.known = global_config.sync_source_dest and processor.index is None
+        self.orphans = DestOrphans(self.known)
+        self.completed = True
+        # 源目录 -> [scan_id, 未完成分片数, 是否全部成功]
+        self.sources: Dict[str, list] = {}
+        # 与单进程模式相同的可恢复扫描：源目录 -> 上次中断的扫描中已处理完的目录
+        self.checkpoint_age = global_config.checkpoint_max_age if processor.index is not None else 0
+        self.done_dirs: Dict[str, Set[str]] = {}
+
+    def plan(self) -> List[Tuple[str, Optional[str]]]:
+        """列出各源目录的一级子目录，得到分片 [(源目录, 子树根目录或 None)]。被其他源目录包含的源目录不单独处理。"""
+        shards = []
+        source_dirs = self.processor.source_dirs
+        for source_dir in source_dirs:
+            if any(other != source_dir and source_dir.startswith(other) for other in source_dirs):
+                continue
+            problem = get_probe().check_dir(source_dir)
+            if problem:
+                logger.warning(f"源目录不可用，跳过：{source_dir}（{problem}）")
+                self.completed = False
+                continue
+            try:
+                dir_entries, _ = _list_dir(source_dir.rstrip('/'), threading.Event())
+            except OSError as e:
+                logger.critical(f"开始扫描目录时即发现挂载丢失: {source_dir}。中止对此目录的处理。 - {str(e)}")
+                self.completed = False
+                continue
+            path_filter = self.processor.path_filter
+            tops = [d.path for d in dir_entries
+                    if not d.is_symlink() and not (path_filter.prunes and path_filter.prune_dir(d.path))]
+            index = self.processor.index
+            scan_id, done_dirs = index.begin_scan(source_dir, self.checkpoint_age) if index is not None else (0, set())
+            if done_dirs:
+                logger.info(f"从检查点继续上次中断的扫描：{source_dir}（跳过 {len(done_dirs)} 个已处理完的目录）")
+            self.sources[source_dir] = [scan_id, len(tops) + 1, True]
+            self.done_dirs[source_dir] = done_dirs
+            shards.append((source_dir, None))
+            shards.extend((source_dir, top) for top in tops)
+            self.orphans.roots.append(
+                os.path.join(self.processor.dest_dir, os.path.relpath(source_dir, self.processor.library_dir)).rstrip('/'))
+        return shards
+
+    def shard_done_dirs(self, source_dir: str, top: Optional[str]) -> Set[str]:
+        """只把分片自己范围内的已完成目录传给子进程：文件分片只有源目录本身，子树分片为 top 及其下级目录。"""
+        done_dirs = self.done_dirs.get(source_dir)
+        if not done_dirs:
+            return set()
+        if top is None:
+            root = source_dir.rstrip('/')
+            return {root} if root in done_dirs else set()
+        return {d for d in done_dirs if d == top or d.startswith(top + '/')}
+
+    def merge(self, source_dir: str, result: Optional[dict]):
+        state = self.sources[source_dir]
+        state[1] -= 1
+        if result is None:
+            state[2] = False
+        else:
+            self.processor.merge_stats(result["stats"])
+            if self.processor.index is not None and result["writes"]:
+                self.processor.index.apply_writes(result["writes"])
+            feed = get_change_feed()
+            if feed is not None:
+                for record in result["changes"]:
+                    feed.record(*record)
+            state[2] = state[2] and result["ok"] and result["complete"]
+            self.orphans.merge(result["orphan_files"], result["empty_dirs"])
+        if state[1] == 0:
+            logger.info(f"源目录处理完成：{source_dir}" if state[2] else f"源目录未能完整处理：{source_dir}")
+            if state[2] and self.processor.index is not None:
+                self.processor.index.complete_scan(source_dir, state[0])
+            self.completed = self.completed and state[2]
+
+    def check_off_path(self):
+        """检查不在任何源目录对应路径上的目标目录（例如已删除的源目录留下的），这部分很小，直接在主进程中完成。"""
+        dest_root = self.processor.dest_dir.rstrip('/')
+        roots = set(self.orphans.roots)
+        on_path = set()
+        for root in roots:
+            path = root
+            while path != dest_root and path.startswith(dest_root + '/'):
+                path = os.path.dirname(path)
+                on_path.add(path)
+        for dir_path in on_path:
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path in on_path or entry.path in roots:
+                        continue
+                    self.orphans.merge(*self.cleaner.find_orphans(entry.path, set(), set(), self.known))
+                elif self.known and not self.cleaner.keep_dest_file(entry.name):
+                    self.orphans.files.append(entry.path)
+
+
+def run_sharded(processors: List[FileProcessor], cleaners: List[SyncCleaner],
+                processes: int) -> List[Optional[DestOrphans]]:
+    """用 processes 个子进程执行各监控配置的全量文件处理，返回供清理阶段使用的分片检查结果
+    （某个配置未能完整处理时对应项为 None，清理阶段按原方式遍历判断）。"""
+    runs = [_ConfRun(i, p, c) for i, (p, c) in enumerate(zip(processors, cleaners)) if p.start_full_run()]
+    shards = [(run, source_dir, top) for run in runs for source_dir, top in run.plan()]
+    logger.info(f"多进程全量处理：{len(shards)} 个分片，{processes} 个进程")
+
+    if not shards:
+        for run in runs:
+            run.processor.finish_full_run(run.completed)
+        return [None] * len(processors)
+
+    ctx = multiprocessing.get_context("spawn")
+    log_queue = ctx.Queue()
+    # 直接把 logger 当作 handler：子进程的日志记录原样交给主进程的 logger 输出
+    listener = QueueListener(log_queue, logger)
+    listener.start()
+    failure: Optional[BaseException] = None
+    try:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(processes, log_queue)) as pool:
+            futures = {pool.submit(_run_shard, run.conf_index, run.processor.monitor_conf, source_dir, top,
+                                   run.sources[source_dir][0], run.known, global_config.cleanup_empty_dirs,
+                                   run.shard_done_dirs(source_dir, top), run.checkpoint_age):
+                       (run, source_dir, top)
+                       for run, source_dir, top in shards}
+            for future in as_completed(futures):
+                run, source_dir, top = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"分片处理失败：{top or source_dir} - {str(e)}", exc_info=True)
+                    failure = failure or e
+                    result = None
+                run.merge(source_dir, result)
+    finally:
+        listener.stop()
+
+    orphans: List[Optional[DestOrphans]] = [None] * len(processors)
+    for run in runs:
+        run.processor.finish_full_run(run.completed)
+        if run.completed and (run.known or global_config.cleanup_empty_dirs):
+            try:
+                run.check_off_path()
+                orphans[run.conf_index] = run.orphans
+            except OSError as e:
+                logger.error(f"检查目标目录失败，清理阶段改为遍历判断：{run.processor.dest_dir} - {str(e)}")
+    if failure is not None:
+        # 与单进程模式一致：未预期的错误中止本轮任务，不进入清理阶段
+        raise failure
+    return orphans
@@ -0,0 +1,357 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from .logger import logger
+from .config import global_config
+
+# 源端条目与目标端条目分表存储：source_entries 记录每个源文件/目录的 size/mtime 及其生成的目标路径，
+# dest_entries 记录程序生成的每个目标文件。scan_id 用于在全量任务结束后找出本轮未出现（已被删除）的源条目。
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_entries (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    dest_path TEXT,
+    scan_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dest_entries (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    source_path TEXT
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scans (
+    root TEXT PRIMARY KEY,
+    scan_id INTEGER NOT NULL,
+    completed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    scan_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoint_dirs (
+    root TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    PRIMARY KEY (root, dir)
+);
+"""
+
+# 检查点：checkpoints 中以源根目录为名的行表示该目录有一轮未完成的扫描（scan_id 为那一轮的ID），
+# checkpoint_dirs 记录这一轮中所有文件都已处理完的目录；以 cleanup:<目标目录> 为名的行表示文件处理已全部完成、
+# 清理阶段尚未完成，state 为已完成的清理阶段（逗号分隔）。
+# scans 中以 baseline:<目标目录> 为名的行表示该目标目录做过一次完整的遍历同步，此后其中的文件都由索引记录，
+# 清理阶段才能只看索引差异；没有这一行（首次启用索引、索引文件被删除）时先遍历同步一次。
+
+_COMMIT_EVERY = 1000
+# 即使写入量不大，也至少每隔这么多秒提交一次，中断时最多丢失这段时间内的进度
+_COMMIT_INTERVAL = 10.0
+
+
+def _prefix_range(path: str) -> Tuple[str, str]:
+    # 'a/' 到 'a0' 覆盖 path 下所有子路径，可以直接命中主键索引，比 LIKE 更快且无需转义
+    base = path.rstrip('/') + '/'
+    return base, base[:-1] + '0'
+
+
+class StateIndex:
+    """持久化状态索引（SQLite），记录源条目与已生成的目标条目，使全量任务只处理有变化的部分。"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        # 本进程内刚完成、尚未被清理阶段使用的扫描 {root: scan_id}
+        self._fresh_scans: Dict[str, int] = {}
+        logger.info(f"状态索引已加载：{db_path}")
+
+    def _write(self, sql: str, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._pending += 1
+            if self._pending >= _COMMIT_EVERY or time.monotonic() - self._last_commit >= _COMMIT_INTERVAL:
+                self.commit()
+
+    def commit(self):
+        with self._lock:
+            if self._pending:
+                self._conn.commit()
+                self._pending = 0
+            self._last_commit = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self.commit()
+            self._conn.close()
+
+    # ---------- 扫描周期 ----------
+    def begin_scan(self, root: str, resume_max_age: float = 0) -> Tuple[int, Set[str]]:
+        """开始 root 的一轮扫描，返回 (scan_id, 已完成目录集合)。
+
+        上一轮扫描中断且未超过 resume_max_age 秒时沿用它的 scan_id 并返回其中已处理完的目录，调用方可以跳过这些目录；
+        否则开启新的一轮。resume_max_age<=0 时不使用也不记录检查点，已完成目录集合总为空。
+        """
+        with self._lock:
+            if resume_max_age <= 0:
+                return time.time_ns(), set()
+            row = self._conn.execute("SELECT scan_id, updated_at FROM checkpoints WHERE name = ?",
+                                     (root,)).fetchone()
+            if row is not None and time.time() - row[1] <= resume_max_age:
+                done = {r[0] for r in self._conn.execute("SELECT dir FROM checkpoint_dirs WHERE root = ?", (root,))}
+                return row[0], done
+            scan_id = time.time_ns()
+            self._conn.execute("DELETE FROM checkpoint_dirs WHERE root = ?", (root,))
+            self._conn.execute("INSERT OR REPLACE INTO checkpoints (name, scan_id, state, updated_at) "
+                               "VALUES (?, ?, '', ?)", (root, scan_id, time.time()))
+            self._conn.commit()
+            self._pending = 0
+            return scan_id, set()
+
+    def checkpoint_dir(self, root: str, dir_path: str):
+        """记录 root 本轮扫描中 dir_path 下的文件已全部处理完。"""
+        with self._lock:
+            self._write("INSERT OR IGNORE INTO checkpoint_dirs (root, dir) VALUES (?, ?)", (root, dir_path))
+            self._write("UPDATE checkpoints SET updated_at = ? WHERE name = ?", (time.time(), root))
+
+    def complete_scan(self, root: str, scan_id: int):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO scans (root, scan_id, completed_at) VALUES (?, ?, ?)",
+                               (root, scan_id, time.time()))
+            self._conn.execute("DELETE FROM checkpoints WHERE name = ?", (root,))
+            self._conn.execute("DELETE FROM checkpoint_dirs WHERE root = ?", (root,))
+            self._conn.commit()
+            self._pending = 0
+            self._fresh_scans[root] = scan_id
+
+    def restore_fresh_scans(self, roots: List[str]):
+        """从上次完成的扫描记录恢复 {root: scan_id}，用于在新进程中从清理阶段继续中断的任务。"""
+        with self._lock:
+            for root in roots:
+                if root not in self._fresh_scans:
+                    row = self._conn.execute("SELECT scan_id FROM scans WHERE root = ?", (root,)).fetchone()
+                    if row is not None:
+                        self._fresh_scans[root] = row[0]
+
+    # ---------- 清理阶段检查点 ----------
+    def begin_cleanup(self, dest_dir: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO checkpoints (name, scan_id, state, updated_at) "
+                               "VALUES (?, 0, '', ?)", (f"cleanup:{dest_dir}", time.time()))
+            self._conn.commit()
+            self._pending = 0
+
+    def cleanup_progress(self, dest_dir: str, max_age: float) -> Optional[Set[str]]:
+        """返回中断任务中已完成的清理阶段；没有待继续的清理（或检查点已过期）时返回 None。"""
+        with self._lock:
+            row = self._conn.execute("SELECT state, updated_at FROM checkpoints WHERE name = ?",
+                                     (f"cleanup:{dest_dir}",)).fetchone()
+        if row is None or time.time() - row[1] > max_age:
+            return None
+        return {p for p in row[0].split(",") if p}
+
+    def mark_cleanup_phase(self, dest_dir: str, phase: str):
+        name = f"cleanup:{dest_dir}"
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM checkpoints WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                state = ",".join(p for p in (row[0], phase) if p)
+                self._conn.execute("UPDATE checkpoints SET state = ?, updated_at = ? WHERE name = ?",
+                                   (state, time.time(), name))
+                self._conn.commit()
+                self._pending = 0
+
+    def finish_cleanup(self, dest_dir: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE name = ?", (f"cleanup:{dest_dir}",))
+            self._conn.commit()
+            self._pending = 0
+
+    def has_dest_baseline(self, dest_dir: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM scans WHERE root = ?",
+                                      (f"baseline:{dest_dir}",)).fetchone() is not None
+
+    def mark_dest_baseline(self, dest_dir: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO scans (root, scan_id, completed_at) VALUES (?, 0, ?)",
+                               (f"baseline:{dest_dir}", time.time()))
+            self._conn.commit()
+            self._pending = 0
+
+    def consume_fresh_scan(self, root: str) -> Optional[int]:
+        """取出本进程内刚完成的扫描ID；只有刚扫描过的根目录，才能用索引差异代替目录遍历来判断孤儿。"""
+        with self._lock:
+            return self._fresh_scans.pop(root, None)
+
+    # ---------- 源条目 ----------
+    def get_source(self, path: str) -> Optional[Tuple[str, int, float, Optional[str]]]:
+        with self._lock:
+            return self._conn.execute("SELECT kind, size, mtime, dest_path FROM source_entries WHERE path = ?",
+                                      (path,)).fetchone()
+
+    def unchanged_dest(self, path: str, size: int, mtime: float) -> Optional[str]:
+        """源文件大小与修改时间和索引一致时返回记录的目标路径，否则返回 None。
+        目标文件是否仍然存在由调用方确认（可能已被手动删除）。"""
+        row = self.get_source(path)
+        return row[3] if row is not None and row[1] == size and row[2] == mtime else None
+
+    def record_source(self, path: str, kind: str, size: int, mtime: float, dest_path: Optional[str],
+                      scan_id: int = 0):
+        self._write("INSERT OR REPLACE INTO source_entries (path, kind, size, mtime, dest_path, scan_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (path, kind, size, mtime, dest_path, scan_id))
+
+    def touch_source(self, path: str, scan_id: int):
+        self._write("UPDATE source_entries SET scan_id = ? WHERE path = ?", (scan_id, path))
+
+    def stale_sources(self, root: str, scan_id: int) -> List[Tuple[str, str, Optional[str]]]:
+        """返回 root 下本轮扫描未出现的源条目 (path, kind, dest_path)，目录排在最后且由深到浅。"""
+        lo, hi = _prefix_range(root)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, kind, dest_path FROM source_entries WHERE path >= ? AND path < ? AND scan_id != ?",
+                (lo, hi, scan_id)).fetchall()
+        return sorted(rows, key=lambda r: (r[1] == "dir", -r[0].count('/') if r[1] == "dir" else 0))
+
+    def remove_source(self, path: str, recursive: bool = False):
+        with self._lock:
+            self._write("DELETE FROM source_entries WHERE path = ?", (path,))
+            if recursive:
+                lo, hi = _prefix_range(path)
+                self._write("DELETE FROM source_entries WHERE path >= ? AND path < ?", (lo, hi))
+
+    # ---------- 目标条目 ----------
+    def record_dest(self, path: str, kind: str, size: int, mtime: float, source_path: Optional[str]):
+        self._write("INSERT OR REPLACE INTO dest_entries (path, kind, size, mtime, source_path) VALUES (?, ?, ?, ?, ?)",
+                    (path, kind, size, mtime, source_path))
+
+    def remove_dest(self, path: str, recursive: bool = False):
+        with self._lock:
+            self._write("DELETE FROM dest_entries WHERE path = ?", (path,))
+            if recursive:
+                lo, hi = _prefix_range(path)
+                self._write("DELETE FROM dest_entries WHERE path >= ? AND path < ?", (lo, hi))
+
+    # ---------- 内容指纹缓存 ----------
+    def get_fingerprint(self, path: str, size: int, mtime: float) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT fingerprint FROM fingerprints WHERE path = ? AND size = ? AND mtime = ?",
+                                     (path, size, mtime)).fetchone()
+        return row[0] if row else None
+
+    def put_fingerprint(self, path: str, size: int, mtime: float, fingerprint: str):
+        self._write("INSERT OR REPLACE INTO fingerprints (path, size, mtime, fingerprint) VALUES (?, ?, ?, ?)",
+                    (path, size, mtime, fingerprint))
+
+    # ---------- 实时事件 ----------
+    def _rewrite_prefix(self, table: str, column: str, old_path: str, new_path: str):
+        old_base, hi = _prefix_range(old_path)
+        new_base = new_path.rstrip('/') + '/'
+        self._write(f"UPDATE OR REPLACE {table} SET {column} = ? WHERE {column} = ?", (new_path, old_path))
+        self._write(f"UPDATE OR REPLACE {table} SET {column} = ? || substr({column}, ?) "
+                    f"WHERE {column} >= ? AND {column} < ?", (new_base, len(old_base) + 1, old_base, hi))
+
+    def move(self, old_source: str, new_source: str, old_dest: Optional[str] = None, new_dest: Optional[str] = None):
+        """同步一次移动/重命名：改写源路径前缀，目标已跟随移动时一并改写目标路径前缀。"""
+        with self._lock:
+            self._rewrite_prefix("source_entries", "path", old_source, new_source)
+            if old_dest and new_dest:
+                self._rewrite_prefix("source_entries", "dest_path", old_dest, new_dest)
+                self._rewrite_prefix("dest_entries", "path", old_dest, new_dest)
+                self._rewrite_prefix("dest_entries", "source_path", old_source, new_source)
+
+    def remove(self, source_path: str, dest_path: Optional[str] = None, recursive: bool = False):
+        with self._lock:
+            self.remove_source(source_path, recursive)
+            if dest_path:
+                self.remove_dest(dest_path, recursive)
+
+    # ---------- 多进程全量任务 ----------
+    def apply_writes(self, writes: List[Tuple[str, tuple]]):
+        """依次执行子进程记下的写操作（见 DeferredWriteIndex），执行完提交一次。"""
+        with self._lock:
+            for sql, params in writes:
+                self._write(sql, params)
+            self.commit()
+
+
+class DeferredWriteIndex(StateIndex):
+    """多进程全量任务子进程中使用的状态索引：以只读方式打开数据库，写操作不执行，只按顺序记下来，
+    随分片结果交回主进程执行。SQLite 同一时间只允许一个写者，这样子进程之间不会互相等锁。"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._fresh_scans: Dict[str, int] = {}
+        self._writes: List[Tuple[str, tuple]] = []
+
+    def _write(self, sql: str, params=()):
+        with self._lock:
+            self._writes.append((sql, tuple(params)))
+
+    def commit(self):
+        pass
+
+    def take_writes(self) -> List[Tuple[str, tuple]]:
+        with self._lock:
+            writes, self._writes = self._writes, []
+        return writes
+
+
+_indexes: Dict[str, StateIndex] = {}
+_indexes_lock = threading.Lock()
+_deferred = False
+
+
+def defer_writes():
+    """之后在本进程中打开的状态索引都使用 DeferredWriteIndex（多进程全量任务的子进程启动时调用）。"""
+    global _deferred
+    _deferred = True
+
+
+def default_index_path(dest_dir: str) -> str:
+    # 放在 dest_dir 旁边而不是里面，避免被同步清理当作无效文件删除，也不会被媒体服务器扫描到
+    dest_dir = os.path.abspath(dest_dir).rstrip('/')
+    return os.path.join(os.path.dirname(dest_dir), f".{os.path.basename(dest_dir)}.ystrm.db")
+
+
+def get_state_index(dest_dir: str) -> Optional[StateIndex]:
+    """按目标目录获取共享的状态索引；未启用时返回 None。同一目标目录的多个监控配置共用一个索引。"""
+    if not global_config.state_index:
+        return None
+    db_path = global_config.state_index_path or default_index_path(dest_dir)
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            try:
+                index = _indexes[db_path] = (DeferredWriteIndex if _deferred else StateIndex)(db_path)
+            except Exception as e:
+                logger.error(f"状态索引打开失败，退回无索引模式：{db_path} - {str(e)}", exc_info=True)
+                return None
+        return index
+
+
+def commit_all():
+    with _indexes_lock:
+        for index in _indexes.values():
+            index.commit()
@@ -1,90 +1,285 @@
 import os
-import shutil
-from typing import List, Set
-from .logger import logger
+import errno
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .logger import logger, log_file_action, flush_progress
 from .config import global_config
+from .state_index import get_state_index
+from .scan_engine import ScanEngine, TreeSnapshot
+from .copy_engine import copy_file, same_content
+from .dest_writer import get_dest_writer
+from .path_filter import PathFilter, file_ext
+from . import metrics
+
+
+class DestOrphans:
+    """多进程全量任务中由各分片汇总来的目标端检查结果，清理阶段据此直接删除，不再遍历源目录和目标目录。
+
+    known 为 False 时没有判断孤儿文件（启用状态索引或未开启同步时不需要），只用于清理空目录。
+    empty_dirs 为删除孤儿文件后会变空的目录 (路径, 是否无对应源目录)；roots 为各源目录对应的目标目录，
+    它们本身是否变空由主进程在清理时确认。
+    """
+
+    def __init__(self, known: bool):
+        self.known = known
+        self.files: List[str] = []
+        self.empty_dirs: List[Tuple[str, bool]] = []
+        self.roots: List[str] = []
+
+    def merge(self, files: List[str], empty_dirs: List[Tuple[str, bool]]):
+        self.files.extend(files)
+        self.empty_dirs.extend(empty_dirs)
+
 
 class SyncCleaner:
-    def __init__(self, monitor_conf: dict):
+    def __init__(self, monitor_conf: dict, path_filter: Optional[PathFilter] = None):
         self.source_dirs = self._normalize_dirs(monitor_conf["source_dir"])
         self.dest_dir = self._normalize_dir(monitor_conf["dest_dir"])
         self.library_dir = self._normalize_dir(monitor_conf["library_dir"])
-        self.video_exts = monitor_conf["video_extensions"]
-        self.metadata_exts = monitor_conf["metadata_extensions"]
+        self.path_filter = path_filter or PathFilter(monitor_conf, self.library_dir)
+        self.video_exts = self.path_filter.video_exts
+        self.metadata_exts = self.path_filter.metadata_exts
+        self.index = get_state_index(self.dest_dir)
+        self.writer = get_dest_writer(self.dest_dir)
 
     def _normalize_dir(self, dir_path: str) -> str: return os.path.abspath(dir_path).rstrip('/') + '/'
     def _normalize_dirs(self, dirs: List[str]) -> List[str]: return [self._normalize_dir(d) for d in dirs]
 
-    def _is_source_file_exists(self, relative_path: str) -> bool:
+    def _build_source_snapshot(self, engine: ScanEngine) -> Tuple[Set[Tuple[str, str]], Set[str]]:
+        """从源目录快照得到 ({(相对路径去后缀, 小写后缀)}, {相对目录})，之后的孤儿判断全部在内存中完成。"""
+        source_stems, source_subdirs = set(), set()
+        for s_dir in self.source_dirs:
+            if not os.path.isdir(s_dir):
+                continue
+            # 与文件处理使用相同的排除规则，被排除的源文件/目录视为不存在
+            tree = engine.tree(s_dir, self.path_filter)
+            for root, _, files in tree.walk():
+                rel_root = os.path.relpath(root, self.library_dir)
+                source_subdirs.add(rel_root)
+                for file in files:
+                    # 只有视频和元数据会生成目标文件，其他后缀的源文件不能让同名的旧目标文件留下
+                    source_file = os.path.join(root, file)
+                    if self.path_filter.kind(source_file) is None or not self.path_filter.accept_file(source_file):
+                        continue
+                    stem, ext = os.path.splitext(os.path.join(rel_root, file))
+                    source_stems.add((stem, ext.lower()))
+            if tree.errors:
+                raise OSError(f"源目录有 {len(tree.errors)} 个子目录无法列出，例如：{tree.errors[0][0]}")
+        return source_stems, source_subdirs
+
+    def _is_source_file_exists(self, relative_path: str, source_stems: Set[Tuple[str, str]]) -> bool:
         file_name, file_ext = os.path.splitext(relative_path)
+        file_ext = file_ext.lower()
 
-        # 【逻辑分离】第一部分：处理 .strm 文件
-        if file_ext.lower() == ".strm":
-            for video_ext in self.video_exts:
-                # 检查时，同时考虑小写和大写后缀，实现大小写不敏感
-                source_file_lower = os.path.join(self.library_dir, f"{file_name}{video_ext.lower()}")
-                source_file_upper = os.path.join(self.library_dir, f"{file_name}{video_ext.upper()}")
-                
-                if os.path.exists(source_file_lower) or os.path.exists(source_file_upper):
-                    return True
-            return False
-        
-        # 【逻辑分离】第二部分：处理元数据文件
-        # 直接使用原始的、大小写敏感的相对路径去检查源文件是否存在
-        source_file = os.path.join(self.library_dir, relative_path)
-        return os.path.exists(source_file)
+        # 【逻辑分离】第一部分：处理 .strm 文件，任一视频后缀（大小写不敏感）的同名源文件存在即可
+        if file_ext == ".strm":
+            return any((file_name, video_ext) in source_stems for video_ext in self.video_exts)
 
-    def sync_source_dest(self):
+        # 【逻辑分离】第二部分：处理元数据文件，同一相对路径的源文件存在即可
+        return (file_name, file_ext) in source_stems
+
+    def keep_dest_file(self, name: str) -> bool:
+        ext = file_ext(name)
+        if global_config.preserve_extra_metadata and ext in self.metadata_exts:
+            return True
+        # 反向同步会先把目标端的元数据补回源目录，这些文件不再是孤儿
+        return global_config.sync_metadata_to_source and ext in self.metadata_exts
+
+    def find_orphans(self, dest_root: str, source_stems: Set[Tuple[str, str]], source_subdirs: Set[str],
+                     known: bool = True, skip_subdirs: bool = False) -> Tuple[List[str], List[Tuple[str, bool]]]:
+        """只检查不删除：返回 dest_root 下的孤儿文件，以及删除这些文件后会变空的目录 [(路径, 是否无对应源目录)]。
+
+        source_stems/source_subdirs 只需覆盖 dest_root 对应的源子树；known 为 False 时不判断孤儿文件，只找空目录。
+        skip_subdirs 为 True 时有对应源目录的子目录整棵跳过（由其他分片检查），dest_root 本身也不计入空目录。
+        """
+        orphan_files: List[str] = []
+        empty: Dict[str, bool] = {}
+        dest_root = dest_root.rstrip('/')
+        prune = None
+        if skip_subdirs:
+            prune = lambda path: os.path.relpath(path, self.dest_dir) in source_subdirs
+        tree = TreeSnapshot(dest_root, retain=False, max_workers=global_config.scan_workers, prune=prune)
+        for root, dirs, files in tree.walk(topdown=False):
+            root = root.rstrip('/')
+            remaining = 0
+            for file in files:
+                dest_file = os.path.join(root, file)
+                if known and not self.keep_dest_file(file) and \
+                        not self._is_source_file_exists(os.path.relpath(dest_file, self.dest_dir), source_stems):
+                    orphan_files.append(dest_file)
+                else:
+                    remaining += 1
+            if skip_subdirs and root == dest_root:
+                continue
+            if not remaining and all(os.path.join(root, d) in empty for d in dirs):
+                empty[root] = known and os.path.relpath(root, self.dest_dir) not in source_subdirs
+        if tree.errors:
+            raise OSError(f"目标目录有 {len(tree.errors)} 个子目录无法列出，例如：{tree.errors[0][0]}")
+        return orphan_files, list(empty.items())
+
+    def sync_source_dest(self, engine: Optional[ScanEngine] = None, orphans: Optional[DestOrphans] = None):
         if not global_config.sync_source_dest or not os.path.exists(self.dest_dir):
             logger.info("未启用源目标同步，跳过")
             return
             
         logger.info("="*50 + "\n开始源目标目录强同步（删除无效文件/目录）")
+
+        if self.index is not None:
+            scan_ids = {s_dir: self.index.consume_fresh_scan(s_dir) for s_dir in self.source_dirs}
+            if not self.index.has_dest_baseline(self.dest_dir):
+                # 启用索引之前就存在的目标文件不在索引中，只看索引差异永远找不到它们
+                logger.info("状态索引尚未覆盖目标目录中已有的文件，本次先做一次目录遍历同步")
+            elif all(scan_id is not None for scan_id in scan_ids.values()):
+                self._sync_by_index(scan_ids, engine)
+                logger.info("源目标目录强同步完成（状态索引）\n" + "="*50)
+                return
+            else:
+                logger.info("状态索引中没有本轮完整扫描记录，退回目录遍历同步")
+
+        if orphans is not None and orphans.known:
+            self._sync_by_orphans(orphans, engine)
+            logger.info("源目标目录强同步完成（分片检查结果）\n" + "="*50)
+            return
         
-        source_subdirs = set()
-        for s_dir in self.source_dirs:
-            for root, dirs, _ in os.walk(s_dir):
-                for d in dirs:
-                    source_subdirs.add(os.path.relpath(os.path.join(root, d), self.library_dir))
-                    
-        for root, dirs, files in os.walk(self.dest_dir, topdown=False):
-            for file in files:
+        engine = engine or ScanEngine(retain=False)
+        try:
+            source_stems, source_subdirs = self._build_source_snapshot(engine)
+        except OSError as e:
+            # 源目录快照不完整时做孤儿判断会误删，直接中止本次同步
+            logger.critical(f"【安全中止】遍历源目录失败，已中止源目标同步：{str(e)}")
+            return
+
+        dest_tree = engine.tree(self.dest_dir)
+        for root, dirs, files in dest_tree.walk(topdown=False):
+            for file in list(files):
                 dest_file = os.path.join(root, file)
                 rel_path = os.path.relpath(dest_file, self.dest_dir)
                 
-                if global_config.preserve_extra_metadata and os.path.splitext(file)[1].lower() in self.metadata_exts:
+                if global_config.preserve_extra_metadata and file_ext(file) in self.metadata_exts:
                     continue
                     
-                if not self._is_source_file_exists(rel_path):
+                if not self._is_source_file_exists(rel_path, source_stems):
                     try:
                         os.remove(dest_file)
-                        logger.info(f"删除无效文件（源文件已删）：{dest_file}")
+                        engine.note_removed(dest_file)
+                        self.writer.note_removed(dest_file)
+                        metrics.ORPHANS_DELETED.inc(kind="file")
+                        log_file_action("删除无效文件", "删除无效文件（源文件已删）：%s", dest_file)
                     except Exception as e:
                         logger.error(f"删除无效文件失败：{dest_file} - {str(e)}", exc_info=True)
                         
-            for dir_name in dirs:
+            for dir_name in list(dirs):
                 dest_subdir = os.path.join(root, dir_name)
                 subdir_rel_path = os.path.relpath(dest_subdir, self.dest_dir)
                 
-                if not os.listdir(dest_subdir) and subdir_rel_path not in source_subdirs:
+                if subdir_rel_path not in source_subdirs:
+                    # 直接 rmdir，非空目录会失败，省去一次 listdir
                     try:
                         os.rmdir(dest_subdir)
-                        logger.info(f"删除无效空目录（源目录已删）：{dest_subdir}")
-                    except Exception as e:
-                        logger.error(f"删除无效空目录失败：{dest_subdir} - {str(e)}", exc_info=True)
-                        
+                        engine.note_removed(dest_subdir, is_dir=True)
+                        self.writer.note_removed(dest_subdir, is_dir=True)
+                        metrics.ORPHANS_DELETED.inc(kind="dir")
+                        log_file_action("删除无效目录", "删除无效空目录（源目录已删）：%s", dest_subdir)
+                    except OSError as e:
+                        if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                            logger.error(f"删除无效空目录失败：{dest_subdir} - {str(e)}", exc_info=True)
+
+        if self.index is not None and not dest_tree.errors:
+            self.index.mark_dest_baseline(self.dest_dir)
         logger.info("源目标目录强同步完成\n" + "="*50)
 
-    def sync_metadata_back_to_source(self):
+    def _sync_by_index(self, scan_ids: Dict[str, int], engine: Optional[ScanEngine] = None):
+        """根据状态索引差异删除孤儿：本轮扫描未出现的源条目即为已删除，无需遍历目标目录。"""
+        removed = []
+        for s_dir, scan_id in scan_ids.items():
+            for source_path, kind, dest_path in self.index.stale_sources(s_dir, scan_id):
+                # 扫描之后又被实时新增/恢复的源条目仍然有效，逐个确认一次即可（只针对差异部分）；
+                # 源文件还在但已不符合当前过滤规则（新增 exclude、去掉后缀等）的按已删除处理
+                if os.path.lexists(source_path) and self._source_wanted(source_path, kind):
+                    continue
+                keep_dest = kind == "metadata" and global_config.preserve_extra_metadata
+                if dest_path and not keep_dest:
+                    try:
+                        if kind == "dir":
+                            if os.path.isdir(dest_path) and not os.listdir(dest_path):
+                                os.rmdir(dest_path)
+                                self.writer.note_removed(dest_path, is_dir=True)
+                                removed.append(dest_path)
+                                metrics.ORPHANS_DELETED.inc(kind="dir")
+                                if engine is not None:
+                                    engine.note_removed(dest_path, is_dir=True)
+                                log_file_action("删除无效目录", "删除无效空目录（源目录已删）：%s", dest_path)
+                        elif os.path.lexists(dest_path):
+                            os.remove(dest_path)
+                            self.writer.note_removed(dest_path)
+                            removed.append(dest_path)
+                            metrics.ORPHANS_DELETED.inc(kind="file")
+                            if engine is not None:
+                                engine.note_removed(dest_path)
+                            log_file_action("删除无效文件", "删除无效文件（源文件已删）：%s", dest_path)
+                    except Exception as e:
+                        logger.error(f"删除无效条目失败：{dest_path} - {str(e)}", exc_info=True)
+                        continue
+                self.index.remove(source_path, None if keep_dest else dest_path)
+            self.index.commit()
+        self.prune_empty_ancestors(removed, engine)
+
+    def _source_wanted(self, source_path: str, kind: str) -> bool:
+        """仍存在的源条目是否还会被处理：未被 exclude/include 规则过滤，且后缀分类与入索引时相同。"""
+        if kind == "dir":
+            return not self.path_filter.excluded_path(source_path, is_dir=True)
+        return not self.path_filter.excluded_path(source_path) and self.path_filter.kind(source_path) == kind
+
+    def _source_reappeared(self, rel_path: str) -> bool:
+        stem, ext = os.path.splitext(os.path.join(self.library_dir, rel_path))
+        if ext.lower() == ".strm":
+            candidates = [stem + video_ext for video_ext in self.video_exts]
+        else:
+            candidates = [stem + ext]
+        # 与 _build_source_snapshot 一致：被过滤掉的源文件即使还在也视为不存在
+        return any(os.path.lexists(path) and self.path_filter.kind(path) is not None and
+                   not self.path_filter.excluded_path(path) for path in candidates)
+
+    def _sync_by_orphans(self, orphans: DestOrphans, engine: Optional[ScanEngine] = None):
+        """按分片子进程判断出的孤儿删除；检查之后又被新增/恢复的源文件仍然有效，删除前逐个确认一次。"""
+        for dest_file in orphans.files:
+            if self._source_reappeared(os.path.relpath(dest_file, self.dest_dir)):
+                continue
+            try:
+                os.remove(dest_file)
+                self.writer.note_removed(dest_file)
+                if engine is not None:
+                    engine.note_removed(dest_file)
+                metrics.ORPHANS_DELETED.inc(kind="file")
+                log_file_action("删除无效文件", "删除无效文件（源文件已删）：%s", dest_file)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"删除无效文件失败：{dest_file} - {str(e)}", exc_info=True)
+        # 由深到浅，子目录删掉后父目录才会变空；非空目录 rmdir 会失败
+        for dest_subdir in sorted((d for d, orphan in orphans.empty_dirs if orphan),
+                                  key=lambda d: d.count('/'), reverse=True):
+            try:
+                os.rmdir(dest_subdir)
+                self.writer.note_removed(dest_subdir, is_dir=True)
+                if engine is not None:
+                    engine.note_removed(dest_subdir, is_dir=True)
+                metrics.ORPHANS_DELETED.inc(kind="dir")
+                log_file_action("删除无效目录", "删除无效空目录（源目录已删）：%s", dest_subdir)
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                    logger.error(f"删除无效空目录失败：{dest_subdir} - {str(e)}", exc_info=True)
+
+    def sync_metadata_back_to_source(self, engine: Optional[ScanEngine] = None):
         if not global_config.sync_metadata_to_source:
             logger.info("未启用元数据反向同步，跳过")
             return
             
         logger.info("="*50 + "\n开始反向同步元数据（从目标到源）")
         
-        for root, _, files in os.walk(self.dest_dir):
+        engine = engine or ScanEngine(retain=False)
+        for root, _, files in engine.tree(self.dest_dir).walk():
             for file in files:
-                if os.path.splitext(file)[1].lower() not in self.metadata_exts:
+                if file_ext(file) not in self.metadata_exts:
                     continue
                     
                 dest_file = os.path.join(root, file)
@@ -92,50 +287,114 @@ class SyncCleaner:
                 source_file = os.path.join(self.library_dir, rel_path)
                 
                 should_sync = False
-                if not os.path.exists(source_file):
+                try:
+                    source_st = os.stat(source_file)
+                except FileNotFoundError:
                     should_sync = True
                 else:
                     try:
-                        if (os.path.getmtime(dest_file) > os.path.getmtime(source_file) or
-                            os.path.getsize(dest_file) != os.path.getsize(source_file)):
+                        dest_st = os.stat(dest_file)
+                        if dest_st.st_mtime > source_st.st_mtime or dest_st.st_size != source_st.st_size:
                             should_sync = True
+                            # 内容相同仅修改时间不同：对齐源文件时间即可，避免把同样的内容写回网盘
+                            if global_config.content_fingerprint and same_content(dest_file, dest_st, source_file,
+                                                                                  source_st, self.index):
+                                os.utime(source_file, (dest_st.st_atime, dest_st.st_mtime))
+                                should_sync = False
                     except OSError:
                         should_sync = True
 
                 if should_sync:
                     try:
                         os.makedirs(os.path.dirname(source_file), exist_ok=True)
-                        shutil.copy2(dest_file, source_file)
-                        logger.info(f"反向同步元数据成功：{dest_file} -> {source_file}")
+                        copy_file(dest_file, source_file)
+                        engine.note_file_added(source_file)
+                        log_file_action("反向同步元数据", "反向同步元数据成功：%s -> %s", dest_file, source_file)
                     except Exception as e:
                         logger.error(f"反向同步元数据失败：{source_file} - {str(e)}", exc_info=True)
                         
         logger.info("反向同步元数据完成\n" + "="*50)
 
-    def cleanup_empty_dirs(self):
+    def _try_rmdir(self, dir_path: str, engine: Optional[ScanEngine] = None) -> bool:
+        """直接尝试删除目录，目录非空时 rmdir 本身就会失败，省去一次 listdir。"""
+        try:
+            os.rmdir(dir_path)
+            self.writer.note_removed(dir_path, is_dir=True)
+            if engine is not None:
+                engine.note_removed(dir_path, is_dir=True)
+            log_file_action("删除空目录", "删除空目录：%s", dir_path)
+            return True
+        except OSError as e:
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                logger.error(f"删除空目录失败：{dir_path} - {str(e)}", exc_info=True)
+            return False
+
+    def prune_empty_ancestors(self, removed_paths: Iterable[str], engine: Optional[ScanEngine] = None):
+        """只检查刚被删除路径的各级父目录（直到 dest_dir 为止），删除变空的目录，代替整棵目标树的遍历。"""
+        if not global_config.cleanup_empty_dirs:
+            return
+        self.prune_empty_dirs((os.path.dirname(path.rstrip('/')) for path in removed_paths), engine)
+
+    def prune_empty_dirs(self, dir_paths: Iterable[str], engine: Optional[ScanEngine] = None):
+        """从给定目录开始逐级向上（直到 dest_dir 为止）删除空目录。"""
+        dest_root = self.dest_dir.rstrip('/')
+        candidates = {d.rstrip('/') for d in dir_paths if d.startswith(self.dest_dir)}
+        checked = set()
+        # 由深到浅处理，子目录删掉后父目录才可能变空；同一父目录只检查一次
+        for dir_path in sorted(candidates, key=lambda d: d.count('/'), reverse=True):
+            while dir_path != dest_root and dir_path.startswith(self.dest_dir) and dir_path not in checked:
+                checked.add(dir_path)
+                if not self._try_rmdir(dir_path, engine):
+                    break
+                dir_path = os.path.dirname(dir_path)
+
+    def cleanup_empty_dirs(self, engine: Optional[ScanEngine] = None, orphans: Optional[DestOrphans] = None):
         if not global_config.cleanup_empty_dirs or not os.path.exists(self.dest_dir):
             logger.info("未启用空目录清理，跳过")
             return
             
         logger.info("="*50 + "\n开始清理目标目录空文件夹")
-        changed = True
-        
-        while changed:
-            changed = False
-            for root, dirs, _ in os.walk(self.dest_dir, topdown=False):
-                for dir_name in dirs:
-                    dir_path = os.path.join(root, dir_name)
-                    if not os.listdir(dir_path):
-                        try:
-                            os.rmdir(dir_path)
-                            logger.info(f"删除空目录：{dir_path}")
-                            changed = True
-                        except Exception as e:
-                            logger.error(f"删除空目录失败：{dir_path} - {str(e)}", exc_info=True)
+        if orphans is not None:
+            # 分片子进程已找出会变空的目录，只需由深到浅删除并向上检查到目标根目录
+            self.prune_empty_dirs([d for d, _ in orphans.empty_dirs] + orphans.roots, engine)
+            logger.info("空目录清理完成（分片检查结果）\n" + "="*50)
+            return
+        # 自底向上单次遍历：子目录先于父目录处理，子目录全部删掉且没有文件的父目录在同一遍中即可删除，无需反复遍历
+        dest_root = self.dest_dir.rstrip('/')
+        kept = set()
+        engine = engine or ScanEngine(retain=False)
+        for root, _, files in engine.tree(self.dest_dir).walk(topdown=False):
+            root = root.rstrip('/')
+            if root == dest_root:
+                continue
+            if files or root in kept or not self._try_rmdir(root, engine):
+                kept.add(os.path.dirname(root))
                             
         logger.info("空目录清理完成\n" + "="*50)
         
-    def run_full_cleanup(self):
-        self.sync_metadata_back_to_source()
-        self.sync_source_dest()
-        self.cleanup_empty_dirs()
\ No newline at end of file
+    def run_full_cleanup(self, engine: Optional[ScanEngine] = None, orphans: Optional[DestOrphans] = None):
+        """orphans 为多进程全量任务汇总的分片检查结果，传入时同步清理和空目录清理不再遍历目标目录。"""
+        # 三个阶段共用同一个扫描引擎，目标目录在本轮只列一次
+        engine = engine or ScanEngine()
+        # 检查点：文件处理全部完成后才会有清理进度记录，每完成一步记一次，中断后下次跳过已完成的步骤
+        progress = None
+        if self.index is not None and global_config.checkpoint_max_age:
+            progress = self.index.cleanup_progress(self.dest_dir, global_config.checkpoint_max_age)
+        if progress:
+            logger.info(f"从检查点继续清理阶段，跳过已完成的步骤：{', '.join(sorted(progress))}")
+        if progress is not None:
+            # 新进程中继续时，源目录的扫描结果来自上次完成的扫描记录
+            self.index.restore_fresh_scans(self.source_dirs)
+
+        for phase, run in (("sync_metadata_back_to_source", lambda: self.sync_metadata_back_to_source(engine)),
+                           ("sync_source_dest", lambda: self.sync_source_dest(engine, orphans)),
+                           ("cleanup_empty_dirs", lambda: self.cleanup_empty_dirs(engine, orphans))):
+            if progress is not None and phase in progress:
+                continue
+            with metrics.timed(phase):
+                run()
+            flush_progress()
+            if progress is not None:
+                self.index.mark_cleanup_phase(self.dest_dir, phase)
+        if progress is not None:
+            self.index.finish_cleanup(self.dest_dir)
\ No newline at end of file
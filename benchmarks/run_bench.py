@@ -0,0 +1,182 @@
+"""YSTRM 基准测试：生成合成媒体库，分阶段计时全量任务（冷启动/无变化/增量变化）与实时事件吞吐，结果输出为 JSON。
+
+用法示例：
+    python benchmarks/run_bench.py --files 10000 --output bench.json
+    python benchmarks/run_bench.py --files 100000 --stat-delay-ms 2 --listdir-delay-ms 20 --state-index
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synth_library import generate_library, mutate_library  # noqa: E402
+from slowfs import inject_latency  # noqa: E402
+
+
+def _write_config(path: str, source_dir: str, dest_dir: str, library_dir: str, args) -> dict:
+    config = {"sync": {
+        "run_full_task_on_startup": False,
+        "real_time_monitor": True,
+        "real_time_debounce_seconds": 0,
+        "health_check_interval_seconds": 0,
+        "cron_full_process": {
+            "enable": False,
+            "cron_expression": "0 4 * * *",
+            "files_per_second_limit": 0,
+            "process_workers": args.workers,
+            "scan_workers": args.scan_workers,
+            "full_generate": True,
+            "overwrite_existing": False,
+            "sync_source_dest": True,
+            "cleanup_empty_dirs": True,
+            "preserve_extra_metadata": False,
+            "sync_metadata_to_source": False,
+            "stop_on_mount_loss": True,
+            "state_index": args.state_index,
+            "unified_scan": not args.no_unified_scan,
+        },
+        "monitor_confs": [{
+            "source_dir": [source_dir],
+            "dest_dir": dest_dir,
+            "library_dir": library_dir,
+            "video_extensions": [".mkv", ".mp4", ".avi", ".ts", ".iso"],
+            "metadata_extensions": [".nfo", ".jpg", ".png", ".srt", ".ass"],
+        }],
+    }}
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return config
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - start, 4)
+
+
+def run_full_task_phases(app) -> Dict[str, float]:
+    """与 YSTRM._run_full_task 相同的阶段顺序，分别计时。"""
+    from app.scan_engine import ScanEngine
+    engine = ScanEngine()
+    phases = {"health_check": _timed(app._check_sources_health)}
+    phases["process_all_source_dirs"] = _timed(lambda: [p.process_all_source_dirs(engine) for p in app.processors])
+    phases["sync_metadata_back_to_source"] = _timed(
+        lambda: [c.sync_metadata_back_to_source(engine) for c in app.cleaners])
+    phases["sync_source_dest"] = _timed(lambda: [c.sync_source_dest(engine) for c in app.cleaners])
+    phases["cleanup_empty_dirs"] = _timed(lambda: [c.cleanup_empty_dirs(engine) for c in app.cleaners])
+    phases["total"] = round(sum(phases.values()), 4)
+    return phases
+
+
+def run_realtime_throughput(app, source_dir: str, events: int) -> Dict[str, float]:
+    """直接向 RealTimeHandler 分发 events 个创建事件，计时到事件队列全部执行完毕。"""
+    from watchdog.events import FileCreatedEvent
+    from main import RealTimeHandler
+    target = os.path.join(source_dir, "__realtime__")
+    os.makedirs(target, exist_ok=True)
+    paths = []
+    for i in range(events):
+        path = os.path.join(target, f"RT - S01E{i:05d}.mkv")
+        with open(path, "wb") as f:
+            f.write(b"r")
+        paths.append(path)
+    handler = RealTimeHandler(app.processors[0], app.cleaners[0])
+    start = time.perf_counter()
+    for path in paths:
+        handler.dispatch(FileCreatedEvent(path))
+    enqueue_seconds = time.perf_counter() - start
+    handler.stop(drain=True)
+    elapsed = time.perf_counter() - start
+    return {"events": events, "enqueue_seconds": round(enqueue_seconds, 4), "total_seconds": round(elapsed, 4),
+            "events_per_second": round(events / elapsed, 1) if elapsed else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YSTRM 基准测试")
+    parser.add_argument("--files", type=int, default=10000, help="合成媒体库文件数 (1万 ~ 100万)")
+    parser.add_argument("--workdir", default="", help="工作目录，默认使用临时目录 (建议放在 tmpfs 上)")
+    parser.add_argument("--keep", action="store_true", help="结束后保留工作目录")
+    parser.add_argument("--stat-delay-ms", type=float, default=0.0, help="源目录每次 stat 注入的延迟")
+    parser.add_argument("--listdir-delay-ms", type=float, default=0.0, help="源目录每次列目录注入的延迟")
+    parser.add_argument("--workers", type=int, default=4, help="process_workers")
+    parser.add_argument("--scan-workers", type=int, default=4, help="scan_workers")
+    parser.add_argument("--state-index", action="store_true", help="启用持久化状态索引")
+    parser.add_argument("--no-unified-scan", action="store_true", help="关闭全量任务内的共享目录快照")
+    parser.add_argument("--mutate-fraction", type=float, default=0.01, help="增量场景中变化的剧集比例")
+    parser.add_argument("--realtime-events", type=int, default=1000, help="实时吞吐测试的事件数，0 为跳过")
+    parser.add_argument("--output", default="", help="结果 JSON 路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ystrm-bench-")
+    media_root = os.path.join(workdir, "media")
+    source_dir = os.path.join(media_root, "TV")
+    dest_dir = os.path.join(workdir, "strm")
+    os.makedirs(dest_dir, exist_ok=True)
+
+    gen_start = time.perf_counter()
+    library = generate_library(source_dir, args.files)
+    gen_seconds = round(time.perf_counter() - gen_start, 2)
+
+    config_path = os.path.join(workdir, "config.yaml")
+    _write_config(config_path, source_dir, dest_dir, media_root, args)
+    os.environ["YSTRM_CONFIG"] = config_path
+    os.environ["YSTRM_LOG_DIR"] = os.path.join(workdir, "logs")
+
+    from app.logger import logger
+    logger.setLevel(logging.WARNING)
+    from main import YSTRM
+
+    result = {
+        "meta": {
+            "files": args.files, "library": library, "generate_seconds": gen_seconds,
+            "stat_delay_ms": args.stat_delay_ms, "listdir_delay_ms": args.listdir_delay_ms,
+            "workers": args.workers, "scan_workers": args.scan_workers, "state_index": args.state_index,
+            "unified_scan": not args.no_unified_scan, "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "timestamp": time.time(),
+        },
+        "scenarios": {},
+    }
+    try:
+        app = YSTRM()
+        with inject_latency(media_root, args.stat_delay_ms / 1000, args.listdir_delay_ms / 1000) as stats:
+            for scenario in ("cold", "warm", "incremental"):
+                if scenario == "incremental":
+                    result["meta"]["mutation"] = mutate_library(source_dir, args.mutate_fraction)
+                before = stats.snapshot()
+                phases = run_full_task_phases(app)
+                after = stats.snapshot()
+                result["scenarios"][scenario] = {
+                    "phases": phases,
+                    "source_syscalls": {k: after.get(k, 0) - before.get(k, 0) for k in after},
+                }
+            if args.realtime_events > 0:
+                result["realtime"] = run_realtime_throughput(app, source_dir, args.realtime_events)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+            db = os.path.join(os.path.dirname(dest_dir), f".{os.path.basename(dest_dir)}.ystrm.db")
+            for path in (db, db + "-wal", db + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
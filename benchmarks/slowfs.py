@@ -0,0 +1,61 @@
+"""慢速文件系统模拟：给指定目录下的 stat / listdir 类调用注入固定延迟并计数，在本地 tmpfs 上复现网络挂载的表现。"""
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class SyscallStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def add(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+@contextmanager
+def inject_latency(prefix: str, stat_delay: float = 0.0, listdir_delay: float = 0.0) -> Iterator[SyscallStats]:
+    """在 with 块内对 prefix 之下的路径注入延迟（秒）。os.path.exists/isdir 与 os.walk 内部也会经过这些函数。
+
+    只替换 os 模块属性，DirEntry.stat() 等 C 层缓存调用不受影响（与真实 FUSE 上 scandir 一次返回类型信息一致）。
+    """
+    prefix = os.path.abspath(prefix).rstrip('/') + '/'
+    stats = SyscallStats()
+    originals = {name: getattr(os, name) for name in ("stat", "lstat", "scandir", "listdir")}
+
+    def matches(path) -> bool:
+        if isinstance(path, int):
+            return False
+        path = os.fspath(path)
+        if isinstance(path, bytes):
+            path = os.fsdecode(path)
+        return (path.rstrip('/') + '/').startswith(prefix)
+
+    def wrap(name: str, delay: float):
+        original = originals[name]
+
+        def wrapper(path=".", *args, **kwargs):
+            if matches(path):
+                stats.add(name)
+                if delay > 0:
+                    time.sleep(delay)
+            return original(path, *args, **kwargs)
+        return wrapper
+
+    os.stat = wrap("stat", stat_delay)
+    os.lstat = wrap("lstat", stat_delay)
+    os.scandir = wrap("scandir", listdir_delay)
+    os.listdir = wrap("listdir", listdir_delay)
+    try:
+        yield stats
+    finally:
+        for name, fn in originals.items():
+            setattr(os, name, fn)
@@ -0,0 +1,80 @@
+"""合成媒体库生成器：按真实的 剧集/季/集 布局生成视频、.nfo、海报和字幕文件，用于基准测试。"""
+import os
+import random
+from typing import Dict
+
+# 每集: 视频 + nfo + 缩略图 + 字幕；每季: 海报；每部剧: tvshow.nfo + poster + fanart
+_EPISODE_FILES = ("{base}.mkv", "{base}.nfo", "{base}-thumb.jpg", "{base}.chs.srt")
+_SEASON_FILES = ("season{season:02d}-poster.jpg",)
+_SHOW_FILES = ("tvshow.nfo", "poster.jpg", "fanart.jpg")
+
+
+def generate_library(root: str, total_files: int, seed: int = 42, seasons: int = 3,
+                     episodes_per_season: int = 12, content_size: int = 64) -> Dict[str, int]:
+    """在 root 下生成约 total_files 个文件，返回各类文件数量。文件内容为 content_size 字节的占位数据。"""
+    rng = random.Random(seed)
+    counts = {"shows": 0, "seasons": 0, "videos": 0, "files": 0, "dirs": 0}
+    payload = b"x" * content_size
+    show = 0
+    while counts["files"] < total_files:
+        show_dir = os.path.join(root, f"Show {show:05d} ({2000 + show % 25})")
+        os.makedirs(show_dir, exist_ok=True)
+        counts["shows"] += 1
+        counts["dirs"] += 1
+        for name in _SHOW_FILES:
+            _write(os.path.join(show_dir, name), payload)
+            counts["files"] += 1
+        for season in range(1, rng.randint(1, seasons) + 1):
+            season_dir = os.path.join(show_dir, f"Season {season:02d}")
+            os.makedirs(season_dir, exist_ok=True)
+            counts["seasons"] += 1
+            counts["dirs"] += 1
+            for name in _SEASON_FILES:
+                _write(os.path.join(show_dir, name.format(season=season)), payload)
+                counts["files"] += 1
+            for episode in range(1, rng.randint(episodes_per_season // 2, episodes_per_season) + 1):
+                base = f"Show {show:05d} - S{season:02d}E{episode:02d}"
+                for pattern in _EPISODE_FILES:
+                    _write(os.path.join(season_dir, pattern.format(base=base)), payload)
+                    counts["files"] += 1
+                counts["videos"] += 1
+                if counts["files"] >= total_files:
+                    return counts
+        show += 1
+    return counts
+
+
+def mutate_library(root: str, fraction: float = 0.01, seed: int = 7) -> Dict[str, int]:
+    """随机删除约 fraction 比例的剧集文件并新增同样数量的新集，模拟一次增量变化。"""
+    rng = random.Random(seed)
+    videos = [os.path.join(r, f) for r, _, fs in os.walk(root) for f in fs if f.endswith(".mkv")]
+    n = max(1, int(len(videos) * fraction))
+    removed = added = 0
+    for path in rng.sample(videos, min(n, len(videos))):
+        base = os.path.splitext(path)[0]
+        for suffix in (".mkv", ".nfo", "-thumb.jpg", ".chs.srt"):
+            try:
+                os.remove(base + suffix)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        new_base = base + " (Extended)"
+        for suffix in (".mkv", ".nfo"):
+            _write(new_base + suffix, b"y" * 64)
+            added += 1
+    return {"removed": removed, "added": added}
+
+
+def _write(path: str, payload: bytes):
+    with open(path, "wb") as f:
+        f.write(payload)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="生成合成媒体库")
+    parser.add_argument("root")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(generate_library(args.root, args.files, args.seed))
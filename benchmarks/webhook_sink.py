@@ -0,0 +1,46 @@
+"""变更通知 webhook 的本地替身：接收 YSTRM 发送的 POST 并逐行打印，用于测试 change_webhook_url。
+
+用法示例：
+    python benchmarks/webhook_sink.py --port 8099
+    # config.yaml 中设置 change_webhook_url: "http://127.0.0.1:8099/ystrm"
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        try:
+            payload = json.loads(body)
+            print(f"{payload.get('changes', 0)} 个变更，{len(payload.get('directories', []))} 个目录：", flush=True)
+            for directory in payload.get("directories", []):
+                print(f"  {directory}", flush=True)
+            self.send_response(204)
+        except ValueError:
+            print(f"无法解析的请求体：{body[:200]!r}", flush=True)
+            self.send_response(400)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.bind, args.port), _SinkHandler)
+    print(f"webhook 替身已启动：http://{args.bind}:{args.port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
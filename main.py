@@ -1,204 +1,597 @@
 import time
 import os
+import json
 import shutil
-from threading import Thread
-from typing import Optional, List
-from crontab import CronTab
-from watchdog.observers import Observer
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List, Tuple
 from watchdog.events import FileSystemEventHandler
-from app.logger import logger
+from app.logger import logger, enable_async_logging, set_progress_interval
 from app.config import global_config
 from app.file_processor import FileProcessor
 from app.sync_cleaner import SyncCleaner
+from app.scan_engine import ScanEngine
+from app.sharding import run_sharded
+from app.observer_manager import ObserverManager, INOTIFY
+from app.path_filter import VIDEO
+from app.event_queue import DebouncedEventQueue, PathAction, UPSERT, DELETE, MOVE
+from app.scheduler import CronSchedule, TaskScheduler
+from app.change_feed import close_change_feed
+from app.fs_probe import get_probe
+from app.rate_limiter import configure_limiters
+from app.circuit_breaker import configure_breakers
+from app import metrics
 
 class RealTimeHandler(FileSystemEventHandler):
-    def __init__(self, processor: FileProcessor, cleaner: SyncCleaner):
+    """监听回调只把事件放入防抖队列，真正的同步操作由队列的后台线程按批执行。
+    传入 dest_lock 时每批操作都持有该锁，与全量任务互斥，不会同时改动同一目标目录。"""
+
+    def __init__(self, processor: FileProcessor, cleaner: SyncCleaner, dest_lock: Optional[threading.Lock] = None):
         self.processor = processor
         self.cleaner = cleaner
+        self.dest_lock = dest_lock or threading.Lock()
+        self.queue = DebouncedEventQueue(self._apply_batch, global_config.real_time_debounce_seconds)
 
-    def _get_dest_path(self, source_path: str) -> Optional[str]:
+    def _get_dest_path(self, source_path: str, is_dir: bool = False) -> Optional[str]:
         rel_path = os.path.relpath(source_path, self.processor.library_dir)
         dest_path = os.path.join(self.processor.dest_dir, rel_path)
-        if not os.path.isdir(source_path) and os.path.splitext(source_path)[1].lower() in self.processor.video_exts:
+        # 以事件携带的类型为准：移走/删除后源路径已不存在，无法再用 isdir 判断（例如名为 xxx.mkv 的目录）
+        if self.processor.path_filter.kind(source_path) == VIDEO and not is_dir and not os.path.isdir(source_path):
             return os.path.splitext(dest_path)[0] + ".strm"
         return dest_path
 
+    def _excluded(self, path: str, is_dir: bool) -> bool:
+        return self.processor.path_filter.excluded_path(path, is_dir)
+
     def on_created(self, event):
-        if event.is_directory:
-            dest_dir = self._get_dest_path(event.src_path)
-            if dest_dir:
-                os.makedirs(dest_dir, exist_ok=True)
-                logger.info(f"实时同步创建目录：{dest_dir}")
-        else:
-            self._process_file(event.src_path)
+        if not self._excluded(event.src_path, event.is_directory):
+            self.queue.put_upsert(event.src_path, event.is_directory)
 
     def on_modified(self, event):
-        if not event.is_directory:
-            self._process_file(event.src_path)
+        if not event.is_directory and not self._excluded(event.src_path, False):
+            self.queue.put_upsert(event.src_path)
 
     def on_deleted(self, event):
-        dest_path = self._get_dest_path(event.src_path)
-        if not dest_path or not os.path.exists(dest_path): return
+        if not self._excluded(event.src_path, event.is_directory):
+            self.queue.put_delete(event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        # 移入/移出被排除的位置分别相当于新建/删除
+        src_excluded = self._excluded(event.src_path, event.is_directory)
+        dest_excluded = self._excluded(event.dest_path, event.is_directory)
+        if src_excluded and not dest_excluded:
+            self.queue.put_upsert(event.dest_path, event.is_directory)
+        elif dest_excluded and not src_excluded:
+            self.queue.put_delete(event.src_path, event.is_directory)
+        elif not src_excluded:
+            self.queue.put_move(event.src_path, event.dest_path, event.is_directory)
+
+    def stop(self, drain: bool = False):
+        self.queue.stop(drain)
+
+    def _apply_batch(self, actions: List[PathAction]):
+        with self.dest_lock:
+            self._apply_actions(actions)
+
+    def _apply_actions(self, actions: List[PathAction]):
+        # 两批实时事件之间目标目录可能被外部改动（例如手动删除了 STRM），目录缓存只在一批之内有效
+        self.processor.writer.reset()
+        # 整批新增文件的目标目录先去重后一次性创建，之后逐个文件写入时都命中目录缓存
+        try:
+            self.processor.writer.ensure_dirs(os.path.dirname(self._get_dest_path(a.path)) for a in actions
+                                              if a.kind == UPSERT and not a.is_dir
+                                              and self.processor._wanted_kind(a.path) is not None)
+        except OSError as e:
+            logger.warning(f"实时批量创建目标目录失败，改为逐个文件创建 - {str(e)}")
+        removed = []
+        for action in actions:
+            metrics.REALTIME_ACTIONS.inc(kind=action.kind)
+            if action.kind == DELETE:
+                removed.append(self._apply_deleted(action.path, action.is_dir))
+            elif action.kind == MOVE:
+                removed.append(self._apply_moved(action.move_from, action.path, action.is_dir))
+            else:
+                self._apply_created(action.path, action.is_dir)
+        self.processor.writer.sync()
+        if self.processor.index is not None:
+            self.processor.index.commit()
+        # 整批只检查被删除/移走路径的上级目录，而不是每个事件都遍历一次目标目录
+        removed = [p for p in removed if p]
+        if removed:
+            self.cleaner.prune_empty_ancestors(removed)
+
+    def _apply_created(self, source_path: str, is_dir: bool):
+        if is_dir:
+            dest_dir = self._get_dest_path(source_path, True)
+            if dest_dir:
+                self.processor.writer.ensure_dir(dest_dir)
+                logger.info(f"实时同步创建目录：{dest_dir}")
+                # 从监控范围外整体移入的目录只有一个创建事件，子树内的文件需要扫描一次新位置
+                self._process_subtree(source_path)
+        else:
+            self._process_file(source_path)
+
+    def _apply_deleted(self, source_path: str, is_dir: bool) -> Optional[str]:
+        """返回被删除的目标路径（未删除时为 None）。"""
+        dest_path = self._get_dest_path(source_path, is_dir)
+        if not dest_path or not os.path.exists(dest_path): return None
         try:
-            if event.is_directory:
+            if is_dir:
                 shutil.rmtree(dest_path)
                 logger.info(f"实时同步删除目录：{dest_path}")
             else:
                 os.remove(dest_path)
                 logger.info(f"实时删除无效文件：{dest_path}")
-            self.cleaner.cleanup_empty_dirs()
+            self.processor.writer.note_removed(dest_path, is_dir)
+            if self.processor.index is not None:
+                self.processor.index.remove(source_path, dest_path, recursive=is_dir)
+            return dest_path
         except Exception as e:
             logger.error(f"实时删除失败：{dest_path} - {str(e)}", exc_info=True)
+            return None
 
-    def on_moved(self, event):
-        old_dest_path = self._get_dest_path(event.src_path)
-        new_dest_path = self._get_dest_path(event.dest_path)
-        if not old_dest_path or not new_dest_path: return
+    def _apply_moved(self, src_path: str, dest_path: str, is_dir: bool = False) -> Optional[str]:
+        """返回被移走的旧目标路径（未移动时为 None）。"""
+        is_dir = is_dir or os.path.isdir(dest_path)
+        old_dest_path = self._get_dest_path(src_path, is_dir)
+        new_dest_path = self._get_dest_path(dest_path, is_dir)
+        if not old_dest_path or not new_dest_path: return None
         try:
-            if os.path.exists(old_dest_path):
-                os.makedirs(os.path.dirname(new_dest_path), exist_ok=True)
-                shutil.move(old_dest_path, new_dest_path)
-                logger.info(f"实时同步移动/重命名：{old_dest_path} -> {new_dest_path}")
-                self.cleaner.cleanup_empty_dirs()
+            same_dest = old_dest_path == new_dest_path
+            if os.path.exists(old_dest_path) and (same_dest or not os.path.lexists(new_dest_path)):
+                # 目标子树整体改名：无论子树多大都只是一次 rename，不需要扫描源端
+                # （只改视频后缀时新旧 STRM 是同一个文件，无需改名）
+                if not same_dest:
+                    self.processor.writer.ensure_dir(os.path.dirname(new_dest_path))
+                    os.rename(old_dest_path, new_dest_path)
+                    self.processor.writer.note_moved(old_dest_path, new_dest_path, is_dir)
+                    logger.info(f"实时同步移动/重命名：{old_dest_path} -> {new_dest_path}")
+                if self.processor.index is not None:
+                    self.processor.index.move(src_path, dest_path, old_dest_path, new_dest_path)
+                # STRM 内容是源文件的绝对路径，随之改写指向（只读写目标端）
+                retargeted = self.processor.retarget_strms(new_dest_path, src_path, dest_path)
+                if retargeted and is_dir:
+                    logger.info(f"实时同步改写 {retargeted} 个STRM指向：{dest_path}")
+                if not is_dir:
+                    # 移动合并了之后的修改事件，按新路径再确认一次
+                    self._process_file(dest_path)
+                return None if same_dest else old_dest_path
+            # 旧目标不存在（从监控范围外移入、此前未同步）或新位置已有目标：只扫描新位置，不触发全量任务
+            if is_dir:
+                self.processor.writer.ensure_dir(new_dest_path)
+                self._process_subtree(dest_path)
             else:
-                self._process_file(event.dest_path)
+                self._process_file(dest_path)
+            if os.path.exists(old_dest_path):
+                return self._apply_deleted(src_path, is_dir)
         except Exception as e:
             logger.error(f"实时移动/重命名失败 - {str(e)}", exc_info=True)
+        return None
 
     def _process_file(self, source_file: str):
-        file_ext = os.path.splitext(source_file)[1].lower()
-        if self.processor.create_strm and file_ext in self.processor.video_exts:
-            self.processor.generate_strm(source_file, self.processor.library_dir)
-        if self.processor.enable_copy_metadata and file_ext in self.processor.metadata_exts:
-            self.processor.copy_metadata(source_file, self.processor.library_dir)
+        try:
+            self.processor.process_file(source_file)
+        except OSError as e:
+            logger.warning(f"实时处理文件失败，已跳过：{source_file} - {str(e)}")
+
+    def _process_subtree(self, source_dir: str):
+        try:
+            count = self.processor.process_subtree(source_dir)
+            if count:
+                logger.info(f"实时同步扫描子树完成：{source_dir}（{count} 个文件）")
+        except OSError as e:
+            logger.warning(f"实时扫描子树失败，留待下次全量任务：{source_dir} - {str(e)}")
+
+
+# 修改后需要重启服务才能生效的配置项（顶层 / cron_full_process 下）
+_RESTART_KEYS = ["metrics_port", "metrics_bind", "log_async", "real_time_monitor", "inotify_watch_budget",
+                 "change_feed_path", "change_feed_max_mb", "change_feed_backups", "change_feed_flush_seconds",
+                 "change_webhook_url", "change_webhook_timeout_seconds"]
+_RESTART_TASK_KEYS = ["state_index", "state_index_path", "dest_dir_cache_size", "dest_fsync"]
+
+
+def _conf_key(conf: dict) -> str:
+    return json.dumps(conf, sort_keys=True, ensure_ascii=False, default=str)
 
 
 class YSTRM:
     def __init__(self):
+        if global_config.log_async:
+            enable_async_logging()
+        set_progress_interval(global_config.log_progress_interval)
         self.processors = [FileProcessor(conf) for conf in global_config.monitor_confs]
-        self.cleaners = [SyncCleaner(conf) for conf in global_config.monitor_confs]
+        # 同一监控配置的处理器和清理器共用一份编译好的过滤规则
+        self.cleaners = [SyncCleaner(conf, p.path_filter)
+                         for conf, p in zip(global_config.monitor_confs, self.processors)]
+        self.handlers: List[RealTimeHandler] = []
+        self.metrics_server = None
+        self.scheduler: Optional[TaskScheduler] = None
+        # 全量任务与实时批处理共用的目标目录锁；_task_state 保护下面两个任务状态字段
+        self.dest_lock = threading.Lock()
+        self._task_state = threading.Lock()
+        self._task_running = False
+        self._queued_reason: Optional[str] = None
+        # 运行中的观察者管理器（实时监控未启用或已因挂载丢失停止时为 None），供配置热加载增删监控
+        self._manager: Optional[ObserverManager] = None
+        self._reload_requested = threading.Event()
+        # 配置热加载中监控配置的变化因全量任务运行而尚未应用
+        self._confs_pending = False
 
     def _check_sources_health(self) -> bool:
-        if not global_config.stop_on_mount_loss:
-            return True
+        """探测各源目录是否可用。探测带超时，卡死的挂载按挂载丢失处理，不会让心跳线程永远阻塞。"""
+        healthy = True
+        probe = get_probe()
         for conf in global_config.monitor_confs:
             for src_dir in conf.get("source_dir", []):
-                if not os.path.isdir(src_dir):
-                    logger.critical(f"【安全中止】源目录 '{src_dir}' 不存在！可能挂载已丢失。任务中止。")
-                    return False
-        return True
+                problem = probe.check_dir(src_dir, global_config.health_sentinel_file)
+                metrics.SOURCE_HEALTHY.set(0 if problem else 1, path=src_dir)
+                if problem and healthy and global_config.stop_on_mount_loss:
+                    logger.critical(f"【安全中止】源目录 '{src_dir}' 不可用（{problem}）！可能挂载已丢失或卡死。任务中止。")
+                    healthy = False
+        return healthy
+
+    def _queue_stats(self, stat) -> dict:
+        return {(str(self.processors.index(h.processor)),): stat(h.queue) for h in list(self.handlers)}
+
+    def _start_metrics_server(self):
+        if not global_config.metrics_port or self.metrics_server is not None:
+            return
+        metrics.EVENT_QUEUE_DEPTH.set_function(lambda: self._queue_stats(len))
+        metrics.EVENT_QUEUE_LAG.set_function(lambda: self._queue_stats(lambda q: q.oldest_age()))
+        self.metrics_server = metrics.start_http_server(global_config.metrics_bind, global_config.metrics_port)
+
+    def run_full_task(self, reason: str = "manual"):
+        """带重叠保护的全量任务入口：同一时间只运行一个全量任务，运行期间的其他触发按 overlap_policy
+        跳过，或排队（多次触发合并为一次）在当前任务结束后立即执行。"""
+        with self._task_state:
+            if self._task_running:
+                if global_config.overlap_policy == "queue":
+                    self._queued_reason = f"{self._queued_reason}+{reason}" if self._queued_reason else reason
+                    logger.warning(f"已有全量任务在运行，本次触发（{reason}）已排队，将在当前任务结束后执行")
+                else:
+                    logger.warning(f"已有全量任务在运行，跳过本次触发（{reason}）")
+                return
+            self._task_running = True
+        # 任务期间实时事件只入队缓冲，等全量任务结束后再执行
+        self._pause_realtime()
+        try:
+            while reason:
+                logger.info(f"全量任务触发原因：{reason}")
+                # 等待进行中的实时批处理完成
+                with self.dest_lock:
+                    self._run_full_task()
+                with self._task_state:
+                    reason, self._queued_reason = self._queued_reason, None
+        finally:
+            with self._task_state:
+                self._task_running = False
+            self._resume_realtime()
+
+    def _pause_realtime(self):
+        for handler in list(self.handlers):
+            handler.queue.pause()
+
+    def _resume_realtime(self):
+        buffered = sum(handler.queue.resume() for handler in list(self.handlers))
+        if buffered:
+            logger.info(f"开始执行全量任务期间缓冲的 {buffered} 个实时操作（同一路径以事件反映的最新状态为准）")
+
+    def _process_all(self, engine: ScanEngine):
+        """各监控配置的文件处理并行执行（各自内部再按挂载点并行），一个挂载熔断不会拖住其他配置。"""
+        if len(self.processors) == 1:
+            self.processors[0].process_all_source_dirs(engine)
+            return
+        with ThreadPoolExecutor(max_workers=len(self.processors), thread_name_prefix="ystrm-conf") as pool:
+            for future in [pool.submit(p.process_all_source_dirs, engine) for p in self.processors]:
+                future.result()
 
     def _run_full_task(self):
         if not self._check_sources_health(): return
         
         logger.info("=" * 60 + "\n【任务触发】开始全量处理+同步清理\n" + "=" * 60)
         
-        for p in self.processors:
-            p.process_all_source_dirs()
-            
-        if not self._check_sources_health():
-            logger.critical("【安全中止】清理操作前检测到源目录丢失！已中止所有清理操作。")
-            return
-            
-        for c in self.cleaners:
-            c.run_full_cleanup()
-            
+        # 本轮任务共用一个扫描引擎：每个不同的源/目标根目录只列一次，快照在处理与清理阶段之间共享
+        engine = ScanEngine()
+        orphans = [None] * len(self.cleaners)
+        with metrics.timed("full_task"):
+            with metrics.timed("process_all_source_dirs"):
+                if global_config.full_task_processes and global_config.full_generate:
+                    # 多进程模式：子进程返回各分片的检查结果，清理阶段不再遍历
+                    orphans = run_sharded(self.processors, self.cleaners, global_config.full_task_processes)
+                else:
+                    self._process_all(engine)
+
+            if not self._check_sources_health():
+                logger.critical("【安全中止】清理操作前检测到源目录丢失！已中止所有清理操作。")
+                return
+
+            for c, o in zip(self.cleaners, orphans):
+                c.run_full_cleanup(engine, o)
+        metrics.LAST_FULL_TASK.set(time.time())
+
         logger.info("=" * 60 + "\n【任务结束】全量处理+同步清理完成\n" + "=" * 60)
 
-    def _setup_cron_job(self):
-        if not global_config.cron_enable:
-            logger.warning("定时任务未启用，跳过Cron设置")
+    def _start_scheduler(self):
+        """启动进程内调度线程（Cron 定时与手动触发共用），并注册 SIGUSR1 为立即执行一次全量任务。
+        例：docker kill -s USR1 <容器名>。启用状态索引时全量任务只处理变化的部分。"""
+        if self.scheduler is not None:
             return
-        try:
-            cron = CronTab(user='root')
-            cron.remove_all(comment="YSTRM Full Task")
-            cmd = f"/usr/local/bin/python /app/cron_task.py >> /proc/1/fd/1 2>&1"
-            job = cron.new(command=cmd, comment="YSTRM Full Task")
-            job.setall(global_config.cron_expression)
-            cron.write()
-            logger.info("="*50 + f"\n定时任务已成功设置到系统Cron表\n  - Cron表达式: {global_config.cron_expression}\n" + "="*50)
-        except Exception as e:
-            logger.error(f"设置定时任务失败：{str(e)}", exc_info=True)
-            raise
+        schedule = None
+        if global_config.cron_enable:
+            try:
+                schedule = CronSchedule(global_config.cron_expression)
+            except ValueError as e:
+                # 调度线程还要响应启动任务、SIGUSR1 和挂载恢复等手动触发，表达式有误时只停用定时执行
+                logger.error(f"Cron 表达式无效，定时执行已停用，仅响应手动触发（SIGUSR1）：{str(e)}")
+        else:
+            logger.warning("定时任务未启用，仅响应手动触发（SIGUSR1）")
+        self.scheduler = TaskScheduler(self.run_full_task, schedule)
+        self.scheduler.start()
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.scheduler.trigger("signal"))
+
+    def _poll_params(self, conf: dict):
+        """监控配置的轮询参数，用于 observer: polling，以及 inotify 预算不足时转为轮询的子目录。"""
+        return (float(conf.get("poll_interval_seconds", 5)), float(conf.get("poll_hot_seconds", 300)),
+                int(conf.get("poll_cold_cycles", 12)))
 
-    def _start_real_time_monitor(self) -> List[Observer]:
+    def _add_handler(self, i: int, p: FileProcessor, c: SyncCleaner,
+                     manager: ObserverManager) -> Optional[RealTimeHandler]:
+        """为一个监控配置创建实时处理器并登记其存在的源目录，没有可监控的目录时返回 None。"""
+        conf = p.monitor_conf
+        mode = conf.get("observer", INOTIFY)
+        handler = RealTimeHandler(p, c, self.dest_lock)
+        added = False
+        for s_dir in p.source_dirs:
+            if os.path.exists(s_dir):
+                manager.add(handler, s_dir, mode, self._poll_params(conf))
+                added = True
+                logger.info(f"  - 监控[{i}]已添加目录: {s_dir}（{mode}）")
+            else:
+                logger.warning(f"  - 监控[{i}]目录不存在，跳过: {s_dir}")
+        if added:
+            return handler
+        handler.stop()
+        return None
+
+    def _start_real_time_monitor(self) -> List[ObserverManager]:
         if not global_config.real_time_monitor:
             logger.info("实时监控已禁用，不启动")
             return []
             
         logger.info("=" * 60 + "\n【实时监控启动】开始监听源目录变化")
-        observers = []
+        # 所有监控配置共用一个观察者管理器：重复/重叠的目录只监控一次，事件分发给每个包含该路径的处理器
+        manager = ObserverManager(global_config.inotify_watch_budget, global_config.scan_workers)
         for i, (p, c) in enumerate(zip(self.processors, self.cleaners)):
-            handler = RealTimeHandler(p, c)
-            observer = Observer()
-            for s_dir in p.source_dirs:
-                if os.path.exists(s_dir):
-                    observer.schedule(handler, path=s_dir, recursive=True)
-                    logger.info(f"  - 监控[{i}]已添加目录: {s_dir}")
-                else:
-                    logger.warning(f"  - 监控[{i}]目录不存在，跳过: {s_dir}")
-            if observer.emitters:
-                observer.start()
-                observers.append(observer)
-                logger.info(f"  - 监控[{i}]线程已启动")
-        logger.info("【实时监控就绪】所有监听线程启动完成\n" + "=" * 60)
-        return observers
+            handler = self._add_handler(i, p, c, manager)
+            if handler is not None:
+                self.handlers.append(handler)
+        if not self.handlers:
+            logger.info("【实时监控就绪】没有可监控的目录\n" + "=" * 60)
+            return []
+        manager.start()
+        self._manager = manager
+        logger.info(f"【实时监控就绪】共 {manager.watch_count} 个物理监控\n" + "=" * 60)
+        return [manager]
+
+    def _stop_real_time_monitor(self, observers: List[ObserverManager], drain: bool = False):
+        """停止监听线程及其事件队列。drain=True 时先执行完队列中已合并的操作（正常关闭），
+        挂载丢失时则直接丢弃，避免在源目录不可用时做删除操作。"""
+        self._manager = None
+        for observer in observers:
+            if observer.is_alive():
+                observer.stop()
+                observer.join()
+        if drain and self._task_running:
+            # 全量任务进行中，执行队列需要等它结束；直接丢弃，交给进行中的全量任务补齐
+            logger.warning("全量任务仍在运行，跳过执行实时队列中的剩余操作")
+            drain = False
+        for handler in self.handlers:
+            handler.stop(drain)
+        self.handlers = []
+
+    # ---------- 配置热加载 ----------
+    def reload_config(self):
+        """重新加载配置文件：全局参数原地生效，只重建新增/删除/改动过的监控配置，新增的源目录单独扫描一次。
+        新配置有误时保留当前配置。"""
+        old = global_config.reload()
+        if old is None:
+            return
+        logger.info("=" * 60 + "\n【配置热加载】检测到配置文件变化，开始应用")
+        self._apply_tunables(old)
+        self._confs_pending = True
+        self._apply_monitor_confs()
+        logger.info("【配置热加载】完成\n" + "=" * 60)
+
+    def _apply_tunables(self, old: dict):
+        """不涉及监控配置的参数：就地更新已创建的限速器、熔断器、探测器、实时队列与定时任务。"""
+        set_progress_interval(global_config.log_progress_interval)
+        configure_limiters()
+        configure_breakers()
+        probe = get_probe()
+        probe.timeout = global_config.probe_timeout
+        probe.slow_threshold = global_config.probe_slow_threshold
+        for handler in list(self.handlers):
+            handler.queue.quiet_period = global_config.real_time_debounce_seconds
+        new = global_config.config
+        old_cron, new_cron = old.get("cron_full_process", {}), new.get("cron_full_process", {})
+        if self.scheduler is not None and (old_cron.get("enable"), old_cron.get("cron_expression")) != \
+                (new_cron.get("enable"), new_cron.get("cron_expression")):
+            try:
+                self.scheduler.reschedule(CronSchedule(global_config.cron_expression)
+                                          if global_config.cron_enable else None)
+            except ValueError as e:
+                logger.error(f"新的 Cron 表达式无效，定时任务保持不变：{str(e)}")
+        restart = [key for key in _RESTART_KEYS if old.get(key) != new.get(key)]
+        restart += [key for key in _RESTART_TASK_KEYS if old_cron.get(key) != new_cron.get(key)]
+        if restart:
+            logger.warning(f"以下配置项需要重启服务才能生效：{', '.join(restart)}")
+
+    def _apply_monitor_confs(self):
+        """按内容比对新旧监控配置：未变化的保留原处理器与实时监控，删除/改动的停止，新增/改动的重新创建。
+        全量任务运行中时暂不应用（它正在使用当前的处理器），由主循环在任务结束后重试。"""
+        if self._task_running:
+            logger.info("全量任务正在运行，监控配置的变化将在任务结束后应用")
+            return
+        current = {}
+        for p, c in zip(self.processors, self.cleaners):
+            current.setdefault(_conf_key(p.monitor_conf), []).append((p, c))
+        kept: List[Tuple[FileProcessor, SyncCleaner]] = []
+        created: List[int] = []
+        processors: List[FileProcessor] = []
+        cleaners: List[SyncCleaner] = []
+        for i, conf in enumerate(global_config.monitor_confs):
+            same = current.get(_conf_key(conf))
+            if same:
+                p, c = same.pop(0)
+                kept.append((p, c))
+            else:
+                p = FileProcessor(conf)
+                c = SyncCleaner(conf, p.path_filter)
+                created.append(i)
+            processors.append(p)
+            cleaners.append(c)
+        removed = [p for pairs in current.values() for p, _ in pairs]
+        if not created and not removed:
+            self._confs_pending = False
+            return
+
+        manager = self._manager
+        handlers: Dict[int, RealTimeHandler] = {}
+        if manager is not None:
+            for i in created:
+                handler = self._add_handler(i, processors[i], cleaners[i], manager)
+                if handler is not None:
+                    handlers[i] = handler
+        # 持有目标目录锁时替换：进行中的实时批处理先完成，之后开始的全量任务使用新的处理器
+        while not self.dest_lock.acquire(timeout=1.0):
+            if self._task_running:
+                for handler in handlers.values():
+                    manager.remove(handler)
+                    handler.stop()
+                logger.info("全量任务已开始，监控配置的变化将在任务结束后应用")
+                return
+        try:
+            old_handlers = [h for h in self.handlers if h.processor in removed]
+            self.handlers = [h for h in self.handlers if h not in old_handlers] + list(handlers.values())
+            self.processors, self.cleaners = processors, cleaners
+            self._confs_pending = False
+        finally:
+            self.dest_lock.release()
+        if manager is not None:
+            for handler in old_handlers:
+                manager.remove(handler)
+            manager.refresh()
+        for handler in old_handlers:
+            handler.stop(drain=not self._task_running)
+        logger.info(f"监控配置：保留 {len(kept)} 个，新建 {len(created)} 个，停止 {len(removed)} 个"
+                    + (f"，当前共 {manager.watch_count} 个物理监控" if manager is not None else ""))
+
+        # 只扫描新增的源目录；改动过的配置（按目标目录与媒体库目录对应）其余规则变化留给下次全量任务
+        scans = []
+        for i in created:
+            p = processors[i]
+            previous = next((r for r in removed if (r.dest_dir, r.library_dir) == (p.dest_dir, p.library_dir)), None)
+            added = [d for d in p.source_dirs if previous is None or d not in previous.source_dirs]
+            if previous is not None:
+                logger.info(f"监控[{i}]已改动：{p.dest_dir}，过滤等规则的变化将在下次全量任务中应用到已有文件")
+            if added:
+                scans.append((p, added))
+        if scans:
+            threading.Thread(target=self._scan_added_dirs, args=(scans,), name="ystrm-reload-scan",
+                             daemon=True).start()
+
+    def _scan_added_dirs(self, scans: List[Tuple[FileProcessor, List[str]]]):
+        for processor, source_dirs in scans:
+            try:
+                with self.dest_lock:
+                    processor.process_added_dirs(source_dirs)
+            except Exception as e:
+                logger.error(f"新增源目录处理失败，留待下次全量任务：{source_dirs} - {str(e)}", exc_info=True)
+
+    def _config_stamp(self):
+        try:
+            st = os.stat(global_config.config_path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+
+    @staticmethod
+    def _on_sigterm(signum, frame):
+        # docker stop 发送 SIGTERM：容器内 python 是 1 号进程，不处理就会被忽略、最后被 SIGKILL 强杀。
+        # 按 Ctrl+C 的流程关闭（执行完实时队列、写出变更记录）；只响应第一次，不打断关闭过程
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        raise KeyboardInterrupt
 
     def start(self):
         logger.info("=" * 60 + "\nYSTRM 服务启动中...\n" + "=" * 60)
-        self._setup_cron_job()
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        self._start_metrics_server()
+        self._start_scheduler()
         
+        # 先启动实时监控再开始启动时的全量任务：任务在调度线程中后台执行，期间的实时事件被缓冲，
+        # 任务结束后再执行，服务启动后立即就能感知变化
         observers = self._start_real_time_monitor()
         monitoring_active = True if observers else False
+        if global_config.run_full_task_on_startup:
+            logger.info("检测到 'run_full_task_on_startup: True'，在后台执行启动时的全量任务...")
+            self.scheduler.trigger("startup")
+        else:
+            logger.info("检测到 'run_full_task_on_startup: False'，跳过启动时的全量任务。")
         
+        # 配置文件被修改（按修改时间/大小/inode 定期检查）或收到 SIGHUP 时重新加载配置
+        # 例：docker kill -s HUP <容器名>
+        signal.signal(signal.SIGHUP, lambda signum, frame: self._reload_requested.set())
+        stamp = self._config_stamp()
+        next_check = time.monotonic()
         try:
             while True:
-                interval = global_config.health_check_interval
-                if interval > 0 and global_config.real_time_monitor:
-                    is_healthy = self._check_sources_health()
-                    
-                    if is_healthy and not monitoring_active:
-                        logger.info("检测到源目录已恢复，重启实时监控并执行全量同步...")
-                        observers = self._start_real_time_monitor()
-                        self._run_full_task()
-                        monitoring_active = True
-                        
-                    elif not is_healthy and monitoring_active:
-                        logger.critical("【心跳检测】发现源目录挂载丢失！正在暂停实时监控...")
-                        for observer in observers:
-                            observer.stop()
-                            observer.join()
-                        observers = []
-                        monitoring_active = False
-                
-                time.sleep(interval if interval > 0 else 3600)
+                if time.monotonic() >= next_check:
+                    interval = global_config.health_check_interval
+                    next_check = time.monotonic() + (interval if interval > 0 else 3600)
+                    if interval > 0 and global_config.real_time_monitor:
+                        is_healthy = self._check_sources_health()
+
+                        if is_healthy and not monitoring_active:
+                            logger.info("检测到源目录已恢复，重启实时监控并在后台执行全量同步...")
+                            observers = self._start_real_time_monitor()
+                            # 与启动时一样交给调度线程执行：耗时的全量任务不能卡住心跳检测与配置热加载
+                            self.scheduler.trigger("mount_recovered")
+                            monitoring_active = True
+
+                        elif not is_healthy and monitoring_active:
+                            logger.critical("【心跳检测】发现源目录挂载丢失！正在暂停实时监控...")
+                            self._stop_real_time_monitor(observers)
+                            observers = []
+                            monitoring_active = False
+
+                timeout = next_check - time.monotonic()
+                if global_config.config_reload_interval:
+                    timeout = min(timeout, global_config.config_reload_interval)
+                if self._confs_pending:
+                    timeout = min(timeout, 5.0)
+                requested = self._reload_requested.wait(max(0.0, timeout))
+                self._reload_requested.clear()
+                current = self._config_stamp()
+                if requested or (global_config.config_reload_interval and current != stamp):
+                    stamp = current
+                    self.reload_config()
+                elif self._confs_pending:
+                    self._apply_monitor_confs()
 
         except KeyboardInterrupt:
             logger.info("收到停止信号，服务正在关闭...")
         finally:
-            for observer in observers:
-                if observer.is_alive():
-                    observer.stop()
-                    observer.join()
+            if self.scheduler is not None:
+                self.scheduler.stop()
+            self._stop_real_time_monitor(observers, drain=True)
             logger.info("所有实时监控线程已停止")
-            
-            try:
-                cron = CronTab(user='root')
-                cron.remove_all(comment="YSTRM Full Task")
-                cron.write()
-                logger.info("已清理系统Cron表中的定时任务")
-            except Exception as e:
-                logger.error(f"清理Cron任务失败：{str(e)}", exc_info=True)
+            close_change_feed()
             logger.info("YSTRM 服务已关闭")
 
 if __name__ == "__main__":
     try:
         app = YSTRM()
-        if global_config.run_full_task_on_startup:
-            logger.info("检测到 'run_full_task_on_startup: True'，服务启动时执行一次全量任务...")
-            app._run_full_task()
-        else:
-            logger.info("检测到 'run_full_task_on_startup: False'，跳过启动时的全量任务。")
         app.start()
     except Exception as e:
         logger.critical(f"服务启动失败：{str(e)}", exc_info=True)
@@ -0,0 +1,75 @@
+"""同步清理回归测试：源文件仍在但改为被过滤时，各清理路径（目录遍历/状态索引/多进程分片检查）都要删除旧的目标文件。
+
+global_config 在导入时按 YSTRM_CONFIG 读取，每次全量任务都在子进程中运行。
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_RUN_FULL_TASK = "import main; main.YSTRM()._run_full_task()"
+
+
+def _run_full_task(root: str, library: str, dest: str, state_index: bool, processes: int, **monitor_conf):
+    config = {"sync": {
+        "run_full_task_on_startup": False,
+        "real_time_monitor": False,
+        "cron_full_process": {
+            "enable": False,
+            "cron_expression": "0 4 * * *",
+            "sync_source_dest": True,
+            "cleanup_empty_dirs": True,
+            "preserve_extra_metadata": False,
+            "state_index": state_index,
+            "checkpoint_max_age_hours": 0,
+            "full_task_processes": processes,
+        },
+        "monitor_confs": [dict({
+            "source_dir": [os.path.join(library, "TV")],
+            "library_dir": library,
+            "dest_dir": dest,
+            "video_extensions": [".mkv"],
+            "metadata_extensions": [".nfo", ".jpg"],
+        }, **monitor_conf)],
+    }}
+    config_path = os.path.join(root, "config.yaml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+    env = dict(os.environ, YSTRM_CONFIG=config_path, YSTRM_LOG_DIR=os.path.join(root, "logs"))
+    subprocess.run([sys.executable, "-c", _RUN_FULL_TASK], cwd=REPO_ROOT, env=env, check=True,
+                   capture_output=True, timeout=120)
+
+
+def _dest_files(dest: str):
+    return sorted(os.path.relpath(os.path.join(root, name), dest)
+                  for root, _, files in os.walk(dest) for name in files)
+
+
+@pytest.mark.parametrize("state_index, processes", [(False, 1), (True, 1), (False, 2)],
+                         ids=["traversal", "state_index", "sharded"])
+def test_newly_filtered_sources_are_cleaned(tmp_path, state_index, processes):
+    library, dest = str(tmp_path / "media"), str(tmp_path / "strm")
+    for rel in ("TV/Show/E01.mkv", "TV/Show/E01.nfo", "TV/Show/sample.mkv", "TV/Show/@eaDir/x.jpg"):
+        path = os.path.join(library, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("x")
+
+    # 第二次运行时索引已建立基线，之后才会走状态索引清理
+    for _ in range(2):
+        _run_full_task(str(tmp_path), library, dest, state_index, processes)
+    assert _dest_files(dest) == ["TV/Show/@eaDir/x.jpg", "TV/Show/E01.nfo", "TV/Show/E01.strm",
+                                 "TV/Show/sample.strm"]
+
+    _run_full_task(str(tmp_path), library, dest, state_index, processes, exclude=["@eaDir", "sample.*"])
+    assert _dest_files(dest) == ["TV/Show/E01.nfo", "TV/Show/E01.strm"]
+    assert not os.path.exists(os.path.join(dest, "TV/Show/@eaDir"))
+
+    # 去掉后缀同样视为源文件不再处理
+    _run_full_task(str(tmp_path), library, dest, state_index, processes,
+                   exclude=["@eaDir", "sample.*"], metadata_extensions=[".jpg"])
+    assert _dest_files(dest) == ["TV/Show/E01.strm"]